@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Article queries for the social media bots.
+Builds PostgREST queries that pick the next article not yet posted to a
+platform server-side (using the partial indexes in scripts/setup-database.sql)
+and project only the columns that platform's generator reads.
+"""
+
+import asyncio
+import http_transport
+import async_transport
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+from supabase_capabilities import get_capabilities, has_column
+
+logger = logging.getLogger(__name__)
+
+# Column recording when an article was posted to each platform
+POSTED_COLUMNS = {
+    'twitter': 'tweeted_at',
+    'linkedin': 'posted_to_linkedin_at',
+    'facebook': 'posted_to_facebook_at',
+    'reddit': 'posted_to_reddit_at'
+}
+
+# Columns each bot reads. content_excerpt is a computed column returning the
+# first 500 characters of content, which is all the generators ever use; it is
+# swapped for content when the database does not have it. ai_summary and
+# seo_description are the short sources prompt_builder prefers, and social_copy
+# holds copy generated at ingestion time (supabase/migrations/006). tags feed
+# the template fallback's hashtags.
+PLATFORM_COLUMNS = {
+    'twitter': ['id', 'title', 'ai_summary', 'seo_description', 'summary', 'content_excerpt', 'affiliate_url',
+                'tags', 'social_copy'],
+    'linkedin': ['id', 'title', 'ai_summary', 'seo_description', 'summary', 'content_excerpt', 'affiliate_url',
+                 'tags', 'social_copy'],
+    'facebook': ['id', 'title', 'ai_summary', 'seo_description', 'summary', 'content_excerpt', 'affiliate_url',
+                 'tags', 'social_copy'],
+    'reddit': ['id', 'title', 'ai_summary', 'seo_description', 'summary', 'affiliate_url', 'url', 'category', 'source',
+               'tags', 'social_copy']
+}
+
+# Unposted articles fetched when the newest ones may be blocked by the outbox
+NEXT_ARTICLE_CANDIDATES = 10
+
+# Selected columns that are simply left out when the database lacks them
+OPTIONAL_COLUMNS = ['ai_summary', 'seo_description', 'social_copy']
+
+def _columns_for(platforms: Iterable[str]) -> List[str]:
+    columns: List[str] = []
+    for platform in platforms:
+        for column in PLATFORM_COLUMNS[platform]:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+def build_next_unposted_query(platform: str, limit: int = 1) -> Dict[str, str]:
+    """Return PostgREST params for the newest articles not yet posted to a platform."""
+    return {
+        'select': ','.join(PLATFORM_COLUMNS[platform]),
+        POSTED_COLUMNS[platform]: 'is.null',
+        # Matches the idx_articles_unposted_* partial indexes
+        'order': 'published_at.desc.nullslast,id.desc',
+        'limit': str(limit)
+    }
+
+def build_unposted_page_query(platform: str, limit: int,
+                              after: Optional[Tuple[str, str]] = None) -> Dict[str, str]:
+    """Return PostgREST params for a page of unposted articles, newest first.
+
+    Pages are keyed on (published_at, id) so each page starts right after the
+    last row of the previous one, however deep the backlog is. Articles
+    without published_at sort last and are paged through by id.
+    """
+    params = build_next_unposted_query(platform, limit)
+    params['select'] += ',published_at'
+    if after:
+        published_at, article_id = after
+        if published_at is None:
+            params['published_at'] = 'is.null'
+            params['id'] = f'lt.{article_id}'
+        else:
+            params['or'] = (f'(published_at.lt."{published_at}",'
+                            f'and(published_at.eq."{published_at}",id.lt.{article_id}),'
+                            f'published_at.is.null)')
+    return params
+
+def build_candidates_query(platforms: Iterable[str], limit: int) -> Dict[str, str]:
+    """Return PostgREST params for the newest articles unposted on any platform.
+
+    The posted columns are included so callers can pick a candidate per
+    platform in memory.
+    """
+    platforms = list(platforms)
+    columns = _columns_for(platforms) + [POSTED_COLUMNS[platform] for platform in platforms]
+    return {
+        'select': ','.join(columns),
+        'or': '(' + ','.join(f"{POSTED_COLUMNS[platform]}.is.null" for platform in platforms) + ')',
+        'order': 'published_at.desc',
+        'limit': str(limit)
+    }
+
+def _adapt_to_capabilities(params: Dict[str, str], capabilities: Dict) -> Dict[str, str]:
+    """Rewrite a query so it only uses columns the database actually has."""
+    adapted = dict(params)
+
+    columns = params['select'].split(',')
+    if not has_column(capabilities, 'content_excerpt'):
+        columns = ['content' if column == 'content_excerpt' else column for column in columns]
+    columns = [column for column in columns
+               if column not in OPTIONAL_COLUMNS or has_column(capabilities, column)]
+
+    missing = [column for column in POSTED_COLUMNS.values() if not has_column(capabilities, column)]
+    if missing:
+        # Without a posted column the platform cannot be filtered; fall back to newest first
+        columns = [column for column in columns if column not in missing]
+        for column in missing:
+            adapted.pop(column, None)
+        if 'or' in adapted:
+            filters = [f for f in adapted['or'][1:-1].split(',') if f.split('.')[0] not in missing]
+            if filters:
+                adapted['or'] = '(' + ','.join(filters) + ')'
+            else:
+                del adapted['or']
+
+    adapted['select'] = ','.join(columns)
+    return adapted
+
+def normalize_article(article: Dict) -> Dict:
+    """Expose content_excerpt under the content key the generators read."""
+    if 'content_excerpt' in article:
+        article['content'] = article.pop('content_excerpt')
+    return article
+
+def fetch_articles(supabase_url: str, headers: Dict[str, str],
+                   params: Dict[str, str]) -> Optional[List[Dict]]:
+    """Run an articles query adapted to the probed database capabilities.
+
+    Returns None when the query fails, so callers can tell an error from an
+    empty result.
+    """
+    capabilities = get_capabilities(supabase_url, headers)
+    response = http_transport.get(f"{supabase_url}/rest/v1/articles", headers=headers,
+                                  params=_adapt_to_capabilities(params, capabilities))
+
+    if response.status_code == 400:
+        # The schema changed since the cached probe; re-probe and retry once
+        logger.warning("Article query rejected; refreshing Supabase capabilities")
+        capabilities = get_capabilities(supabase_url, headers, refresh=True)
+        response = http_transport.get(f"{supabase_url}/rest/v1/articles", headers=headers,
+                                      params=_adapt_to_capabilities(params, capabilities))
+
+    if response.status_code != 200:
+        logger.error(f"Article query failed: {response.status_code} - {response.text}")
+        return None
+
+    return [normalize_article(article) for article in response.json()]
+
+async def fetch_articles_async(supabase_url: str, headers: Dict[str, str],
+                               params: Dict[str, str]) -> Optional[List[Dict]]:
+    """Async variant of fetch_articles."""
+    # The capability probe is cached on disk, so this rarely touches the network
+    capabilities = await asyncio.to_thread(get_capabilities, supabase_url, headers)
+    response = await async_transport.get(f"{supabase_url}/rest/v1/articles", headers=headers,
+                                         params=_adapt_to_capabilities(params, capabilities))
+
+    if response.status_code == 400:
+        logger.warning("Article query rejected; refreshing Supabase capabilities")
+        capabilities = await asyncio.to_thread(get_capabilities, supabase_url, headers, True)
+        response = await async_transport.get(f"{supabase_url}/rest/v1/articles", headers=headers,
+                                             params=_adapt_to_capabilities(params, capabilities))
+
+    if response.status_code != 200:
+        logger.error(f"Article query failed: {response.status_code} - {response.text}")
+        return None
+
+    return [normalize_article(article) for article in response.json()]
+
+def _first_accepted(articles: Optional[List[Dict]], accept: Optional[Callable[[Dict], bool]]) -> Optional[Dict]:
+    return next((article for article in articles or [] if accept is None or accept(article)), None)
+
+def fetch_next_unposted(supabase_url: str, headers: Dict[str, str], platform: str,
+                        accept: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+    """Return the newest article not yet posted to the platform, if any.
+
+    accept filters the candidates, e.g. on the outbox, so an article awaiting
+    a retry does not hold back the older ones behind it.
+    """
+    limit = NEXT_ARTICLE_CANDIDATES if accept else 1
+    articles = fetch_articles(supabase_url, headers, build_next_unposted_query(platform, limit))
+    return _first_accepted(articles, accept)
+
+async def fetch_next_unposted_async(supabase_url: str, headers: Dict[str, str], platform: str,
+                                    accept: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+    """Async variant of fetch_next_unposted."""
+    limit = NEXT_ARTICLE_CANDIDATES if accept else 1
+    articles = await fetch_articles_async(supabase_url, headers, build_next_unposted_query(platform, limit))
+    return _first_accepted(articles, accept)
+
+def fetch_unposted_batch(supabase_url: str, headers: Dict[str, str], platform: str,
+                         count: int, page_size: int = 100) -> Optional[List[Dict]]:
+    """Return up to count articles not yet posted to the platform, newest first."""
+    articles: List[Dict] = []
+    after = None
+    while len(articles) < count:
+        limit = min(page_size, count - len(articles))
+        page = fetch_articles(supabase_url, headers, build_unposted_page_query(platform, limit, after))
+        if page is None:
+            return articles or None
+        articles.extend(page)
+
+        if len(page) < limit:
+            break
+        after = (page[-1].get('published_at'), page[-1]['id'])
+    return articles
+
+async def fetch_unposted_batch_async(supabase_url: str, headers: Dict[str, str], platform: str,
+                                     count: int, page_size: int = 100) -> Optional[List[Dict]]:
+    """Async variant of fetch_unposted_batch."""
+    articles: List[Dict] = []
+    after = None
+    while len(articles) < count:
+        limit = min(page_size, count - len(articles))
+        page = await fetch_articles_async(supabase_url, headers, build_unposted_page_query(platform, limit, after))
+        if page is None:
+            return articles or None
+        articles.extend(page)
+
+        if len(page) < limit:
+            break
+        after = (page[-1].get('published_at'), page[-1]['id'])
+    return articles
+
+def pick_per_platform(articles: List[Dict], platforms: Iterable[str]) -> Dict[str, Dict]:
+    """Pick the newest candidate for each platform that it has not been posted to."""
+    picks = {}
+    for platform in platforms:
+        for article in articles:
+            if not article.get(POSTED_COLUMNS[platform]):
+                picks[platform] = article
+                break
+    return picks
+
+def _mark_posted_request(platform: str, article_ids: List[str]) -> Dict:
+    return {
+        'json': {POSTED_COLUMNS[platform]: datetime.utcnow().isoformat()},
+        'params': {'id': f"in.({','.join(article_ids)})"}
+    }
+
+def _log_marked(response, platform: str, article_ids: List[str]) -> bool:
+    if response.status_code in (200, 204):
+        logger.info(f"Marked {len(article_ids)} article(s) as posted to {platform}")
+        return True
+
+    logger.error(f"Failed to mark articles as posted to {platform}: {response.status_code}")
+    return False
+
+def mark_articles_posted(supabase_url: str, headers: Dict[str, str], platform: str,
+                         article_ids: Iterable[str]) -> bool:
+    """Mark many articles as posted to a platform with a single PATCH."""
+    article_ids = sorted(set(str(article_id) for article_id in article_ids))
+    if not article_ids:
+        return True
+
+    response = http_transport.patch(f"{supabase_url}/rest/v1/articles", headers=headers,
+                                    **_mark_posted_request(platform, article_ids))
+    return _log_marked(response, platform, article_ids)
+
+async def mark_articles_posted_async(supabase_url: str, headers: Dict[str, str], platform: str,
+                                     article_ids: Iterable[str]) -> bool:
+    """Async variant of mark_articles_posted."""
+    article_ids = sorted(set(str(article_id) for article_id in article_ids))
+    if not article_ids:
+        return True
+
+    response = await async_transport.patch(f"{supabase_url}/rest/v1/articles", headers=headers,
+                                           **_mark_posted_request(platform, article_ids))
+    return _log_marked(response, platform, article_ids)
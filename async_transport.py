@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Asyncio HTTP transport for the social media bots.
+The aiohttp counterpart of http_transport: one pooled ClientSession per event
+loop, the same default timeouts and the same retry_policy decisions. Bodies
+are read in full and returned as requests.Response objects, so the async
+clients share status-code handling, rate-limit parsing and outbox error
+classification with the blocking ones.
+"""
+
+import os
+import asyncio
+import requests
+from requests.structures import CaseInsensitiveDict
+from typing import Any, Awaitable, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+import logging
+from retry_policy import RetryPolicy, error_retry_wait, response_retry_wait, run_deadline
+from http_transport import default_timeout
+from run_budget import cap_timeout, current_deadline
+from circuit_breaker import CircuitOpenError, circuit_key, get_circuit_breaker
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+_sessions: Dict[asyncio.AbstractEventLoop, 'aiohttp.ClientSession'] = {}
+_semaphores: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Semaphore] = {}
+
+def get_session() -> 'aiohttp.ClientSession':
+    """Return the running event loop's shared session."""
+    if aiohttp is None:
+        raise RuntimeError("aiohttp is required for the async bots: pip install aiohttp")
+
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=int(os.getenv('ASYNC_HTTP_LIMIT', '100')),
+            limit_per_host=int(os.getenv('HTTP_POOL_MAXSIZE', '16'))
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        _sessions[loop] = session
+    return session
+
+async def close() -> None:
+    """Close the running event loop's session; call before the loop ends."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+def run(coroutine: Awaitable[Any]) -> Any:
+    """Run a coroutine on a new event loop, closing the loop's session afterwards."""
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await close()
+    return asyncio.run(main())
+
+def semaphore(name: str, size: int) -> asyncio.Semaphore:
+    """Return a named semaphore shared by the running event loop's tasks."""
+    key = (asyncio.get_running_loop(), name)
+    if key not in _semaphores:
+        _semaphores[key] = asyncio.Semaphore(size)
+    return _semaphores[key]
+
+def _client_timeout(timeout: Optional[Union[float, Tuple[float, float]]]) -> 'aiohttp.ClientTimeout':
+    timeout = cap_timeout(timeout or default_timeout())
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    # Inside a run the whole request, not just each read, must fit the budget
+    run = current_deadline()
+    return aiohttp.ClientTimeout(total=run.remaining() if run else None, sock_connect=connect, sock_read=read)
+
+def _to_requests_error(error: Exception) -> Exception:
+    """Map an aiohttp failure onto the requests exception it corresponds to."""
+    if isinstance(error, (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError)):
+        return requests.exceptions.ConnectTimeout(str(error))
+    if isinstance(error, (asyncio.TimeoutError, aiohttp.SocketTimeoutError)):
+        return requests.exceptions.ReadTimeout(str(error))
+    return requests.exceptions.ConnectionError(str(error))
+
+def _to_response(url: str, status: int, headers, body: bytes, encoding: Optional[str]) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = body
+    response.encoding = encoding
+    response.url = url
+    return response
+
+async def request(method: str, url: str,
+                  timeout: Optional[Union[float, Tuple[float, float]]] = None,
+                  idempotent: Optional[bool] = None, retry: Optional[RetryPolicy] = None,
+                  deadline: Optional[float] = None, **kwargs) -> requests.Response:
+    """Send a request over the loop's pooled session; see http_transport.request.
+
+    Accepts the requests keywords the bots use: headers, params, json, data
+    and an (user, password) auth tuple.
+    """
+    if idempotent is None:
+        idempotent = method.upper() != 'POST'
+    if retry is None:
+        retry = RetryPolicy(retry_server_errors=idempotent)
+    deadline = deadline if deadline is not None else run_deadline()
+
+    if isinstance(kwargs.get('auth'), tuple):
+        kwargs['auth'] = aiohttp.BasicAuth(*kwargs['auth'])
+    circuit = circuit_key(url)
+    breaker = get_circuit_breaker()
+    if not breaker.allow(circuit):
+        raise CircuitOpenError(f"circuit open for {circuit}; not sending {method.upper()}")
+
+    try:
+        response = await _send_with_retry(method, url, timeout, retry, deadline, kwargs)
+    except requests.exceptions.RequestException as e:
+        breaker.record(circuit, error=e)
+        raise
+    breaker.record(circuit, response=response)
+    return response
+
+async def _send_with_retry(method: str, url: str, timeout: Optional[Union[float, Tuple[float, float]]],
+                           retry: RetryPolicy, deadline: Optional[float], kwargs: Dict) -> requests.Response:
+    session = get_session()
+    parts = urlsplit(url)
+    description = f"{method.upper()} {parts.scheme}://{parts.netloc}"
+
+    attempt = 0
+    while True:
+        try:
+            async with session.request(method, url, timeout=_client_timeout(timeout), **kwargs) as raw:
+                body = await raw.read()
+                response = _to_response(str(raw.url), raw.status, raw.headers, body, raw.charset)
+        except (aiohttp.ClientError, asyncio.TimeoutError, requests.exceptions.ConnectTimeout) as e:
+            error = e if isinstance(e, requests.exceptions.RequestException) else _to_requests_error(e)
+            if not isinstance(error, requests.exceptions.ReadTimeout):
+                wait = error_retry_wait(error, retry, attempt, deadline, description)
+                if wait is not None:
+                    await asyncio.sleep(wait)
+                    attempt += 1
+                    continue
+            raise error from e
+
+        wait = response_retry_wait(response, retry, attempt, deadline, description)
+        if wait is None:
+            return response
+        await asyncio.sleep(wait)
+        attempt += 1
+
+async def get(url: str, **kwargs) -> requests.Response:
+    """Send a GET request over the shared session."""
+    return await request('GET', url, **kwargs)
+
+async def post(url: str, **kwargs) -> requests.Response:
+    """Send a POST request over the shared session."""
+    return await request('POST', url, **kwargs)
+
+async def patch(url: str, **kwargs) -> requests.Response:
+    """Send a PATCH request over the shared session."""
+    return await request('PATCH', url, **kwargs)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Multi-article batched generation for backlog runs.
+Packs several articles into one chat completion for a platform and reads back
+a JSON list of posts, so the system prompt and instructions are paid for once
+per request instead of once per article. The number of articles per request
+is sized from the model's context window and completion limit, halved when a
+request fails or runs out of tokens, and items missing from a response are
+retried on their own.
+"""
+
+import os
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import logging
+from generation_cache import cache_key, get_generation_cache
+from llm_router import get_llm_router
+from multi_platform_generator import FINISHERS, PLATFORM_INSTRUCTIONS
+from prompt_builder import build_prompt_source, estimate_tokens
+from run_budget import in_context
+
+logger = logging.getLogger(__name__)
+
+PROMPT_VERSION = 1
+
+# (context window, maximum completion tokens) of the models the bots use
+MODEL_LIMITS = {
+    'gpt-3.5-turbo': (16385, 4096),
+    'gpt-4o-mini': (128000, 16384),
+    'gpt-4o': (128000, 16384)
+}
+DEFAULT_MODEL_LIMITS = (8192, 4096)
+
+# Tokens taken by the system prompt and instructions around the articles
+PROMPT_OVERHEAD_TOKENS = 250
+
+# Tokens each post adds to the response for its JSON wrapper
+ITEM_OVERHEAD_TOKENS = 12
+
+SYSTEM_PROMPT = ('You are a social media expert who writes engaging, platform-appropriate posts '
+                 'about tech and business articles. You always answer with valid JSON.')
+
+class BatchGenerator:
+    """Generates one platform's copy for many articles with as few completions as possible."""
+
+    def __init__(self, model: str = 'gpt-3.5-turbo', temperature: float = 0.7):
+        self.router = get_llm_router()
+        self.model = model
+        self.temperature = temperature
+        self.max_articles = int(os.getenv('BATCH_PROMPT_ARTICLES', '10'))
+        self.max_retries = int(os.getenv('BATCH_PROMPT_RETRIES', '1'))
+        self.workers = int(os.getenv('BATCH_GENERATION_WORKERS', '4'))
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_articles > 1
+
+    def articles_per_request(self, plans: List[Dict]) -> int:
+        """Return how many articles fit in one request for the model's limits."""
+        context, max_completion = MODEL_LIMITS.get(self.model, DEFAULT_MODEL_LIMITS)
+        prompt_tokens = max(estimate_tokens(plan['text']) for plan in plans) + ITEM_OVERHEAD_TOKENS
+        completion_tokens = max(plan['max_tokens'] for plan in plans) + ITEM_OVERHEAD_TOKENS
+
+        by_context = (context - PROMPT_OVERHEAD_TOKENS) // (prompt_tokens + completion_tokens)
+        by_completion = max_completion // completion_tokens
+        return max(1, min(self.max_articles, by_context, by_completion))
+
+    def _key(self, article: Dict, platform: str) -> str:
+        return cache_key(article, f"{platform}:batch", PROMPT_VERSION, self.model, self.temperature)
+
+    def _cached(self, articles: List[Dict], platform: str) -> Dict[str, str]:
+        cache = get_generation_cache()
+        if not cache.enabled:
+            return {}
+        found = {}
+        try:
+            for article in articles:
+                copy = cache.get(self._key(article, platform))
+                if copy is not None:
+                    found[article['id']] = copy
+        except sqlite3.Error as e:
+            logger.warning(f"Generation cache unavailable: {e}")
+        return found
+
+    def _store(self, articles: List[Dict], platform: str, posts: Dict[str, str]) -> None:
+        cache = get_generation_cache()
+        if not cache.enabled:
+            return
+        try:
+            for article in articles:
+                if article['id'] in posts:
+                    cache.put(self._key(article, platform), platform, posts[article['id']])
+        except sqlite3.Error as e:
+            logger.warning(f"Could not cache generated {platform} copy: {e}")
+
+    def _request(self, platform: str, articles: List[Dict], plans: List[Dict]) -> Optional[Dict[str, str]]:
+        """Send one batched completion; return finished copy by article id, or None if it failed."""
+        blocks = '\n\n'.join(f"[{index}] {plan['text']}" for index, plan in enumerate(plans, 1))
+        prompt = f"""
+            Write {platform} copy for each of the {len(articles)} numbered articles below.
+            Each post must be {PLATFORM_INSTRUCTIONS[platform]}.
+            Respond with a JSON object {{"posts": [{{"id": <article number>, "text": "<post>"}}, ...]}}
+            containing one entry per article.
+
+            {blocks}
+            """
+
+        response = self.router.chat_completion({
+            'model': self.model,
+            'messages': [
+                {'role': 'system', 'content': SYSTEM_PROMPT},
+                {'role': 'user', 'content': prompt}
+            ],
+            'response_format': {'type': 'json_object'},
+            'max_tokens': sum(plan['max_tokens'] + ITEM_OVERHEAD_TOKENS for plan in plans),
+            'temperature': self.temperature
+        })
+        if response.status_code != 200:
+            logger.error(f"Batched {platform} generation failed: {response.status_code} - {response.text}")
+            return None
+
+        result = response.json()
+        choice = result['choices'][0]
+        if choice.get('finish_reason') == 'length':
+            logger.warning(f"Batched {platform} response for {len(articles)} articles ran out of tokens")
+            return None
+        try:
+            items = json.loads(choice['message']['content']).get('posts')
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Batched {platform} response is not valid JSON: {e}")
+            return None
+        if not isinstance(items, list):
+            logger.error(f"Batched {platform} response has no posts list")
+            return None
+
+        posts = {}
+        for item in items:
+            try:
+                article = articles[int(item['id']) - 1]
+                text = item['text'].strip()
+            except (KeyError, TypeError, ValueError, IndexError, AttributeError):
+                continue
+            if text:
+                posts[article['id']] = FINISHERS[platform](text, article)
+
+        usage = result.get('usage') or {}
+        logger.info(f"📚 Batched {platform} request returned {len(posts)}/{len(articles)} posts "
+                    f"using {usage.get('total_tokens', '?')} tokens")
+        return posts
+
+    def _generate_chunk(self, platform: str, articles: List[Dict], plans: List[Dict]) -> Dict[str, str]:
+        posts: Dict[str, str] = {}
+        pending = list(zip(articles, plans))
+
+        for attempt in range(self.max_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                logger.info(f"🔁 Retrying {len(pending)} {platform} article(s) missing from the batched response")
+
+            chunk_articles = [article for article, _ in pending]
+            try:
+                got = self._request(platform, chunk_articles, [plan for _, plan in pending])
+            except Exception as e:
+                logger.error(f"Error in batched {platform} generation: {e}")
+                break
+            if got is None:
+                if len(pending) == 1:
+                    break
+                # Too much at once for the model; split and shrink later requests too
+                half = len(pending) // 2
+                self.max_articles = max(1, min(self.max_articles, half))
+                for part in (pending[:half], pending[half:]):
+                    posts.update(self._generate_chunk(platform, [a for a, _ in part], [p for _, p in part]))
+                return posts
+
+            posts.update(got)
+            pending = [(article, plan) for article, plan in pending if article['id'] not in posts]
+
+        return posts
+
+    def generate(self, platform: str, articles: List[Dict]) -> Dict[str, str]:
+        """Return finished copy keyed by article id.
+
+        Articles left out (after retries) should fall back to the platform's
+        single-article generator.
+        """
+        posts = self._cached(articles, platform)
+        articles = [article for article in articles if article['id'] not in posts]
+        if not articles:
+            return posts
+
+        plans = [build_prompt_source(article, platform) for article in articles]
+        size = self.articles_per_request(plans)
+        chunks = [(articles[i:i + size], plans[i:i + size]) for i in range(0, len(articles), size)]
+        logger.info(f"📚 Generating {platform} copy for {len(articles)} articles in {len(chunks)} batched request(s)")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(chunks)))) as executor:
+            generate = in_context(lambda chunk: self._generate_chunk(platform, *chunk))
+            for generated in executor.map(generate, chunks):
+                posts.update(generated)
+
+        self._store(articles, platform, posts)
+        return posts
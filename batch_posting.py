@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Batch posting for the social media bots.
+Clears a backlog in one run: fetches up to N unposted articles with keyset
+pagination, generates their copy concurrently, posts each one as soon as its
+copy is ready (paced by posting_scheduler) and marks them all as posted with a
+single bulk PATCH. Copy is first generated several articles per request with
+batch_generator; articles it misses fall back to the bot's own generator.
+run_batch_async does the same for the asyncio bots on a single event loop.
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
+import logging
+from article_queries import (fetch_unposted_batch, fetch_unposted_batch_async, mark_articles_posted,
+                            mark_articles_posted_async)
+from batch_generator import BatchGenerator
+from multi_platform_generator import get_precomputed_copy
+from run_budget import budget_exhausted, finish_run, in_context
+
+logger = logging.getLogger(__name__)
+
+def pregenerate(bot, platform: str, articles: List) -> None:
+    """Attach batch-generated copy to articles that have none for the platform yet."""
+    missing = [article for article in articles if not get_precomputed_copy(article, platform)]
+    if len(missing) < 2:
+        return
+
+    generator = BatchGenerator(bot.openai.model, bot.openai.temperature)
+    if not generator.enabled:
+        return
+
+    posts = generator.generate(platform, missing)
+    for article in missing:
+        if article['id'] in posts:
+            article['social_copy'] = dict(article.get('social_copy') or {}, **{platform: posts[article['id']]})
+
+def run_batch(bot, platform: str, count: int, max_workers: Optional[int] = None) -> bool:
+    """Post up to count pending articles with a platform bot; True if any were posted.
+
+    The bot provides has_pending_post, generate_copy and publish_copy, and
+    keeps its platform client (with account, scheduler and is_down) under the
+    platform's name, e.g. bot.twitter.
+    """
+    logger.info(f"Starting {platform} batch of up to {count} articles...")
+    client = getattr(bot, platform)
+    if client.is_down():
+        logger.warning(f"⛔ {platform} circuit is open; skipping this batch")
+        return False
+    bot.settle_outbox()
+
+    articles = fetch_unposted_batch(bot.supabase.url, bot.supabase.headers, platform, count)
+    if articles is None:
+        logger.error("Failed to fetch pending articles")
+        return False
+
+    articles = [article for article in articles if bot.has_pending_post(article)]
+    if not articles:
+        logger.info("No new articles to post")
+        return False
+
+    logger.info(f"Found {len(articles)} pending article(s)")
+    pregenerate(bot, platform, articles)
+    max_workers = max_workers or int(os.getenv('BATCH_GENERATION_WORKERS', '4'))
+    posted_ids: List[str] = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Copy is generated ahead while earlier articles wait for posting quota
+        futures = {executor.submit(in_context(bot.generate_copy), article): article for article in articles}
+        for future in as_completed(futures):
+            if not client.scheduler.has_quota(platform, client.account):
+                logger.warning(f"⏳ {platform} posting quota exhausted; leaving the rest for the next run")
+                executor.shutdown(wait=False, cancel_futures=True)
+                break
+            if budget_exhausted():
+                logger.warning(f"⏳ Run budget spent; leaving the rest of the {platform} batch for the next run")
+                executor.shutdown(wait=False, cancel_futures=True)
+                break
+
+            article = futures[future]
+            try:
+                copy = future.result()
+                if not copy:
+                    logger.error(f"Failed to generate {platform} copy for: {article.get('title', 'Unknown')}")
+                    continue
+                if bot.publish_copy(article, copy):
+                    posted_ids.append(article['id'])
+            except Exception as e:
+                logger.error(f"Error posting article {article['id']} to {platform}: {e}")
+
+    if posted_ids:
+        finish_run()
+        if mark_articles_posted(bot.supabase.url, bot.supabase.headers, platform, posted_ids):
+            bot.outbox.record_acked(posted_ids, platform)
+        else:
+            logger.warning(f"Posted {len(posted_ids)} article(s) but failed to mark them as posted")
+
+    logger.info(f"📦 {platform} batch posted {len(posted_ids)}/{len(articles)} article(s)")
+    return bool(posted_ids)
+
+async def run_batch_async(bot, platform: str, count: int, max_concurrency: Optional[int] = None) -> bool:
+    """Async variant of run_batch for the asyncio bots; True if any were posted.
+
+    Each article is generated and posted by its own task, with generations
+    bounded by LLM_CONCURRENCY and at most max_concurrency posts in flight.
+    """
+    logger.info(f"Starting async {platform} batch of up to {count} articles...")
+    client = getattr(bot, platform)
+    if client.is_down():
+        logger.warning(f"⛔ {platform} circuit is open; skipping this batch")
+        return False
+    await bot.settle_outbox()
+
+    articles = await fetch_unposted_batch_async(bot.supabase.url, bot.supabase.headers, platform, count)
+    if articles is None:
+        logger.error("Failed to fetch pending articles")
+        return False
+
+    articles = [article for article in articles if bot.has_pending_post(article)]
+    if not articles:
+        logger.info("No new articles to post")
+        return False
+
+    logger.info(f"Found {len(articles)} pending article(s)")
+    await asyncio.to_thread(pregenerate, bot, platform, articles)
+    slots = asyncio.Semaphore(max_concurrency or int(os.getenv('ASYNC_POST_CONCURRENCY', '20')))
+    posted_ids: List[str] = []
+
+    async def generate_and_post(article) -> None:
+        copy = await bot.generate_copy(article)
+        if not copy:
+            logger.error(f"Failed to generate {platform} copy for: {article.get('title', 'Unknown')}")
+            return
+        if not client.scheduler.has_quota(platform, client.account):
+            logger.warning(f"⏳ {platform} posting quota exhausted; leaving {article['id']} for the next run")
+            return
+        if budget_exhausted():
+            logger.warning(f"⏳ Run budget spent; leaving {article['id']} for the next run")
+            return
+        async with slots:
+            if await bot.publish_copy(article, copy):
+                posted_ids.append(article['id'])
+
+    results = await asyncio.gather(*(generate_and_post(article) for article in articles), return_exceptions=True)
+    for article, result in zip(articles, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error posting article {article['id']} to {platform}: {result}")
+
+    if posted_ids:
+        finish_run()
+        if await mark_articles_posted_async(bot.supabase.url, bot.supabase.headers, platform, posted_ids):
+            bot.outbox.record_acked(posted_ids, platform)
+        else:
+            logger.warning(f"Posted {len(posted_ids)} article(s) but failed to mark them as posted")
+
+    logger.info(f"📦 {platform} batch posted {len(posted_ids)}/{len(articles)} article(s)")
+    return bool(posted_ids)
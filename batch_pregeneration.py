@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Overnight pre-generation of social copy with the OpenAI Batch API.
+Writes one chat completion request per unposted (article, platform) pair to a
+JSONL file, submits it as a batch (at batch prices, with no process held open
+per request) and, once the batch has finished, stores each post in the
+generation cache under the key the platform's generator looks up. Bots on the
+same host then post the pre-generated copy without calling the LLM.
+
+Submitted batches are remembered in the bot state directory, so a later run
+(e.g. the next cron tick) collects them:
+
+    python batch_pregeneration.py            # collect finished batches, submit new pairs
+    python batch_pregeneration.py --wait     # ...and poll until the batch completes
+
+OPENAI_BATCH_BASE_URL points the job at any server implementing the files
+and batches endpoints, such as a local stand-in.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+import http_transport
+from article_queries import fetch_unposted_batch
+from bot_state import state_path
+from generation_cache import generation_key, get_generation_cache
+from multi_platform_generator import FINISHERS, PLATFORM_GENERATORS, PLATFORM_INSTRUCTIONS
+from prompt_builder import build_prompt_source
+from run_budget import run_scoped
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    def load_dotenv():
+        pass
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = 'llm_batches.json'
+
+# Batch statuses after which no more output will appear
+FINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+SYSTEM_PROMPT = ('You are a social media expert who writes engaging, platform-appropriate posts '
+                 'about tech and business articles.')
+
+class BatchAPIClient:
+    """Minimal client for the OpenAI files and batches endpoints."""
+
+    def __init__(self):
+        self.api_key = os.getenv('OPENAI_API_KEY')
+        self.base_url = os.getenv('OPENAI_BATCH_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY must be set")
+        self.headers = {'Authorization': f'Bearer {self.api_key}'}
+
+    def _json(self, response) -> Optional[Dict]:
+        if response.status_code != 200:
+            logger.error(f"Batch API error: {response.status_code} - {response.text}")
+            return None
+        return response.json()
+
+    def upload(self, filename: str, lines: List[Dict]) -> Optional[str]:
+        """Upload a JSONL batch input file; return its file id."""
+        content = ''.join(json.dumps(line) + '\n' for line in lines).encode('utf-8')
+        result = self._json(http_transport.post(
+            f"{self.base_url}/files", headers=self.headers, data={'purpose': 'batch'},
+            files={'file': (filename, content, 'application/jsonl')}, timeout=120
+        ))
+        return result['id'] if result else None
+
+    def create_batch(self, input_file_id: str) -> Optional[Dict]:
+        """Start a batch of chat completions over an uploaded file."""
+        return self._json(http_transport.post(
+            f"{self.base_url}/batches", headers=self.headers,
+            json={'input_file_id': input_file_id, 'endpoint': '/v1/chat/completions',
+                  'completion_window': '24h', 'metadata': {'source': 'social-bots'}}
+        ))
+
+    def get_batch(self, batch_id: str) -> Optional[Dict]:
+        """Return a batch's current status."""
+        return self._json(http_transport.get(f"{self.base_url}/batches/{batch_id}", headers=self.headers))
+
+    def download(self, file_id: str) -> Optional[List[Dict]]:
+        """Return the lines of a JSONL output or error file."""
+        response = http_transport.get(f"{self.base_url}/files/{file_id}/content", headers=self.headers, timeout=120)
+        if response.status_code != 200:
+            logger.error(f"Batch API error: {response.status_code} - {response.text}")
+            return None
+        return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+class BatchPregenerator:
+    """Submits unposted (article, platform) pairs as batches and caches the results."""
+
+    def __init__(self, platforms: Optional[List[str]] = None, client: Optional[BatchAPIClient] = None):
+        from linkedin_bot import SupabaseClient
+        self.supabase = SupabaseClient()
+        self.api = client or BatchAPIClient()
+        self.cache = get_generation_cache()
+        if not self.cache.enabled:
+            raise ValueError("The generation cache is disabled (GENERATION_CACHE_TTL=0); nothing would be kept")
+        self.platforms = platforms or list(PLATFORM_GENERATORS)
+        self.path = state_path(STATE_FILE)
+        self.generators = {}
+        for platform in self.platforms:
+            module_name, method_name = PLATFORM_GENERATORS[platform]
+            client_class = importlib.import_module(module_name).OpenAIClient
+            # The bot's OpenAIClient sets the model and temperature that go into the cache key
+            self.generators[platform] = (getattr(client_class, method_name), client_class())
+
+    def load_state(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self, state: Dict) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def build_request(self, article: Dict, platform: str) -> Dict:
+        """Return the Batch API input line for one article and platform."""
+        plan = build_prompt_source(article, platform)
+        _, client = self.generators[platform]
+        prompt = f"""
+            Write {platform} copy for this article.
+            It must be {PLATFORM_INSTRUCTIONS[platform]}.
+            Reply with the post text only.
+
+            Article: {plan['text']}
+            """
+        return {
+            'custom_id': f"{platform}:{article['id']}",
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': {
+                'model': client.model,
+                'messages': [
+                    {'role': 'system', 'content': SYSTEM_PROMPT},
+                    {'role': 'user', 'content': prompt}
+                ],
+                'max_tokens': plan['max_tokens'],
+                'temperature': client.temperature
+            }
+        }
+
+    def pending_pairs(self, limit: int, state: Dict) -> List[Dict]:
+        """Return request entries for unposted pairs that are neither cached nor already submitted."""
+        submitted = {custom_id for batch in state.values() for custom_id in batch['requests']}
+        entries = []
+        for platform in self.platforms:
+            articles = fetch_unposted_batch(self.supabase.url, self.supabase.headers, platform, limit)
+            if articles is None:
+                logger.error(f"Failed to fetch unposted {platform} articles")
+                continue
+
+            generate, client = self.generators[platform]
+            for article in articles:
+                key = generation_key(generate, client, article)
+                line = self.build_request(article, platform)
+                if line['custom_id'] in submitted or self.cache.get(key) is not None:
+                    continue
+                entries.append({'line': line, 'article': article, 'platform': platform, 'key': key})
+        return entries
+
+    @run_scoped
+    def submit(self, limit: int) -> Optional[str]:
+        """Submit a batch for up to limit unposted articles per platform; return its id."""
+        state = self.load_state()
+        entries = self.pending_pairs(limit, state)
+        if not entries:
+            logger.info("No unposted articles need pre-generated copy")
+            return None
+
+        filename = f"social-copy-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.jsonl"
+        file_id = self.api.upload(filename, [entry['line'] for entry in entries])
+        batch = self.api.create_batch(file_id) if file_id else None
+        if not batch:
+            logger.error("Failed to submit pre-generation batch")
+            return None
+
+        # Enough to finish and cache each post once the output arrives
+        state[batch['id']] = {
+            'submitted_at': datetime.utcnow().isoformat(),
+            'requests': {
+                entry['line']['custom_id']: {
+                    'platform': entry['platform'],
+                    'key': entry['key'],
+                    'article': {field: entry['article'].get(field) for field in ('id', 'affiliate_url')}
+                }
+                for entry in entries
+            }
+        }
+        self.save_state(state)
+        logger.info(f"📤 Submitted batch {batch['id']} with {len(entries)} request(s)")
+        return batch['id']
+
+    @run_scoped
+    def collect(self) -> int:
+        """Cache the output of every finished batch; return how many posts were stored.
+
+        Each call gets its own run budget, so polling with --wait keeps retrying.
+        """
+        state = self.load_state()
+        stored = 0
+        for batch_id in list(state):
+            batch = self.api.get_batch(batch_id)
+            if not batch:
+                continue
+            if batch['status'] not in FINAL_STATUSES:
+                counts = batch.get('request_counts') or {}
+                logger.info(f"⏳ Batch {batch_id} is {batch['status']} "
+                            f"({counts.get('completed', 0)}/{counts.get('total', '?')} done)")
+                continue
+
+            if batch.get('output_file_id'):
+                lines = self.api.download(batch['output_file_id'])
+                if lines is None:
+                    # Keep the batch so the next run can try the download again
+                    continue
+                stored += self.store_results(state[batch_id]['requests'], lines)
+            if batch['status'] != 'completed' or batch.get('error_file_id'):
+                logger.warning(f"Batch {batch_id} ended {batch['status']}; "
+                               f"its failed articles will be generated at post time")
+
+            del state[batch_id]
+            self.save_state(state)
+        return stored
+
+    def store_results(self, requests: Dict[str, Dict], lines: List[Dict]) -> int:
+        """Finish each successful completion and store it under its generator's cache key."""
+        stored = 0
+        for line in lines:
+            request = requests.get(line.get('custom_id'))
+            response = line.get('response') or {}
+            if not request or response.get('status_code') != 200:
+                continue
+            try:
+                text = response['body']['choices'][0]['message']['content'].strip()
+            except (KeyError, IndexError, TypeError, AttributeError):
+                continue
+            if text:
+                platform = request['platform']
+                self.cache.put(request['key'], platform, FINISHERS[platform](text, request['article']))
+                stored += 1
+        logger.info(f"📥 Stored {stored}/{len(lines)} pre-generated post(s) in the generation cache")
+        return stored
+
+    def wait(self, poll_interval: float, timeout: float) -> int:
+        """Collect batches until none are left or timeout seconds pass."""
+        stored = 0
+        deadline = time.monotonic() + timeout
+        while True:
+            stored += self.collect()
+            if not self.load_state() or time.monotonic() >= deadline:
+                return stored
+            time.sleep(poll_interval)
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Pre-generate social copy with the OpenAI Batch API")
+    parser.add_argument('--platform', action='append', choices=sorted(PLATFORM_GENERATORS),
+                        help="Platform to pre-generate for (repeatable, default: all)")
+    parser.add_argument('--limit', type=int, default=int(os.getenv('BATCH_PREGENERATE_LIMIT', '100')),
+                        help="Unposted articles per platform to include")
+    parser.add_argument('--wait', action='store_true', help="Poll until submitted batches finish")
+    parser.add_argument('--poll-interval', type=float, default=float(os.getenv('BATCH_POLL_INTERVAL', '60')),
+                        help="Seconds between status checks with --wait")
+    parser.add_argument('--timeout', type=float, default=24 * 3600, help="Longest time to wait with --wait")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('batch_pregeneration.log'),
+            logging.StreamHandler()
+        ]
+    )
+    args = parse_args(argv)
+    try:
+        pregenerator = BatchPregenerator(args.platform)
+        pregenerator.collect()
+        pregenerator.submit(args.limit)
+        if args.wait:
+            pregenerator.wait(args.poll_interval, args.timeout)
+        return 0
+    except Exception as e:
+        logger.error(f"💥 Batch pre-generation failed: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
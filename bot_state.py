@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+Local state directory for the social media bots.
+Caches, the posting outbox and other files that must survive between runs
+live under BOT_STATE_DIR (default: .bot_state in the working directory).
+"""
+
+import os
+
+def state_path(filename: str) -> str:
+    """Return the path of a file in the state directory, creating the directory."""
+    directory = os.getenv('BOT_STATE_DIR', '.bot_state')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
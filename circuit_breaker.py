@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker per upstream host and endpoint for the social media bots.
+After CIRCUIT_FAILURE_THRESHOLD failed calls in a row an endpoint's circuit
+opens and requests to it fail fast without touching the network. Once the
+open period has passed, a single probe request is let through (half-open):
+success closes the circuit, failure opens it again for twice as long. The
+state lives in a state file, so later cron runs and the other bots skip a
+platform that is known to be down instead of repeating the failing calls.
+Each process keeps the state in memory and only re-reads the file when it has
+changed. Failure counts stay in memory; the file is rewritten, under an
+exclusive lock and merged with what other processes wrote, only when a
+circuit opens, is probed or closes.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+import requests
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import logging
+from bot_state import state_path
+from run_budget import RunDeadlineExceeded, budget_exhausted
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_FILE = 'circuit_breaker.json'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Path segments that identify a resource rather than an endpoint: page ids,
+# UUIDs, URNs. Short ones like the "2" in /2/tweets or "v18.0" are versions.
+_ID_SEGMENT = re.compile(r'^(\d{4,}|(?=.*\d).{12,})$')
+
+class CircuitOpenError(requests.exceptions.ConnectTimeout):
+    """The endpoint's circuit is open; the request was not sent."""
+
+def circuit_breaker_enabled() -> bool:
+    """Return False when CIRCUIT_BREAKER turns the breaker off."""
+    return os.getenv('CIRCUIT_BREAKER', 'true').lower() not in ('0', 'false', 'no')
+
+def circuit_key(url: str) -> str:
+    """Return host and endpoint path of a URL, with resource ids replaced by {id}."""
+    parts = urlsplit(url)
+    segments = ['{id}' if _ID_SEGMENT.match(segment) else segment
+                for segment in parts.path.split('/')]
+    return f"{parts.scheme}://{parts.netloc}{'/'.join(segments)}"
+
+def is_upstream_failure(response: Optional[requests.Response] = None,
+                        error: Optional[Exception] = None) -> bool:
+    """Return True if a call's outcome means the service is down.
+
+    Server errors, refused connections and timeouts count; throttles and
+    client errors mean the service is answering. Timeouts caused by the run
+    running out of budget are the run's fault, not the service's.
+    """
+    if error is not None:
+        if isinstance(error, (CircuitOpenError, RunDeadlineExceeded)) or budget_exhausted():
+            return False
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+    return response is not None and response.status_code >= 500
+
+class CircuitBreaker:
+    """Closed/open/half-open circuits shared by the bot processes through a state file."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or state_path(CIRCUIT_FILE)
+        self.failure_threshold = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))
+        self.open_seconds = float(os.getenv('CIRCUIT_OPEN_SECONDS', '300'))
+        self.max_open_seconds = float(os.getenv('CIRCUIT_MAX_OPEN_SECONDS', '3600'))
+        # A probe that has not reported back by then is assumed lost
+        self.probe_seconds = float(os.getenv('CIRCUIT_PROBE_SECONDS', '60'))
+        self.lock = threading.Lock()
+        # Open and half-open circuits as last read from the file; closed ones are absent
+        self.circuits: Dict[str, Dict] = {}
+        self.version: Optional[Tuple[int, int, int]] = None
+        # Failures in a row of closed circuits, counted by this process only
+        self.failures: Dict[str, int] = {}
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                circuits = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {key: circuit for key, circuit in circuits.items() if circuit.get('state') != CLOSED}
+
+    def _save(self, circuits: Dict) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(circuits, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write circuit breaker state: {e}")
+
+    def _file_version(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> None:
+        """Re-read the state file if another process (or this one) replaced it."""
+        version = self._file_version()
+        if version != self.version:
+            self.circuits = self._load()
+            self.version = version
+
+    def _update(self, key: str, change: Callable[[Optional[Dict]], Optional[Dict]]) -> Optional[Dict]:
+        """Apply change to the circuit as stored on disk and write it back under the file lock.
+
+        change gets the stored circuit (None when closed) and returns the new
+        one (None to close it). Other circuits are kept as stored.
+        """
+        lock_file = None
+        try:
+            lock_file = open(f"{self.path}.lock", 'a')
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except OSError as e:
+            logger.warning(f"Could not lock circuit breaker state: {e}")
+        try:
+            circuits = self._load()
+            circuit = change(circuits.get(key))
+            if circuit is None:
+                circuits.pop(key, None)
+            else:
+                circuits[key] = circuit
+            self._save(circuits)
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+        self.circuits = circuits
+        self.version = self._file_version()
+        return circuit
+
+    def is_open(self, url: str) -> bool:
+        """Return True if a request to the URL would fail fast right now.
+
+        Does not claim the probe, so bots can use it to skip a run.
+        """
+        if not circuit_breaker_enabled():
+            return False
+        with self.lock:
+            self._refresh()
+            circuit = self.circuits.get(circuit_key(url))
+        return circuit is not None and self._blocks(circuit, time.time())
+
+    @staticmethod
+    def _blocks(circuit: Dict, now: float) -> bool:
+        if circuit['state'] == OPEN:
+            return now < circuit['open_until']
+        return now < circuit['probe_until']
+
+    def allow(self, key: str) -> bool:
+        """Return True if a request may be sent, claiming the probe of a circuit due for one."""
+        if not circuit_breaker_enabled():
+            return True
+        with self.lock:
+            self._refresh()
+            circuit = self.circuits.get(key)
+            if circuit is None:
+                return True
+            now = time.time()
+            if self._blocks(circuit, now):
+                # Open, or another request is already probing
+                return False
+
+            claimed = []
+
+            def claim(stored: Optional[Dict]) -> Optional[Dict]:
+                # Re-checked under the file lock so only one process gets the probe
+                if stored is None or self._blocks(stored, now):
+                    claimed.append(stored is None)
+                    return stored
+                claimed.append(True)
+                return dict(stored, state=HALF_OPEN, probe_until=now + self.probe_seconds)
+
+            stored = self._update(key, claim)
+            if not claimed[0]:
+                return False
+        if stored is not None:
+            logger.info(f"🟡 Probing {key} after {stored['open_seconds']:.0f}s open")
+        return True
+
+    def record_success(self, key: str) -> None:
+        """Close the circuit after a call the service answered."""
+        with self.lock:
+            self.failures.pop(key, None)
+            self._refresh()
+            if key not in self.circuits:
+                return
+            self._update(key, lambda stored: None)
+        logger.info(f"🟢 {key} is answering again; circuit closed")
+
+    def record_failure(self, key: str) -> None:
+        """Count a failed call, opening the circuit at the threshold or after a failed probe."""
+        with self.lock:
+            self._refresh()
+            circuit = self.circuits.get(key)
+            if circuit is None:
+                failures = self.failures.get(key, 0) + 1
+                if failures < self.failure_threshold:
+                    self.failures[key] = failures
+                    return
+                open_seconds = self.open_seconds
+            elif circuit['state'] == HALF_OPEN:
+                failures = circuit['failures'] + 1
+                open_seconds = min(circuit['open_seconds'] * 2, self.max_open_seconds)
+            else:
+                # Already opened, e.g. by another process
+                return
+            self.failures.pop(key, None)
+            opened = {'state': OPEN, 'failures': failures, 'open_seconds': open_seconds,
+                      'open_until': time.time() + open_seconds}
+            self._update(key, lambda stored: opened)
+        logger.warning(f"🔴 {key} failed {failures} times in a row; "
+                       f"circuit open, failing fast for {open_seconds:.0f}s")
+
+    def record(self, key: str, response: Optional[requests.Response] = None,
+               error: Optional[Exception] = None) -> None:
+        """Record the outcome of a call that allow() let through."""
+        if not circuit_breaker_enabled():
+            return
+        if is_upstream_failure(response, error):
+            self.record_failure(key)
+        elif error is None:
+            self.record_success(key)
+
+_breaker: Optional[CircuitBreaker] = None
+_breaker_lock = threading.Lock()
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Return the process-wide circuit breaker."""
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker()
+        return _breaker
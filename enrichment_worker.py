@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Article Enrichment Worker
+Generates every platform's social copy for newly ingested articles and stores
+it in the articles.social_copy column (supabase/migrations/006) with one bulk
+update, so the bots only read and post. Run it right after ingestion
+(fetchAndProcessFeeds in lib/rss.ts), or keep it running with --follow: with
+DATABASE_URL set it LISTENs for inserted articles, otherwise it polls.
+"""
+
+import os
+import sys
+import time
+import select
+import argparse
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import logging
+import http_transport
+from article_queries import POSTED_COLUMNS, build_candidates_query, fetch_articles
+from multi_platform_generator import PLATFORM_GENERATORS, MultiPlatformGenerator
+from run_budget import finish_run, in_context, run_scoped
+from supabase_capabilities import get_capabilities, has_column
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('enrichment_worker.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Channel the articles insert trigger notifies
+NOTIFY_CHANNEL = 'article_enrichment'
+
+class ArticleEnricher:
+    """Generates and stores social copy for articles that have none yet."""
+
+    def __init__(self, limit: Optional[int] = None, max_workers: Optional[int] = None):
+        self.url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+        key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+
+        if not self.url or not key:
+            raise ValueError("Supabase URL and key must be set in environment variables")
+
+        self.headers = {
+            'apikey': key,
+            'Authorization': f'Bearer {key}',
+            'Content-Type': 'application/json'
+        }
+        self.limit = limit or int(os.getenv('ENRICHMENT_BATCH_SIZE', '20'))
+        self.max_workers = max_workers or int(os.getenv('BATCH_GENERATION_WORKERS', '4'))
+        self.generator = MultiPlatformGenerator()
+        self.clients: Dict[str, object] = {}
+
+    def fetch_pending(self) -> Optional[List[Dict]]:
+        """Return the newest articles still unposted somewhere that have no social copy."""
+        capabilities = get_capabilities(self.url, self.headers)
+        if not has_column(capabilities, 'social_copy'):
+            capabilities = get_capabilities(self.url, self.headers, refresh=True)
+            if not has_column(capabilities, 'social_copy'):
+                raise RuntimeError("articles.social_copy is missing; apply supabase/migrations/006 first")
+
+        params = build_candidates_query(POSTED_COLUMNS, self.limit)
+        params['social_copy'] = 'is.null'
+        return fetch_articles(self.url, self.headers, params)
+
+    def _generate_single(self, platform: str, article: Dict) -> Optional[str]:
+        if platform not in self.clients:
+            module_name, _ = PLATFORM_GENERATORS[platform]
+            self.clients[platform] = importlib.import_module(module_name).OpenAIClient()
+        _, method_name = PLATFORM_GENERATORS[platform]
+        return getattr(self.clients[platform], method_name)(article)
+
+    def generate(self, article: Dict) -> Optional[Dict[str, str]]:
+        """Return copy for every platform, or None if none could be generated."""
+        try:
+            social_copy = self.generator.generate_all_posts(article) or {}
+            for platform in PLATFORM_GENERATORS:
+                if not social_copy.get(platform):
+                    # The combined response left this platform out; ask its own generator
+                    text = self._generate_single(platform, article)
+                    if text:
+                        social_copy[platform] = text
+            return social_copy or None
+        except Exception as e:
+            logger.error(f"Error generating social copy for {article.get('id')}: {e}")
+            return None
+
+    def store(self, copies: Dict[str, Dict[str, str]]) -> int:
+        """Write social copy for many articles with a single RPC; return how many rows changed."""
+        response = http_transport.post(
+            f"{self.url}/rest/v1/rpc/set_article_social_copy",
+            headers=self.headers,
+            idempotent=True,
+            json={'p_rows': [{'id': article_id, 'social_copy': copy} for article_id, copy in copies.items()]}
+        )
+        if response.status_code != 200:
+            logger.error(f"Failed to store social copy: {response.status_code} - {response.text}")
+            return 0
+        return int(response.json() or 0)
+
+    @run_scoped
+    def run_once(self) -> int:
+        """Enrich one batch of pending articles; return how many were stored.
+
+        Each batch gets its own run budget (BOT_RUN_TIMEOUT), so a worker
+        kept running with --follow never runs out of retries.
+        """
+        articles = self.fetch_pending()
+        if articles is None:
+            logger.error("Failed to fetch articles waiting for social copy")
+            return 0
+        if not articles:
+            return 0
+
+        logger.info(f"🧠 Generating social copy for {len(articles)} article(s)")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(in_context(self.generate), articles))
+
+        copies = {article['id']: copy for article, copy in zip(articles, results) if copy}
+        if not copies:
+            return 0
+
+        # Store the batch using the reserve held back for it
+        finish_run()
+        stored = self.store(copies)
+        logger.info(f"💾 Stored social copy for {stored}/{len(articles)} article(s)")
+        return stored
+
+    def drain(self) -> int:
+        """Enrich batches until a batch is not full; return how many were stored."""
+        total = 0
+        while True:
+            stored = self.run_once()
+            total += stored
+            if stored < self.limit:
+                return total
+
+    def run_forever(self, poll_interval: float = 60.0, listen: bool = True) -> None:
+        """Keep enriching new articles, woken by notifications or polling."""
+        conn = self._listen() if listen else None
+        mode = "listening for new articles" if conn else "polling"
+        logger.info(f"🎯 Enrichment worker started ({mode})")
+
+        while True:
+            self.drain()
+            if conn:
+                try:
+                    if self._wait(conn, poll_interval):
+                        logger.info("🔔 New articles ingested")
+                    continue
+                except Exception as e:
+                    logger.error(f"Lost article notifications, falling back to polling: {e}")
+                    conn = None
+            time.sleep(poll_interval)
+
+    def _listen(self):
+        dsn = os.getenv('DATABASE_URL')
+        if not dsn or psycopg2 is None:
+            return None
+        try:
+            conn = psycopg2.connect(dsn)
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            return conn
+        except Exception as e:
+            logger.warning(f"Could not listen for new articles, polling instead: {e}")
+            return None
+
+    def _wait(self, conn, timeout: float) -> bool:
+        """Block until articles are inserted or the timeout passes; True if notified."""
+        if not conn.notifies:
+            select.select([conn], [], [], timeout)
+            conn.poll()
+        notified = bool(conn.notifies)
+        conn.notifies.clear()
+        return notified
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Generate social copy for newly ingested articles.")
+    parser.add_argument('--limit', type=int, default=None,
+                        help="Articles enriched per batch (default: ENRICHMENT_BATCH_SIZE or 20)")
+    parser.add_argument('--follow', action='store_true',
+                        help="Keep running and enrich articles as they are ingested")
+    parser.add_argument('--poll-interval', type=float, default=float(os.getenv('ENRICHMENT_POLL_INTERVAL', '60')),
+                        help="Seconds between checks when not notified")
+    parser.add_argument('--poll', action='store_true',
+                        help="Poll even when DATABASE_URL allows listening for new articles")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Main entry point."""
+    args = parse_args(argv)
+    try:
+        enricher = ArticleEnricher(limit=args.limit)
+        if args.follow:
+            enricher.run_forever(args.poll_interval, listen=not args.poll)
+        else:
+            logger.info(f"Enriched {enricher.drain()} article(s)")
+    except KeyboardInterrupt:
+        logger.info("🛑 Interrupted by user")
+    except Exception as e:
+        logger.error(f"Fatal error in main: {e}")
+        return 1
+    finally:
+        http_transport.log_connection_stats()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
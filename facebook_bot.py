@@ -6,10 +6,27 @@ Retrieves latest article from Supabase, summarizes it, and posts to Facebook.
 
 import os
 import json
-import requests
+import asyncio
+import argparse
+import http_transport
+import async_transport
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List
+from typing import Awaitable, Callable, Dict, Optional, List, Tuple
 import logging
+from article_queries import (fetch_next_unposted, fetch_next_unposted_async, mark_articles_posted,
+                            mark_articles_posted_async)
+from batch_posting import run_batch, run_batch_async
+from post_outbox import DEFERRED_ERRORS, PostDeferred, PostOutbox
+from posting_scheduler import get_scheduler
+from multi_platform_generator import finish_facebook_post, get_precomputed_copy
+from generation_cache import cached_generation
+from llm_router import generate_async, get_llm_router
+from prompt_builder import build_prompt_source, log_token_usage, trim_to_chars
+from template_generator import fallback_copy
+from run_prefetch import Prefetch
+from run_budget import finish_run, run_scoped
+from circuit_breaker import get_circuit_breaker
+from identity_cache import IDENTITY_TTL, credential_key, get_identity_cache
 try:
     from dotenv import load_dotenv
 except ImportError:
@@ -47,25 +64,15 @@ class SupabaseClient:
             'Content-Type': 'application/json'
         }
     
-    def get_latest_article(self) -> Optional[Dict]:
-        """Retrieve the latest article from the database."""
+    def get_latest_article(self, accept: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        """Retrieve the newest article not yet posted to Facebook."""
         try:
-            response = requests.get(
-                f"{self.url}/rest/v1/articles",
-                headers=self.headers,
-                params={
-                    'select': '*',
-                    'order': 'published_at.desc',
-                    'limit': '1'
-                }
-            )
+            # Filter on posted_to_facebook_at server-side and fetch only the columns we use
+            article = fetch_next_unposted(self.url, self.headers, 'facebook', accept)
+            if article:
+                return article
             
-            if response.status_code == 200:
-                data = response.json()
-                if data and len(data) > 0:
-                    return data[0]
-            
-            logger.warning("No articles found in database")
+            logger.warning("No unposted articles found in database")
             return None
             
         except Exception as e:
@@ -77,7 +84,7 @@ class SupabaseClient:
         try:
             field_name = f"posted_to_{platform}_at"
             
-            response = requests.patch(
+            response = http_transport.patch(
                 f"{self.url}/rest/v1/articles",
                 headers=self.headers,
                 json={
@@ -86,7 +93,7 @@ class SupabaseClient:
                 params={'id': f'eq.{article_id}'}
             )
             
-            if response.status_code == 200:
+            if response.status_code in (200, 204):
                 logger.info(f"Marked article {article_id} as posted to {platform}")
                 return True
             else:
@@ -101,28 +108,18 @@ class OpenAIClient:
     """Client for OpenAI API to generate Facebook post content."""
     
     def __init__(self):
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
-            raise ValueError("OpenAI API key must be set in environment variables")
-        
-        self.base_url = "https://api.openai.com/v1"
-        self.headers = {
-            'Authorization': f'Bearer {self.api_key}',
-            'Content-Type': 'application/json'
-        }
+        # Sends each completion to the fastest healthy configured provider
+        self.router = get_llm_router()
+        self.model = 'gpt-3.5-turbo'
+        self.temperature = 0.7
     
+    @cached_generation('facebook', prompt_version=3)
     def generate_facebook_post(self, article: Dict) -> Optional[str]:
         """Generate a Facebook post from article content."""
         try:
-            title = article.get('title', '')
-            summary = article.get('summary', '')
-            content = article.get('content', '')
-            
-            text_to_summarize = title
-            if summary:
-                text_to_summarize += f"\n\n{summary}"
-            elif content:
-                text_to_summarize += f"\n\n{content[:500]}..."
+            # Budget the article text by tokens for this platform
+            plan = build_prompt_source(article, 'facebook')
+            text_to_summarize = plan['text']
             
             prompt = f"""
             Create an engaging Facebook post about this article. The post should:
@@ -137,42 +134,31 @@ class OpenAIClient:
             Format: Friendly post with hashtags at the end
             """
             
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={
-                    'model': 'gpt-3.5-turbo',
-                    'messages': [
-                        {
-                            'role': 'system',
-                            'content': 'You are a social media expert who creates engaging Facebook posts about tech and business articles.'
-                        },
-                        {
-                            'role': 'user',
-                            'content': prompt
-                        }
-                    ],
-                    'max_tokens': 400,
-                    'temperature': 0.7
-                }
-            )
+            result = self.router.stream_text({
+                'model': self.model,
+                'messages': [
+                    {
+                        'role': 'system',
+                        'content': 'You are a social media expert who creates engaging Facebook posts about tech and business articles.'
+                    },
+                    {
+                        'role': 'user',
+                        'content': prompt
+                    }
+                ],
+                'max_tokens': plan['max_tokens'],
+                'temperature': self.temperature
+            }, plan['max_chars'])
             
-            if response.status_code == 200:
-                result = response.json()
-                post_text = result['choices'][0]['message']['content'].strip()
-                
-                # Add affiliate link if available
-                affiliate_url = article.get('affiliate_url')
-                if affiliate_url and len(post_text) < 63000:  # Leave room for URL
-                    post_text += f"\n\nRead more: {affiliate_url}"
-                
-                # Ensure post is under Facebook's character limit
-                if len(post_text) > 63206:
-                    post_text = post_text[:63203] + "..."
+            if result:
+                log_token_usage('facebook', plan, result)
+                # Reading stopped at the length budget; end on a clean boundary
+                post_text = trim_to_chars(result['text'].strip(), plan['max_chars'])
                 
-                return post_text
+                # Add affiliate link and enforce Facebook's character limit
+                return finish_facebook_post(post_text, article)
             else:
-                logger.error(f"OpenAI API error: {response.status_code} - {response.text}")
+                logger.error("Failed to get a completion from any LLM provider")
                 return None
                 
         except Exception as e:
@@ -189,15 +175,23 @@ class FacebookClient:
         if not all([self.access_token, self.page_id]):
             raise ValueError("Facebook API credentials must be set in environment variables")
         
+        self.account = self.page_id
+        self.scheduler = get_scheduler()
+        self.identity = get_identity_cache()
         self.base_url = "https://graph.facebook.com/v18.0"
         self.headers = {
             'Content-Type': 'application/json'
         }
     
     def get_page_info(self) -> Optional[Dict]:
-        """Get Facebook page information."""
+        """Get Facebook page information, cached across runs."""
+        return self.identity.get_or_fetch(f"facebook:page:{credential_key(self.page_id, self.access_token)}",
+                                          self.fetch_page_info)
+    
+    def fetch_page_info(self) -> Optional[Tuple[Dict, float]]:
+        """Request the page's name and id from the Graph API."""
         try:
-            response = requests.get(
+            response = http_transport.get(
                 f"{self.base_url}/{self.page_id}",
                 headers=self.headers,
                 params={
@@ -207,7 +201,7 @@ class FacebookClient:
             )
             
             if response.status_code == 200:
-                return response.json()
+                return response.json(), IDENTITY_TTL
             else:
                 logger.error(f"Error getting Facebook page info: {response.status_code}")
                 return None
@@ -216,10 +210,17 @@ class FacebookClient:
             logger.error(f"Error getting Facebook page info: {e}")
             return None
     
+    def is_down(self) -> bool:
+        """Return True while the circuit of the posting endpoint is open."""
+        return get_circuit_breaker().is_open(f"{self.base_url}/{self.page_id}/feed")
+    
     def post_link(self, message: str, link: str) -> Optional[str]:
         """Post a link to Facebook."""
         try:
-            response = requests.post(
+            if not self.scheduler.acquire('facebook', self.account):
+                raise PostDeferred("Facebook posting quota exhausted for this run")
+            
+            response = http_transport.post(
                 f"{self.base_url}/{self.page_id}/feed",
                 headers=self.headers,
                 params={
@@ -228,6 +229,7 @@ class FacebookClient:
                     'link': link
                 }
             )
+            self.scheduler.observe('facebook', self.account, response)
             
             if response.status_code == 200:
                 result = response.json()
@@ -238,14 +240,22 @@ class FacebookClient:
                 logger.error(f"Facebook API error: {response.status_code} - {response.text}")
                 return None
                 
+        except DEFERRED_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Error posting to Facebook: {e}")
+            # The platform may have accepted the post; let the outbox decide
+            if http_transport.is_ambiguous_failure(e):
+                raise
             return None
     
     def post_text(self, message: str) -> Optional[str]:
         """Post text-only content to Facebook."""
         try:
-            response = requests.post(
+            if not self.scheduler.acquire('facebook', self.account):
+                raise PostDeferred("Facebook posting quota exhausted for this run")
+            
+            response = http_transport.post(
                 f"{self.base_url}/{self.page_id}/feed",
                 headers=self.headers,
                 params={
@@ -253,6 +263,7 @@ class FacebookClient:
                     'message': message
                 }
             )
+            self.scheduler.observe('facebook', self.account, response)
             
             if response.status_code == 200:
                 result = response.json()
@@ -263,52 +274,116 @@ class FacebookClient:
                 logger.error(f"Facebook API error: {response.status_code} - {response.text}")
                 return None
                 
+        except DEFERRED_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Error posting to Facebook: {e}")
+            # The platform may have accepted the post; let the outbox decide
+            if http_transport.is_ambiguous_failure(e):
+                raise
             return None
 
 class FacebookBot:
     """Main bot class that orchestrates the Facebook posting process."""
     
-    def __init__(self):
+    def __init__(self, article_source: Optional[Callable[[], Optional[Dict]]] = None):
         self.supabase = SupabaseClient()
+        # Callers such as master_social_bot can inject an already-fetched article
+        self.article_source = article_source or self.next_article
         self.openai = OpenAIClient()
         self.facebook = FacebookClient()
+        self.outbox = PostOutbox()
+    
+    def post_payload(self, payload: Dict) -> Optional[str]:
+        """Post a payload stored in the outbox."""
+        if payload.get('link'):
+            return self.facebook.post_link(payload['text'], payload['link'])
+        return self.facebook.post_text(payload['text'])
+    
+    def settle_outbox(self) -> None:
+        """Retry due dead letters and acknowledge posts left unmarked by earlier runs."""
+        self.outbox.retry_due('facebook', self.post_payload)
+        self.outbox.replay_acks(
+            'facebook',
+            lambda article_ids: mark_articles_posted(self.supabase.url, self.supabase.headers, 'facebook', article_ids)
+        )
+    
+    def has_pending_post(self, article: Dict) -> bool:
+        """Return True if the outbox allows posting the article."""
+        return self.outbox.can_post(article['id'], 'facebook', self.facebook.account)
+    
+    def next_article(self) -> Optional[Dict]:
+        """Return the newest unposted article the outbox allows posting now."""
+        return self.supabase.get_latest_article(accept=self.has_pending_post)
+    
+    def generate_copy(self, article: Dict) -> Optional[str]:
+        """Return the post text, preferring copy the master bot generated.
+        
+        Falls back to template copy when the LLM is slow, over budget or failing.
+        """
+        return (get_precomputed_copy(article, 'facebook') or self.openai.generate_facebook_post(article)
+                or fallback_copy(article, 'facebook'))
+    
+    def publish_copy(self, article: Dict, post_text: str) -> bool:
+        """Post to Facebook at most once per article."""
+        affiliate_url = article.get('affiliate_url')
+        return bool(self.outbox.publish(article['id'], 'facebook', self.facebook.account,
+                                        {'text': post_text, 'link': affiliate_url or None}, self.post_payload))
+    
+    def prefetch(self) -> Prefetch:
+        """Start the steps that do not need the article: connection warm-up."""
+        return Prefetch({
+            'platform': lambda: http_transport.preconnect(self.facebook.base_url),
+            'llm': lambda: self.openai.router.preconnect(self.openai.model)
+        })
+    
+    @run_scoped
+    def run_batch(self, count: int) -> bool:
+        """Post up to count pending articles in one run."""
+        return run_batch(self, 'facebook', count)
     
+    @run_scoped
     def run(self) -> bool:
         """Main execution method."""
         try:
             logger.info("Starting Facebook bot execution...")
+            if self.facebook.is_down():
+                logger.warning("⛔ Facebook circuit is open; skipping this run")
+                return False
+            # Connection warm-up overlaps the article query and generation
+            prefetch = self.prefetch()
+            self.settle_outbox()
             
             # Get latest article
-            article = self.supabase.get_latest_article()
+            article = self.article_source()
             if not article:
                 logger.info("No new articles to post")
                 return False
             
             logger.info(f"Found article: {article.get('title', 'Unknown')}")
             
+            if not self.has_pending_post(article):
+                logger.info("Article already posted or awaiting retry according to the outbox")
+                return False
+            
             # Generate Facebook post
-            post_text = self.openai.generate_facebook_post(article)
+            post_text = self.generate_copy(article)
             if not post_text:
                 logger.error("Failed to generate Facebook post")
                 return False
             
             logger.info(f"Generated Facebook post: {post_text[:100]}...")
             
-            # Post to Facebook
-            affiliate_url = article.get('affiliate_url')
-            if affiliate_url:
-                post_id = self.facebook.post_link(post_text, affiliate_url)
-            else:
-                post_id = self.facebook.post_text(post_text)
-            
-            if not post_id:
+            prefetch.wait()
+            # Post to Facebook at most once per article
+            if not self.publish_copy(article, post_text):
                 logger.error("Failed to post to Facebook")
                 return False
             
-            # Mark article as posted
+            # Mark article as posted, using the reserve held back for it
+            finish_run()
             if self.supabase.mark_article_as_posted(article['id'], 'facebook'):
+                self.outbox.record_acked([article['id']], 'facebook')
                 logger.info("Successfully completed Facebook post cycle")
                 return True
             else:
@@ -319,17 +394,230 @@ class FacebookBot:
             logger.error(f"Error in Facebook bot execution: {e}")
             return False
 
-def main():
+class AsyncSupabaseClient(SupabaseClient):
+    """SupabaseClient with coroutine methods for the asyncio bots."""
+    
+    async def get_latest_article(self, accept: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        """Retrieve the newest article not yet posted to Facebook."""
+        try:
+            article = await fetch_next_unposted_async(self.url, self.headers, 'facebook', accept)
+            if article:
+                return article
+                
+            logger.warning("No unposted articles found in database")
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error retrieving latest article: {e}")
+            return None
+    
+    async def mark_article_as_posted(self, article_id: str, platform: str) -> bool:
+        """Mark an article as posted to a specific platform."""
+        try:
+            return await mark_articles_posted_async(self.url, self.headers, platform, [article_id])
+        except Exception as e:
+            logger.error(f"Error marking article as posted to {platform}: {e}")
+            return False
+
+class AsyncOpenAIClient(OpenAIClient):
+    """OpenAIClient whose generation runs off the event loop."""
+    
+    async def generate_facebook_post(self, article: Dict) -> Optional[str]:
+        """Generate a Facebook post from article content."""
+        return await generate_async(super().generate_facebook_post, article)
+
+class AsyncFacebookClient(FacebookClient):
+    """FacebookClient with coroutine methods for the asyncio bots."""
+    
+    async def get_page_info(self) -> Optional[Dict]:
+        """Get Facebook page information, cached across runs."""
+        return await self.identity.get_or_fetch_async(
+            f"facebook:page:{credential_key(self.page_id, self.access_token)}", self.fetch_page_info)
+    
+    async def fetch_page_info(self) -> Optional[Tuple[Dict, float]]:
+        """Request the page's name and id from the Graph API."""
+        try:
+            response = await async_transport.get(
+                f"{self.base_url}/{self.page_id}",
+                headers=self.headers,
+                params={
+                    'access_token': self.access_token,
+                    'fields': 'name,id'
+                }
+            )
+            
+            if response.status_code == 200:
+                return response.json(), IDENTITY_TTL
+            else:
+                logger.error(f"Error getting Facebook page info: {response.status_code}")
+                return None
+                
+        except Exception as e:
+            logger.error(f"Error getting Facebook page info: {e}")
+            return None
+    
+    async def _post_to_feed(self, params: Dict[str, str]) -> Optional[str]:
+        try:
+            if not await self.scheduler.acquire_async('facebook', self.account):
+                raise PostDeferred("Facebook posting quota exhausted for this run")
+                
+            response = await async_transport.post(
+                f"{self.base_url}/{self.page_id}/feed",
+                headers=self.headers,
+                params={'access_token': self.access_token, **params}
+            )
+            self.scheduler.observe('facebook', self.account, response)
+            
+            if response.status_code == 200:
+                post_id = response.json().get('id')
+                logger.info(f"Successfully posted to Facebook: {post_id}")
+                return post_id
+            else:
+                logger.error(f"Facebook API error: {response.status_code} - {response.text}")
+                return None
+                
+        except DEFERRED_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Error posting to Facebook: {e}")
+            if http_transport.is_ambiguous_failure(e):
+                raise
+            return None
+    
+    async def post_link(self, message: str, link: str) -> Optional[str]:
+        """Post a link to Facebook."""
+        return await self._post_to_feed({'message': message, 'link': link})
+    
+    async def post_text(self, message: str) -> Optional[str]:
+        """Post text-only content to Facebook."""
+        return await self._post_to_feed({'message': message})
+
+class AsyncFacebookBot(FacebookBot):
+    """FacebookBot driven by an event loop; run() and run_batch() are coroutines."""
+    
+    def __init__(self, article_source: Optional[Callable[[], Awaitable[Optional[Dict]]]] = None):
+        self.supabase = AsyncSupabaseClient()
+        self.article_source = article_source or self.next_article
+        self.openai = AsyncOpenAIClient()
+        self.facebook = AsyncFacebookClient()
+        self.outbox = PostOutbox()
+    
+    async def post_payload(self, payload: Dict) -> Optional[str]:
+        """Post a payload stored in the outbox."""
+        if payload.get('link'):
+            return await self.facebook.post_link(payload['text'], payload['link'])
+        return await self.facebook.post_text(payload['text'])
+    
+    async def settle_outbox(self) -> None:
+        """Retry due dead letters and acknowledge posts left unmarked by earlier runs."""
+        await self.outbox.retry_due_async('facebook', self.post_payload)
+        await self.outbox.replay_acks_async(
+            'facebook',
+            lambda article_ids: mark_articles_posted_async(self.supabase.url, self.supabase.headers, 'facebook',
+                                                           article_ids)
+        )
+    
+    async def next_article(self) -> Optional[Dict]:
+        """Return the newest unposted article the outbox allows posting now."""
+        return await self.supabase.get_latest_article(accept=self.has_pending_post)
+    
+    async def generate_copy(self, article: Dict) -> Optional[str]:
+        """Return the post text, preferring precomputed copy and falling back to a template."""
+        return (get_precomputed_copy(article, 'facebook') or await self.openai.generate_facebook_post(article)
+                or fallback_copy(article, 'facebook'))
+    
+    async def publish_copy(self, article: Dict, post_text: str) -> bool:
+        """Post to Facebook at most once per article."""
+        affiliate_url = article.get('affiliate_url')
+        return bool(await self.outbox.publish_async(article['id'], 'facebook', self.facebook.account,
+                                                    {'text': post_text, 'link': affiliate_url or None},
+                                                    self.post_payload))
+    
+    def prefetch(self) -> asyncio.Future:
+        """Start the LLM connection warm-up while the article is fetched."""
+        return asyncio.gather(
+            asyncio.to_thread(self.openai.router.preconnect, self.openai.model),
+            return_exceptions=True
+        )
+    
+    @run_scoped
+    async def run_batch(self, count: int) -> bool:
+        """Post up to count pending articles in one run."""
+        return await run_batch_async(self, 'facebook', count)
+    
+    @run_scoped
+    async def run(self) -> bool:
+        """Main execution method."""
+        try:
+            logger.info("Starting async Facebook bot execution...")
+            if self.facebook.is_down():
+                logger.warning("⛔ Facebook circuit is open; skipping this run")
+                return False
+            prefetch = self.prefetch()
+            await self.settle_outbox()
+            
+            article = await self.article_source()
+            if not article:
+                logger.info("No new articles to post")
+                return False
+                
+            logger.info(f"Found article: {article.get('title', 'Unknown')}")
+            
+            if not self.has_pending_post(article):
+                logger.info("Article already posted or awaiting retry according to the outbox")
+                return False
+                
+            post_text = await self.generate_copy(article)
+            if not post_text:
+                logger.error("Failed to generate Facebook post")
+                return False
+                
+            logger.info(f"Generated Facebook post: {post_text[:100]}...")
+            
+            await prefetch
+            if not await self.publish_copy(article, post_text):
+                logger.error("Failed to post to Facebook")
+                return False
+                
+            finish_run()
+            if await self.supabase.mark_article_as_posted(article['id'], 'facebook'):
+                self.outbox.record_acked([article['id']], 'facebook')
+                logger.info("Successfully completed Facebook post cycle")
+            else:
+                logger.warning("Facebook post successful but failed to mark article as posted")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error in Facebook bot execution: {e}")
+            return False
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Post the latest unposted article to Facebook.")
+    parser.add_argument('--batch', type=int, default=None, metavar='N',
+                        help="Post up to N pending articles in this run")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Run on an asyncio event loop (requires aiohttp)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main entry point."""
+    args = parse_args(argv)
     try:
-        bot = FacebookBot()
-        success = bot.run()
+        if args.use_async:
+            bot = AsyncFacebookBot()
+            success = async_transport.run(bot.run_batch(args.batch) if args.batch else bot.run())
+        else:
+            bot = FacebookBot()
+            success = bot.run_batch(args.batch) if args.batch else bot.run()
         
         if success:
             logger.info("Facebook bot completed successfully")
         else:
             logger.warning("Facebook bot completed with issues")
             
+        http_transport.log_connection_stats()
+            
     except Exception as e:
         logger.error(f"Fatal error in main: {e}")
         return 1
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of generated social copy.
+Generated copy is stored in a local SQLite (WAL) table keyed by a hash of the
+article text, platform, prompt version, model and temperature, so reruns,
+outbox retries and other bot processes on the same host reuse it instead of
+paying for another chat completion. Entries expire after a TTL and the least
+recently used ones are evicted to stay under the entry and size limits.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import functools
+from typing import Any, Callable, Dict, Optional
+import logging
+from bot_state import state_path
+
+logger = logging.getLogger(__name__)
+
+# Article fields that end up in the prompt or the finished copy. Only these go
+# into the key, so articles fetched with different column lists (the bots'
+# queries, pre-generation, the master bot's shared query) share entries.
+KEY_FIELDS = ['title', 'ai_summary', 'seo_description', 'summary', 'content', 'affiliate_url']
+
+# Characters of content the prompts use; bots only fetch this much of it
+CONTENT_KEY_CHARS = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    key TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_generations_accessed_at ON generations(accessed_at);
+"""
+
+def cache_key(article: Dict, platform: str, prompt_version: int, model: str, temperature: float) -> str:
+    """Hash everything that determines the generated copy for an article."""
+    fields = {field: article.get(field) for field in KEY_FIELDS}
+    if fields['content']:
+        fields['content'] = fields['content'][:CONTENT_KEY_CHARS]
+    material = {
+        'article': fields,
+        'platform': platform,
+        'prompt_version': prompt_version,
+        'model': model,
+        'temperature': temperature
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode('utf-8')).hexdigest()
+
+class GenerationCache:
+    """SQLite-backed LRU/TTL cache shared by every bot process on the host."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or state_path('generation_cache.sqlite3')
+        self.ttl = float(os.getenv('GENERATION_CACHE_TTL', str(7 * 24 * 3600)))
+        self.max_entries = int(os.getenv('GENERATION_CACHE_MAX_ENTRIES', '5000'))
+        self.max_bytes = int(os.getenv('GENERATION_CACHE_MAX_BYTES', str(10 * 1024 * 1024)))
+        # Batch runs generate on several threads; SQLite connections are per thread
+        self.local = threading.local()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for a key, or None when missing or expired."""
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute('SELECT value FROM generations WHERE key = ? AND created_at > ?',
+                           (key, now - self.ttl)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE generations SET accessed_at = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, platform: str, value: Any) -> None:
+        """Store a value and evict expired and least recently used entries."""
+        now = time.time()
+        encoded = json.dumps(value)
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO generations (key, platform, value, size, created_at, accessed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (key, platform, encoded, len(encoded), now, now)
+        )
+        self.evict(now)
+
+    def evict(self, now: Optional[float] = None) -> None:
+        """Drop expired entries, then the least recently used until under the limits."""
+        now = now or time.time()
+        conn = self._conn()
+        conn.execute('DELETE FROM generations WHERE created_at <= ?', (now - self.ttl,))
+
+        count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations').fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        excess_entries = max(0, count - self.max_entries)
+        excess_bytes = max(0, total - self.max_bytes)
+        keys = []
+        for key, size in conn.execute('SELECT key, size FROM generations ORDER BY accessed_at'):
+            if excess_entries <= 0 and excess_bytes <= 0:
+                break
+            keys.append((key,))
+            excess_entries -= 1
+            excess_bytes -= size
+        conn.executemany('DELETE FROM generations WHERE key = ?', keys)
+
+_cache: Optional[GenerationCache] = None
+_cache_lock = threading.Lock()
+
+def get_generation_cache() -> GenerationCache:
+    """Return the process-wide generation cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GenerationCache()
+        return _cache
+
+def cached_generation(platform: str, prompt_version: int = 1) -> Callable:
+    """Cache a generate_* method's result per article.
+
+    The wrapped method's client must expose model and temperature. Bump
+    prompt_version whenever the prompt changes so stale copy is not reused.
+    Failed generations (None) are not cached. The wrapper exposes platform and
+    prompt_version so copy generated elsewhere can be stored under its key.
+    """
+    def decorator(generate: Callable) -> Callable:
+        @functools.wraps(generate)
+        def wrapper(self, article: Dict):
+            cache = get_generation_cache()
+            if not cache.enabled:
+                return generate(self, article)
+
+            key = generation_key(wrapper, self, article)
+            try:
+                cached = cache.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"Generation cache unavailable: {e}")
+                return generate(self, article)
+
+            if cached is not None:
+                logger.info(f"♻️  Reusing cached {platform} copy for: {article.get('title', 'Unknown')}")
+                return cached
+
+            result = generate(self, article)
+            if result is not None:
+                try:
+                    cache.put(key, platform, result)
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not cache generated {platform} copy: {e}")
+            return result
+        wrapper.platform = platform
+        wrapper.prompt_version = prompt_version
+        return wrapper
+    return decorator
+
+def generation_key(generate: Callable, client: Any, article: Dict) -> str:
+    """Return the key a cached_generation method would look an article up under."""
+    return cache_key(article, generate.platform, generate.prompt_version, client.model, client.temperature)
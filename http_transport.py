@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP transport for the social media bots.
+Keeps one keep-alive requests.Session per host so repeated calls to Supabase,
+OpenAI and the platform APIs reuse their TCP/TLS connections, and applies
+default connect/read timeouts to every request.
+"""
+
+import os
+import gzip
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+import logging
+from retry_policy import RetryPolicy, is_connect_failure, send_with_retry
+from run_budget import cap_timeout
+from circuit_breaker import CircuitOpenError, circuit_key, get_circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+# Request bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+_sessions: Dict[str, requests.Session] = {}
+_request_counts: Dict[str, int] = {}
+_lock = threading.Lock()
+
+def default_timeout() -> Tuple[float, float]:
+    """Return the default (connect, read) timeouts in seconds."""
+    return (
+        float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+        float(os.getenv('HTTP_READ_TIMEOUT', '60'))
+    )
+
+def _host_key(url: str) -> str:
+    """Return the scheme://host[:port] part of a URL."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def get_session(url: str) -> requests.Session:
+    """Return the shared keep-alive session for the URL's host."""
+    key = _host_key(url)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            # The master bot can run all four bots against the same host at once
+            adapter = HTTPAdapter(
+                pool_connections=int(os.getenv('HTTP_POOL_CONNECTIONS', '4')),
+                pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', '16'))
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[key] = session
+        return session
+
+def request(method: str, url: str,
+            timeout: Optional[Union[float, Tuple[float, float]]] = None,
+            compress: bool = False, idempotent: Optional[bool] = None,
+            retry: Optional[RetryPolicy] = None, deadline: Optional[float] = None,
+            **kwargs) -> requests.Response:
+    """Send a request over the host's pooled session.
+
+    compress gzips a JSON body before sending; only use it for endpoints that
+    accept Content-Encoding: gzip. Throttled requests are always retried;
+    server errors only when the request is idempotent, which defaults to every
+    method except POST. deadline is a time.monotonic() timestamp that bounds
+    how long retries may wait. Inside a bot run, timeouts are shortened to the
+    run's remaining budget. Raises CircuitOpenError without sending anything
+    while the endpoint's circuit is open.
+    """
+    if compress and kwargs.get('json') is not None:
+        body = json.dumps(kwargs.pop('json')).encode('utf-8')
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['Content-Type'] = 'application/json'
+        if len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        kwargs['data'] = body
+        kwargs['headers'] = headers
+
+    if idempotent is None:
+        idempotent = method.upper() != 'POST'
+    if retry is None:
+        retry = RetryPolicy(retry_server_errors=idempotent)
+
+    key = _host_key(url)
+    circuit = circuit_key(url)
+    breaker = get_circuit_breaker()
+    if not breaker.allow(circuit):
+        raise CircuitOpenError(f"circuit open for {circuit}; not sending {method.upper()}")
+    session = get_session(url)
+
+    def send() -> requests.Response:
+        with _lock:
+            _request_counts[key] = _request_counts.get(key, 0) + 1
+        # Each attempt only gets what is left of the run's budget
+        return session.request(method, url, timeout=cap_timeout(timeout or default_timeout()), **kwargs)
+
+    try:
+        response = send_with_retry(send, retry, deadline, description=f"{method.upper()} {key}")
+    except requests.exceptions.RequestException as e:
+        breaker.record(circuit, error=e)
+        raise
+    # One outcome per call, after retries, so a single bad run does not trip it
+    breaker.record(circuit, response=response)
+    return response
+
+def get(url: str, **kwargs) -> requests.Response:
+    """Send a GET request over the shared session."""
+    return request('GET', url, **kwargs)
+
+def post(url: str, **kwargs) -> requests.Response:
+    """Send a POST request over the shared session."""
+    return request('POST', url, **kwargs)
+
+def patch(url: str, **kwargs) -> requests.Response:
+    """Send a PATCH request over the shared session."""
+    return request('PATCH', url, **kwargs)
+
+def preconnect(url: str) -> bool:
+    """Open a TCP/TLS connection to the URL's host and park it in the pool.
+
+    The next request to the host then skips the handshake. Returns False if
+    the host could not be reached.
+    """
+    session = get_session(url)
+    adapter = session.get_adapter(url)
+    try:
+        if hasattr(adapter, 'get_connection_with_tls_context'):
+            pool = adapter.get_connection_with_tls_context(
+                requests.Request('GET', url).prepare(), verify=session.verify)
+        else:
+            pool = adapter.get_connection(url)
+            # Apply the same certificate settings a request would
+            adapter.cert_verify(pool, url, session.verify, None)
+        conn = pool._get_conn()
+        try:
+            conn.timeout = default_timeout()[0]
+            conn.connect()
+        except Exception:
+            conn.close()
+            raise
+        finally:
+            pool._put_conn(conn)
+        return True
+    except Exception as e:
+        logger.debug(f"Could not pre-connect to {_host_key(url)}: {e}")
+        return False
+
+def is_ambiguous_failure(error: Exception) -> bool:
+    """Return True if a failed request may still have reached the server.
+
+    A connect failure (timeout, refused connection, DNS or TLS error) never
+    did, but a read timeout or a dropped connection after sending can hide a
+    post the platform already accepted.
+    """
+    if is_connect_failure(error):
+        return False
+    return isinstance(error, (requests.exceptions.Timeout,
+                              requests.exceptions.ConnectionError,
+                              requests.exceptions.ChunkedEncodingError))
+
+def get_connection_stats() -> Dict[str, Dict[str, int]]:
+    """Return per-host request, new connection and reused connection counts."""
+    stats = {}
+    with _lock:
+        sessions = dict(_sessions)
+        request_counts = dict(_request_counts)
+
+    for key, session in sessions.items():
+        new_connections = 0
+        for adapter in set(session.adapters.values()):
+            for pool_key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(pool_key)
+                if pool is not None:
+                    new_connections += pool.num_connections
+
+        requests_sent = request_counts.get(key, 0)
+        stats[key] = {
+            'requests': requests_sent,
+            'new_connections': new_connections,
+            'reused_connections': max(requests_sent - new_connections, 0)
+        }
+
+    return stats
+
+def log_connection_stats() -> None:
+    """Log connection reuse per host."""
+    for host, counts in get_connection_stats().items():
+        logger.info(
+            f"🔌 {host}: {counts['requests']} requests, "
+            f"{counts['new_connections']} new connections, "
+            f"{counts['reused_connections']} reused"
+        )
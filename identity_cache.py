@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of platform access tokens and identities.
+Keeps values like the Reddit access token, the LinkedIn person id, the Facebook
+page and the Twitter user in a state file with an expiry, so a post costs a
+single request to the platform instead of two or three. Entries close to
+expiry are refreshed in a background thread while the cached value is still
+served.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import logging
+from bot_state import state_path
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = 'identity_cache.json'
+
+# Coroutine returning (value, ttl seconds), or None on failure
+AsyncFetch = Callable[[], Awaitable[Optional[Tuple[Any, float]]]]
+
+# Identities (person, page and user ids) rarely change; re-check them daily
+IDENTITY_TTL = 24 * 3600
+
+def credential_key(*parts: Optional[str]) -> str:
+    """Return a short hash of credentials, so entries follow a credential change without storing it."""
+    return hashlib.sha256('\0'.join(part or '' for part in parts).encode('utf-8')).hexdigest()[:16]
+
+class IdentityCache:
+    """Expiring key/value cache shared by the bot processes through a state file."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or state_path(CACHE_FILE)
+        # Refresh once less than this fraction of an entry's lifetime is left
+        self.refresh_ahead = float(os.getenv('IDENTITY_REFRESH_AHEAD', '0.2'))
+        self.lock = threading.Lock()
+        self.refreshing: Dict[str, threading.Thread] = {}
+        self.refreshing_tasks: Dict[str, asyncio.Future] = {}
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries: Dict) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            # Tokens live here, so keep the file private to the bot's user
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write identity cache: {e}")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return an unexpired value, or None."""
+        with self.lock:
+            entry = self._load().get(key)
+        if entry and entry['expires_at'] > time.time():
+            return entry['value']
+        return None
+
+    def put(self, key: str, value: Any, ttl: float) -> None:
+        with self.lock:
+            entries = self._load()
+            now = time.time()
+            entries = {k: v for k, v in entries.items() if v['expires_at'] > now}
+            entries[key] = {'value': value, 'expires_at': now + ttl, 'ttl': ttl}
+            self._save(entries)
+
+    def invalidate(self, key: str) -> None:
+        """Drop an entry, e.g. after the platform rejected the cached token."""
+        with self.lock:
+            entries = self._load()
+            if entries.pop(key, None) is not None:
+                self._save(entries)
+
+    def _fetch(self, key: str, fetch: Callable[[], Optional[Tuple[Any, float]]]) -> Optional[Any]:
+        result = fetch()
+        if result is None:
+            return None
+        value, ttl = result
+        self.put(key, value, ttl)
+        return value
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Optional[Tuple[Any, float]]]) -> None:
+        with self.lock:
+            if key in self.refreshing and self.refreshing[key].is_alive():
+                return
+
+            def refresh():
+                try:
+                    if self._fetch(key, fetch) is not None:
+                        logger.info(f"🔑 Refreshed cached {key.split(':')[0]} credentials ahead of expiry")
+                except Exception as e:
+                    logger.warning(f"Background refresh of {key} failed: {e}")
+
+            thread = threading.Thread(target=refresh, name=f"refresh-{key}", daemon=True)
+            self.refreshing[key] = thread
+        thread.start()
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], Optional[Tuple[Any, float]]]) -> Optional[Any]:
+        """Return the cached value, fetching it when missing or expired.
+
+        fetch returns (value, ttl seconds), or None on failure, which is not
+        cached. A value within the refresh window is returned right away and
+        refreshed in the background.
+        """
+        with self.lock:
+            entry = self._load().get(key)
+
+        now = time.time()
+        if entry and entry['expires_at'] > now:
+            if entry['expires_at'] - now < entry.get('ttl', 0) * self.refresh_ahead:
+                self._refresh_in_background(key, fetch)
+            return entry['value']
+        return self._fetch(key, fetch)
+
+    async def get_or_fetch_async(self, key: str, fetch: AsyncFetch) -> Optional[Any]:
+        """Like get_or_fetch, for a coroutine fetch; refreshes run as event loop tasks."""
+        with self.lock:
+            entry = self._load().get(key)
+
+        now = time.time()
+        if entry and entry['expires_at'] > now:
+            if entry['expires_at'] - now < entry.get('ttl', 0) * self.refresh_ahead:
+                task = self.refreshing_tasks.get(key)
+                if task is None or task.done():
+                    self.refreshing_tasks[key] = asyncio.ensure_future(self._refresh_async(key, fetch))
+            return entry['value']
+        return await self._fetch_async(key, fetch)
+
+    async def _fetch_async(self, key: str, fetch: AsyncFetch) -> Optional[Any]:
+        result = await fetch()
+        if result is None:
+            return None
+        value, ttl = result
+        self.put(key, value, ttl)
+        return value
+
+    async def _refresh_async(self, key: str, fetch: AsyncFetch) -> None:
+        try:
+            if await self._fetch_async(key, fetch) is not None:
+                logger.info(f"🔑 Refreshed cached {key.split(':')[0]} credentials ahead of expiry")
+        except Exception as e:
+            logger.warning(f"Background refresh of {key} failed: {e}")
+
+_cache: Optional[IdentityCache] = None
+_cache_lock = threading.Lock()
+
+def get_identity_cache() -> IdentityCache:
+    """Return the process-wide identity cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = IdentityCache()
+        return _cache
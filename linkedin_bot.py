@@ -6,10 +6,27 @@ Retrieves latest article from Supabase, summarizes it, and posts to LinkedIn.
 
 import os
 import json
-import requests
+import asyncio
+import argparse
+import http_transport
+import async_transport
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List
+from typing import Awaitable, Callable, Dict, Optional, List
 import logging
+from article_queries import (fetch_next_unposted, fetch_next_unposted_async, mark_articles_posted,
+                            mark_articles_posted_async)
+from batch_posting import run_batch, run_batch_async
+from post_outbox import DEFERRED_ERRORS, PostDeferred, PostOutbox
+from posting_scheduler import get_scheduler
+from multi_platform_generator import finish_linkedin_post, get_precomputed_copy
+from generation_cache import cached_generation
+from llm_router import generate_async, get_llm_router
+from prompt_builder import build_prompt_source, log_token_usage, trim_to_chars
+from template_generator import fallback_copy
+from run_prefetch import Prefetch
+from run_budget import finish_run, run_scoped
+from circuit_breaker import get_circuit_breaker
+from identity_cache import IDENTITY_TTL, credential_key, get_identity_cache
 try:
     from dotenv import load_dotenv
 except ImportError:
@@ -47,26 +64,15 @@ class SupabaseClient:
             'Content-Type': 'application/json'
         }
     
-    def get_latest_article(self) -> Optional[Dict]:
-        """Retrieve the latest article from the database."""
+    def get_latest_article(self, accept: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        """Retrieve the newest article not yet posted to LinkedIn."""
         try:
-            # Query for the most recent article that hasn't been posted to LinkedIn
-            response = requests.get(
-                f"{self.url}/rest/v1/articles",
-                headers=self.headers,
-                params={
-                    'select': '*',
-                    'order': 'published_at.desc',
-                    'limit': '1'
-                }
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data and len(data) > 0:
-                    return data[0]
+            # Filter on posted_to_linkedin_at server-side and fetch only the columns we use
+            article = fetch_next_unposted(self.url, self.headers, 'linkedin', accept)
+            if article:
+                return article
             
-            logger.warning("No articles found in database")
+            logger.warning("No unposted articles found in database")
             return None
             
         except Exception as e:
@@ -79,7 +85,7 @@ class SupabaseClient:
             # Add platform-specific posted timestamp
             field_name = f"posted_to_{platform}_at"
             
-            response = requests.patch(
+            response = http_transport.patch(
                 f"{self.url}/rest/v1/articles",
                 headers=self.headers,
                 json={
@@ -88,7 +94,7 @@ class SupabaseClient:
                 params={'id': f'eq.{article_id}'}
             )
             
-            if response.status_code == 200:
+            if response.status_code in (200, 204):
                 logger.info(f"Marked article {article_id} as posted to {platform}")
                 return True
             else:
@@ -103,31 +109,18 @@ class OpenAIClient:
     """Client for OpenAI API to generate LinkedIn post content."""
     
     def __init__(self):
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
-            raise ValueError("OpenAI API key must be set in environment variables")
-        
-        self.base_url = "https://api.openai.com/v1"
-        self.headers = {
-            'Authorization': f'Bearer {self.api_key}',
-            'Content-Type': 'application/json'
-        }
+        # Sends each completion to the fastest healthy configured provider
+        self.router = get_llm_router()
+        self.model = 'gpt-3.5-turbo'
+        self.temperature = 0.7
     
+    @cached_generation('linkedin', prompt_version=3)
     def generate_linkedin_post(self, article: Dict) -> Optional[str]:
         """Generate a LinkedIn post from article content."""
         try:
-            # Prepare the content for summarization
-            title = article.get('title', '')
-            summary = article.get('summary', '')
-            content = article.get('content', '')
-            
-            # Use the most available content
-            text_to_summarize = title
-            if summary:
-                text_to_summarize += f"\n\n{summary}"
-            elif content:
-                # Truncate content if too long
-                text_to_summarize += f"\n\n{content[:500]}..."
+            # Budget the article text by tokens for this platform
+            plan = build_prompt_source(article, 'linkedin')
+            text_to_summarize = plan['text']
             
             prompt = f"""
             Create an engaging LinkedIn post about this article. The post should:
@@ -142,42 +135,31 @@ class OpenAIClient:
             Format: Professional post with hashtags at the end
             """
             
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={
-                    'model': 'gpt-3.5-turbo',
-                    'messages': [
-                        {
-                            'role': 'system',
-                            'content': 'You are a professional content creator who writes engaging LinkedIn posts about tech and business articles.'
-                        },
-                        {
-                            'role': 'user',
-                            'content': prompt
-                        }
-                    ],
-                    'max_tokens': 300,
-                    'temperature': 0.7
-                }
-            )
+            result = self.router.stream_text({
+                'model': self.model,
+                'messages': [
+                    {
+                        'role': 'system',
+                        'content': 'You are a professional content creator who writes engaging LinkedIn posts about tech and business articles.'
+                    },
+                    {
+                        'role': 'user',
+                        'content': prompt
+                    }
+                ],
+                'max_tokens': plan['max_tokens'],
+                'temperature': self.temperature
+            }, plan['max_chars'])
             
-            if response.status_code == 200:
-                result = response.json()
-                post_text = result['choices'][0]['message']['content'].strip()
-                
-                # Add affiliate link if available
-                affiliate_url = article.get('affiliate_url')
-                if affiliate_url and len(post_text) < 1200:  # Leave room for URL
-                    post_text += f"\n\nRead more: {affiliate_url}"
-                
-                # Ensure post is under LinkedIn's character limit
-                if len(post_text) > 1300:
-                    post_text = post_text[:1297] + "..."
+            if result:
+                log_token_usage('linkedin', plan, result)
+                # Reading stopped at the length budget; end on a clean boundary
+                post_text = trim_to_chars(result['text'].strip(), plan['max_chars'])
                 
-                return post_text
+                # Add affiliate link and enforce LinkedIn's character limit
+                return finish_linkedin_post(post_text, article)
             else:
-                logger.error(f"OpenAI API error: {response.status_code} - {response.text}")
+                logger.error("Failed to get a completion from any LLM provider")
                 return None
                 
         except Exception as e:
@@ -195,6 +177,9 @@ class LinkedInClient:
         if not all([self.access_token, self.client_id, self.client_secret]):
             raise ValueError("LinkedIn API credentials must be set in environment variables")
         
+        self.account = self.client_id
+        self.scheduler = get_scheduler()
+        self.identity = get_identity_cache()
         self.base_url = "https://api.linkedin.com/v2"
         self.headers = {
             'Authorization': f'Bearer {self.access_token}',
@@ -205,7 +190,7 @@ class LinkedInClient:
     def get_user_profile(self) -> Optional[Dict]:
         """Get current user's LinkedIn profile."""
         try:
-            response = requests.get(
+            response = http_transport.get(
                 f"{self.base_url}/me",
                 headers=self.headers
             )
@@ -220,45 +205,59 @@ class LinkedInClient:
             logger.error(f"Error getting LinkedIn profile: {e}")
             return None
     
+    def is_down(self) -> bool:
+        """Return True while the circuit of the posting endpoint is open."""
+        return get_circuit_breaker().is_open(f"{self.base_url}/ugcPosts")
+    
+    def build_post_data(self, user_id: str, text: str, article_url: Optional[str] = None) -> Dict:
+        """Return the ugcPosts body for a share, with the article attached if given."""
+        post_data = {
+            "author": f"urn:li:person:{user_id}",
+            "lifecycleState": "PUBLISHED",
+            "specificContent": {
+                "com.linkedin.ugc.ShareContent": {
+                    "shareCommentary": {
+                        "text": text
+                    },
+                    "shareMediaCategory": "NONE"
+                }
+            },
+            "visibility": {
+                "com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"
+            }
+        }
+        
+        # Add article URL if provided
+        if article_url:
+            post_data["specificContent"]["com.linkedin.ugc.ShareContent"]["media"] = [{
+                "status": "READY",
+                "description": {
+                    "text": "Read the full article"
+                },
+                "media": article_url,
+                "title": {
+                    "text": "Article Link"
+                }
+            }]
+            post_data["specificContent"]["com.linkedin.ugc.ShareContent"]["shareMediaCategory"] = "ARTICLE"
+        
+        return post_data
+    
     def post_article(self, text: str, article_url: Optional[str] = None) -> Optional[str]:
         """Post an article to LinkedIn."""
         try:
             # Prepare the post data
-            post_data = {
-                "author": f"urn:li:person:{self.get_user_id()}",
-                "lifecycleState": "PUBLISHED",
-                "specificContent": {
-                    "com.linkedin.ugc.ShareContent": {
-                        "shareCommentary": {
-                            "text": text
-                        },
-                        "shareMediaCategory": "NONE"
-                    }
-                },
-                "visibility": {
-                    "com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"
-                }
-            }
+            post_data = self.build_post_data(self.get_user_id(), text, article_url)
             
-            # Add article URL if provided
-            if article_url:
-                post_data["specificContent"]["com.linkedin.ugc.ShareContent"]["media"] = [{
-                    "status": "READY",
-                    "description": {
-                        "text": "Read the full article"
-                    },
-                    "media": article_url,
-                    "title": {
-                        "text": "Article Link"
-                    }
-                }]
-                post_data["specificContent"]["com.linkedin.ugc.ShareContent"]["shareMediaCategory"] = "ARTICLE"
+            if not self.scheduler.acquire('linkedin', self.account):
+                raise PostDeferred("LinkedIn posting quota exhausted for this run")
             
-            response = requests.post(
+            response = http_transport.post(
                 f"{self.base_url}/ugcPosts",
                 headers=self.headers,
                 json=post_data
             )
+            self.scheduler.observe('linkedin', self.account, response)
             
             if response.status_code == 201:
                 result = response.json()
@@ -269,55 +268,124 @@ class LinkedInClient:
                 logger.error(f"LinkedIn API error: {response.status_code} - {response.text}")
                 return None
                 
+        except DEFERRED_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Error posting to LinkedIn: {e}")
+            # The platform may have accepted the post; let the outbox decide
+            if http_transport.is_ambiguous_failure(e):
+                raise
             return None
     
     def get_user_id(self) -> str:
-        """Get the current user's LinkedIn ID."""
-        profile = self.get_user_profile()
-        if profile:
-            return profile.get('id', '')
-        return 'default_user_id'
+        """Get the current user's LinkedIn ID, cached across runs."""
+        def fetch():
+            profile = self.get_user_profile()
+            return (profile['id'], IDENTITY_TTL) if profile and profile.get('id') else None
+        
+        user_id = self.identity.get_or_fetch(f"linkedin:person:{credential_key(self.access_token)}", fetch)
+        return user_id or 'default_user_id'
 
 class LinkedInBot:
     """Main bot class that orchestrates the LinkedIn posting process."""
     
-    def __init__(self):
+    def __init__(self, article_source: Optional[Callable[[], Optional[Dict]]] = None):
         self.supabase = SupabaseClient()
+        # Callers such as master_social_bot can inject an already-fetched article
+        self.article_source = article_source or self.next_article
         self.openai = OpenAIClient()
         self.linkedin = LinkedInClient()
+        self.outbox = PostOutbox()
+    
+    def post_payload(self, payload: Dict) -> Optional[str]:
+        """Post a payload stored in the outbox."""
+        return self.linkedin.post_article(payload['text'], payload.get('url'))
+    
+    def settle_outbox(self) -> None:
+        """Retry due dead letters and acknowledge posts left unmarked by earlier runs."""
+        self.outbox.retry_due('linkedin', self.post_payload)
+        self.outbox.replay_acks(
+            'linkedin',
+            lambda article_ids: mark_articles_posted(self.supabase.url, self.supabase.headers, 'linkedin', article_ids)
+        )
+    
+    def has_pending_post(self, article: Dict) -> bool:
+        """Return True if the outbox allows posting the article."""
+        return self.outbox.can_post(article['id'], 'linkedin', self.linkedin.account)
+    
+    def next_article(self) -> Optional[Dict]:
+        """Return the newest unposted article the outbox allows posting now."""
+        return self.supabase.get_latest_article(accept=self.has_pending_post)
+    
+    def generate_copy(self, article: Dict) -> Optional[str]:
+        """Return the post text, preferring copy the master bot generated.
+        
+        Falls back to template copy when the LLM is slow, over budget or failing.
+        """
+        return (get_precomputed_copy(article, 'linkedin') or self.openai.generate_linkedin_post(article)
+                or fallback_copy(article, 'linkedin'))
+    
+    def publish_copy(self, article: Dict, post_text: str) -> bool:
+        """Post to LinkedIn at most once per article."""
+        affiliate_url = article.get('affiliate_url')
+        return bool(self.outbox.publish(article['id'], 'linkedin', self.linkedin.account,
+                                        {'text': post_text, 'url': affiliate_url or None}, self.post_payload))
     
+    def prefetch(self) -> Prefetch:
+        """Start the steps that do not need the article: the profile lookup and connection warm-up."""
+        return Prefetch({
+            'identity': self.linkedin.get_user_id,
+            'platform': lambda: http_transport.preconnect(self.linkedin.base_url),
+            'llm': lambda: self.openai.router.preconnect(self.openai.model)
+        })
+    
+    @run_scoped
+    def run_batch(self, count: int) -> bool:
+        """Post up to count pending articles in one run."""
+        return run_batch(self, 'linkedin', count)
+    
+    @run_scoped
     def run(self) -> bool:
         """Main execution method."""
         try:
             logger.info("Starting LinkedIn bot execution...")
+            if self.linkedin.is_down():
+                logger.warning("⛔ LinkedIn circuit is open; skipping this run")
+                return False
+            # Auth and connection warm-up overlap the article query and generation
+            prefetch = self.prefetch()
+            self.settle_outbox()
             
             # Get latest article
-            article = self.supabase.get_latest_article()
+            article = self.article_source()
             if not article:
                 logger.info("No new articles to post")
                 return False
             
             logger.info(f"Found article: {article.get('title', 'Unknown')}")
             
+            if not self.has_pending_post(article):
+                logger.info("Article already posted or awaiting retry according to the outbox")
+                return False
+            
             # Generate LinkedIn post
-            post_text = self.openai.generate_linkedin_post(article)
+            post_text = self.generate_copy(article)
             if not post_text:
                 logger.error("Failed to generate LinkedIn post")
                 return False
             
             logger.info(f"Generated LinkedIn post: {post_text[:100]}...")
             
-            # Post to LinkedIn
-            affiliate_url = article.get('affiliate_url')
-            post_id = self.linkedin.post_article(post_text, affiliate_url if affiliate_url else None)
-            if not post_id:
+            prefetch.wait()
+            # Post to LinkedIn at most once per article
+            if not self.publish_copy(article, post_text):
                 logger.error("Failed to post to LinkedIn")
                 return False
             
-            # Mark article as posted
+            # Mark article as posted, using the reserve held back for it
+            finish_run()
             if self.supabase.mark_article_as_posted(article['id'], 'linkedin'):
+                self.outbox.record_acked([article['id']], 'linkedin')
                 logger.info("Successfully completed LinkedIn post cycle")
                 return True
             else:
@@ -328,17 +396,222 @@ class LinkedInBot:
             logger.error(f"Error in LinkedIn bot execution: {e}")
             return False
 
-def main():
+class AsyncSupabaseClient(SupabaseClient):
+    """SupabaseClient with coroutine methods for the asyncio bots."""
+    
+    async def get_latest_article(self, accept: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        """Retrieve the newest article not yet posted to LinkedIn."""
+        try:
+            article = await fetch_next_unposted_async(self.url, self.headers, 'linkedin', accept)
+            if article:
+                return article
+                
+            logger.warning("No unposted articles found in database")
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error retrieving latest article: {e}")
+            return None
+    
+    async def mark_article_as_posted(self, article_id: str, platform: str) -> bool:
+        """Mark an article as posted to a specific platform."""
+        try:
+            return await mark_articles_posted_async(self.url, self.headers, platform, [article_id])
+        except Exception as e:
+            logger.error(f"Error marking article as posted to {platform}: {e}")
+            return False
+
+class AsyncOpenAIClient(OpenAIClient):
+    """OpenAIClient whose generation runs off the event loop."""
+    
+    async def generate_linkedin_post(self, article: Dict) -> Optional[str]:
+        """Generate a LinkedIn post from article content."""
+        return await generate_async(super().generate_linkedin_post, article)
+
+class AsyncLinkedInClient(LinkedInClient):
+    """LinkedInClient with coroutine methods for the asyncio bots."""
+    
+    async def get_user_profile(self) -> Optional[Dict]:
+        """Get current user's LinkedIn profile."""
+        try:
+            response = await async_transport.get(f"{self.base_url}/me", headers=self.headers)
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"Error getting LinkedIn profile: {response.status_code}")
+                return None
+                
+        except Exception as e:
+            logger.error(f"Error getting LinkedIn profile: {e}")
+            return None
+    
+    async def post_article(self, text: str, article_url: Optional[str] = None) -> Optional[str]:
+        """Post an article to LinkedIn."""
+        try:
+            post_data = self.build_post_data(await self.get_user_id(), text, article_url)
+            
+            if not await self.scheduler.acquire_async('linkedin', self.account):
+                raise PostDeferred("LinkedIn posting quota exhausted for this run")
+                
+            response = await async_transport.post(
+                f"{self.base_url}/ugcPosts",
+                headers=self.headers,
+                json=post_data
+            )
+            self.scheduler.observe('linkedin', self.account, response)
+            
+            if response.status_code == 201:
+                post_id = response.json().get('id')
+                logger.info(f"Successfully posted to LinkedIn: {post_id}")
+                return post_id
+            else:
+                logger.error(f"LinkedIn API error: {response.status_code} - {response.text}")
+                return None
+                
+        except DEFERRED_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Error posting to LinkedIn: {e}")
+            if http_transport.is_ambiguous_failure(e):
+                raise
+            return None
+    
+    async def get_user_id(self) -> str:
+        """Get the current user's LinkedIn ID, cached across runs."""
+        async def fetch():
+            profile = await self.get_user_profile()
+            return (profile['id'], IDENTITY_TTL) if profile and profile.get('id') else None
+            
+        user_id = await self.identity.get_or_fetch_async(f"linkedin:person:{credential_key(self.access_token)}",
+                                                         fetch)
+        return user_id or 'default_user_id'
+
+class AsyncLinkedInBot(LinkedInBot):
+    """LinkedInBot driven by an event loop; run() and run_batch() are coroutines."""
+    
+    def __init__(self, article_source: Optional[Callable[[], Awaitable[Optional[Dict]]]] = None):
+        self.supabase = AsyncSupabaseClient()
+        self.article_source = article_source or self.next_article
+        self.openai = AsyncOpenAIClient()
+        self.linkedin = AsyncLinkedInClient()
+        self.outbox = PostOutbox()
+    
+    async def post_payload(self, payload: Dict) -> Optional[str]:
+        """Post a payload stored in the outbox."""
+        return await self.linkedin.post_article(payload['text'], payload.get('url'))
+    
+    async def settle_outbox(self) -> None:
+        """Retry due dead letters and acknowledge posts left unmarked by earlier runs."""
+        await self.outbox.retry_due_async('linkedin', self.post_payload)
+        await self.outbox.replay_acks_async(
+            'linkedin',
+            lambda article_ids: mark_articles_posted_async(self.supabase.url, self.supabase.headers, 'linkedin',
+                                                           article_ids)
+        )
+    
+    async def next_article(self) -> Optional[Dict]:
+        """Return the newest unposted article the outbox allows posting now."""
+        return await self.supabase.get_latest_article(accept=self.has_pending_post)
+    
+    async def generate_copy(self, article: Dict) -> Optional[str]:
+        """Return the post text, preferring precomputed copy and falling back to a template."""
+        return (get_precomputed_copy(article, 'linkedin') or await self.openai.generate_linkedin_post(article)
+                or fallback_copy(article, 'linkedin'))
+    
+    async def publish_copy(self, article: Dict, post_text: str) -> bool:
+        """Post to LinkedIn at most once per article."""
+        affiliate_url = article.get('affiliate_url')
+        return bool(await self.outbox.publish_async(article['id'], 'linkedin', self.linkedin.account,
+                                                    {'text': post_text, 'url': affiliate_url or None},
+                                                    self.post_payload))
+    
+    def prefetch(self) -> asyncio.Future:
+        """Start the profile lookup and LLM connection warm-up while the article is fetched."""
+        return asyncio.gather(
+            self.linkedin.get_user_id(),
+            asyncio.to_thread(self.openai.router.preconnect, self.openai.model),
+            return_exceptions=True
+        )
+    
+    @run_scoped
+    async def run_batch(self, count: int) -> bool:
+        """Post up to count pending articles in one run."""
+        return await run_batch_async(self, 'linkedin', count)
+    
+    @run_scoped
+    async def run(self) -> bool:
+        """Main execution method."""
+        try:
+            logger.info("Starting async LinkedIn bot execution...")
+            if self.linkedin.is_down():
+                logger.warning("⛔ LinkedIn circuit is open; skipping this run")
+                return False
+            prefetch = self.prefetch()
+            await self.settle_outbox()
+            
+            article = await self.article_source()
+            if not article:
+                logger.info("No new articles to post")
+                return False
+                
+            logger.info(f"Found article: {article.get('title', 'Unknown')}")
+            
+            if not self.has_pending_post(article):
+                logger.info("Article already posted or awaiting retry according to the outbox")
+                return False
+                
+            post_text = await self.generate_copy(article)
+            if not post_text:
+                logger.error("Failed to generate LinkedIn post")
+                return False
+                
+            logger.info(f"Generated LinkedIn post: {post_text[:100]}...")
+            
+            await prefetch
+            if not await self.publish_copy(article, post_text):
+                logger.error("Failed to post to LinkedIn")
+                return False
+                
+            finish_run()
+            if await self.supabase.mark_article_as_posted(article['id'], 'linkedin'):
+                self.outbox.record_acked([article['id']], 'linkedin')
+                logger.info("Successfully completed LinkedIn post cycle")
+            else:
+                logger.warning("LinkedIn post successful but failed to mark article as posted")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error in LinkedIn bot execution: {e}")
+            return False
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Post the latest unposted article to LinkedIn.")
+    parser.add_argument('--batch', type=int, default=None, metavar='N',
+                        help="Post up to N pending articles in this run")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Run on an asyncio event loop (requires aiohttp)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main entry point."""
+    args = parse_args(argv)
     try:
-        bot = LinkedInBot()
-        success = bot.run()
+        if args.use_async:
+            bot = AsyncLinkedInBot()
+            success = async_transport.run(bot.run_batch(args.batch) if args.batch else bot.run())
+        else:
+            bot = LinkedInBot()
+            success = bot.run_batch(args.batch) if args.batch else bot.run()
         
         if success:
             logger.info("LinkedIn bot completed successfully")
         else:
             logger.warning("LinkedIn bot completed with issues")
             
+        http_transport.log_connection_stats()
+            
     except Exception as e:
         logger.error(f"Fatal error in main: {e}")
         return 1
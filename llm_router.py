@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Latency-routed, hedged LLM client for the social media bots.
+Sends OpenAI-compatible chat completions to the fastest healthy provider
+(OpenAI, Mistral, OpenRouter or any configured endpoint), tracking rolling
+p50/p95 latency and error rate per provider and model. When the chosen provider
+has not answered within its p95, a duplicate request goes to the next provider
+and whichever answers first wins. Streamed completions are read only until the
+caller's character budget is reached, and their time to first token is what
+gets tracked. Callers can bound a completion with a deadline, and a daily
+token budget (QuotaLedger) stops requests before they are sent once spent;
+both raise LLMUnavailable so callers can fall back to template copy.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional
+import requests
+import logging
+import http_transport
+import async_transport
+from bot_state import state_path
+from prompt_builder import estimate_tokens
+from retry_policy import RetryPolicy
+from run_budget import current_deadline, in_context
+
+logger = logging.getLogger(__name__)
+
+STATS_FILE = 'llm_latency.sqlite3'
+QUOTA_FILE = 'llm_quota.json'
+
+class LLMUnavailable(RuntimeError):
+    """No completion can be had within the deadline or the token budget."""
+
+# Providers used when LLM_PROVIDERS is not set, in order of preference.
+# A model of None keeps the model the caller asked for.
+DEFAULT_PROVIDERS = [
+    {'name': 'openai', 'base_url': 'https://api.openai.com/v1', 'key_env': 'OPENAI_API_KEY', 'model': None},
+    {'name': 'mistral', 'base_url': 'https://api.mistral.ai/v1', 'key_env': 'MISTRAL_API_KEY',
+     'model': 'mistral-small-latest'},
+    {'name': 'openrouter', 'base_url': 'https://openrouter.ai/api/v1', 'key_env': 'OPENROUTER_API_KEY',
+     'model': 'google/gemini-flash-1.5',
+     'headers': {'HTTP-Referer': 'http://localhost:3000', 'X-Title': 'AI Affiliates Content Feed'}}
+]
+
+def load_providers() -> List[Dict]:
+    """Return the configured providers.
+
+    LLM_PROVIDERS may hold a JSON list of {name, base_url, api_key, model,
+    headers} objects, e.g. to point at local OpenAI-compatible servers.
+    Otherwise every default provider with an API key set is used.
+    """
+    configured = os.getenv('LLM_PROVIDERS')
+    if configured:
+        return json.loads(configured)
+
+    providers = []
+    for provider in DEFAULT_PROVIDERS:
+        api_key = os.getenv(provider['key_env'])
+        if api_key:
+            providers.append({
+                'name': provider['name'],
+                'base_url': provider['base_url'],
+                'api_key': api_key,
+                'model': provider['model'],
+                'headers': provider.get('headers', {})
+            })
+    return providers
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS latency_samples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    latency REAL,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_latency_samples_key ON latency_samples(key, id);
+"""
+
+class LatencyStats:
+    """Rolling latency and error samples per provider/model, shared through a SQLite (WAL) table.
+
+    Every process appends its own samples, so concurrent bots never overwrite
+    each other's; only the newest window samples per key are kept.
+    """
+
+    def __init__(self, window: int = 100, path: Optional[str] = None):
+        self.window = window
+        self.path = path or state_path(STATS_FILE)
+        # Hedged requests record from several threads; SQLite connections are per thread
+        self.local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(STATS_SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def record(self, key: str, latency: Optional[float], ok: bool) -> None:
+        """Record one request; latency is only kept for successful requests."""
+        try:
+            conn = self._conn()
+            conn.execute('INSERT INTO latency_samples (key, latency, ok) VALUES (?, ?, ?)',
+                         (key, latency if ok else None, int(ok)))
+            conn.execute(
+                'DELETE FROM latency_samples WHERE key = ? AND id <= '
+                '(SELECT id FROM latency_samples WHERE key = ? ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                (key, key, self.window)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record LLM latency: {e}")
+
+    def summary(self, key: str) -> Dict:
+        """Return p50, p95 (None until there are samples), error rate and sample count."""
+        try:
+            samples = self._conn().execute(
+                'SELECT latency, ok FROM latency_samples WHERE key = ? ORDER BY id DESC LIMIT ?',
+                (key, self.window)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read LLM latency stats: {e}")
+            samples = []
+        latencies = [latency for latency, ok in samples if ok and latency is not None]
+        errors = sum(1 for _, ok in samples if not ok)
+        return {
+            'p50': _percentile(latencies, 0.5) if latencies else None,
+            'p95': _percentile(latencies, 0.95) if latencies else None,
+            'error_rate': errors / len(samples) if samples else 0.0,
+            'samples': len(samples)
+        }
+
+class QuotaLedger:
+    """Daily LLM token budget shared by every bot process through a state file."""
+
+    def __init__(self, daily_tokens: Optional[int] = None, path: Optional[str] = None):
+        # 0 means no budget is enforced
+        self.daily_tokens = daily_tokens if daily_tokens is not None else int(os.getenv('LLM_DAILY_TOKEN_BUDGET', '0'))
+        self.path = path or state_path(QUOTA_FILE)
+        self.lock = threading.Lock()
+
+    def _load(self) -> Dict:
+        today = datetime.utcnow().date().isoformat()
+        try:
+            with open(self.path) as f:
+                ledger = json.load(f)
+        except (OSError, ValueError):
+            ledger = {}
+        if ledger.get('day') != today:
+            ledger = {'day': today, 'tokens': 0}
+        return ledger
+
+    def remaining(self) -> Optional[int]:
+        """Return the tokens left today, or None when no budget is set."""
+        if not self.daily_tokens:
+            return None
+        with self.lock:
+            return max(0, self.daily_tokens - self._load()['tokens'])
+
+    def has_budget(self) -> bool:
+        remaining = self.remaining()
+        return remaining is None or remaining > 0
+
+    def spend(self, tokens: int) -> None:
+        """Record tokens used by a completion."""
+        if not self.daily_tokens or tokens <= 0:
+            return
+        with self.lock:
+            ledger = self._load()
+            ledger['tokens'] += tokens
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(ledger, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Could not write LLM quota ledger: {e}")
+
+def _prompt_tokens(body: Dict) -> int:
+    return sum(estimate_tokens(message.get('content') or '') for message in body.get('messages', []))
+
+class LLMRouter:
+    """Routes chat completions across providers by observed latency and health."""
+
+    def __init__(self, providers: Optional[List[Dict]] = None, stats: Optional[LatencyStats] = None,
+                 ledger: Optional[QuotaLedger] = None):
+        self.providers = providers if providers is not None else load_providers()
+        if not self.providers:
+            raise ValueError("At least one LLM provider API key (e.g. OPENAI_API_KEY) must be set")
+
+        self.stats = stats or LatencyStats(int(os.getenv('LLM_LATENCY_WINDOW', '100')))
+        self.max_error_rate = float(os.getenv('LLM_MAX_ERROR_RATE', '0.5'))
+        self.min_samples = int(os.getenv('LLM_MIN_SAMPLES', '4'))
+        self.min_hedge_delay = float(os.getenv('LLM_MIN_HEDGE_DELAY', '0.5'))
+        self.default_hedge_delay = float(os.getenv('LLM_HEDGE_DELAY', '5'))
+        # Seconds a streamed post-time generation may take before callers fall back
+        self.stream_deadline = float(os.getenv('LLM_DEADLINE', '15'))
+        self.ledger = ledger or QuotaLedger()
+        # With several providers, failing over beats retrying the same one
+        self.retry = RetryPolicy(max_attempts=1) if len(self.providers) > 1 else None
+
+    def _key(self, provider: Dict, body: Dict) -> str:
+        key = f"{provider['name']}:{provider.get('model') or body.get('model')}"
+        # Streamed requests are tracked by time to first token, so keep them apart
+        return f"{key}:stream" if body.get('stream') else key
+
+    def _healthy(self, summary: Dict) -> bool:
+        return summary['samples'] < self.min_samples or summary['error_rate'] < self.max_error_rate
+
+    def ranked(self, body: Dict) -> List[Dict]:
+        """Return providers fastest-healthy first; untried providers count as fastest."""
+        def rank(indexed):
+            index, provider = indexed
+            summary = self.stats.summary(self._key(provider, body))
+            p50 = summary['p50'] if summary['p50'] is not None else 0.0
+            return (not self._healthy(summary), p50 if self._healthy(summary) else summary['error_rate'], index)
+        return [provider for _, provider in sorted(enumerate(self.providers), key=rank)]
+
+    def hedge_delay(self, provider: Dict, body: Dict) -> float:
+        """Return how long to wait on a provider before hedging: its p95."""
+        p95 = self.stats.summary(self._key(provider, body))['p95']
+        if p95 is None:
+            return self.default_hedge_delay
+        return max(p95, self.min_hedge_delay)
+
+    def preconnect(self, model: Optional[str] = None) -> int:
+        """Open connections to the providers a streamed completion would try first.
+
+        Warms the fastest provider and, when hedging is possible, the runner-up.
+        Returns how many hosts were connected.
+        """
+        if not self.ledger.has_budget():
+            return 0
+        hosts = []
+        for provider in self.ranked({'model': model, 'stream': True})[:2]:
+            if provider['base_url'] not in hosts:
+                hosts.append(provider['base_url'])
+        return sum(http_transport.preconnect(host) for host in hosts)
+
+    def _send(self, provider: Dict, body: Dict, deadline: Optional[float] = None) -> requests.Response:
+        payload = dict(body)
+        if provider.get('model'):
+            payload['model'] = provider['model']
+        headers = {
+            'Authorization': f"Bearer {provider['api_key']}",
+            'Content-Type': 'application/json',
+            **provider.get('headers', {})
+        }
+
+        key = self._key(provider, body)
+        started = time.monotonic()
+        try:
+            response = http_transport.post(f"{provider['base_url']}/chat/completions", headers=headers,
+                                           json=payload, idempotent=True, retry=self.retry, deadline=deadline,
+                                           timeout=max(0.1, deadline - started) if deadline else None,
+                                           stream=bool(body.get('stream')))
+        except Exception:
+            self.stats.record(key, None, False)
+            raise
+        response.llm_provider = key
+
+        ok = response.status_code == 200
+        if not ok:
+            self.stats.record(key, None, False)
+            logger.warning(f"LLM provider {key} returned {response.status_code}")
+        elif not body.get('stream'):
+            # stream_text records the time to first token instead
+            self.stats.record(key, time.monotonic() - started, True)
+        return response
+
+    def _start(self, provider: Dict, body: Dict, deadline: Optional[float] = None) -> Future:
+        # Daemon threads so a losing request never holds up process exit
+        future: Future = Future()
+
+        def run():
+            try:
+                future.set_result(self._send(provider, body, deadline))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=in_context(run), name=f"llm-{provider['name']}", daemon=True).start()
+        return future
+
+    def chat_completion(self, body: Dict, deadline: Optional[float] = None) -> requests.Response:
+        """Send an OpenAI-style chat completion body and return the first successful response.
+
+        Falls back through the remaining providers when one fails. If every
+        provider fails, the last error response is returned (or the last
+        exception raised). deadline is a time.monotonic() timestamp; passing
+        it, or having no token budget left, raises LLMUnavailable.
+        """
+        if not self.ledger.has_budget():
+            raise LLMUnavailable("daily LLM token budget is spent")
+
+        remaining = self.ranked(body)
+        in_flight: Dict[Future, Dict] = {}
+        last_response: Optional[requests.Response] = None
+        last_error: Optional[Exception] = None
+
+        while remaining or in_flight:
+            if not in_flight:
+                provider = remaining.pop(0)
+                in_flight[self._start(provider, body, deadline)] = provider
+
+            timeout = None
+            if remaining and len(in_flight) == 1:
+                timeout = self.hedge_delay(next(iter(in_flight.values())), body)
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    for loser in in_flight:
+                        loser.add_done_callback(_close_response)
+                    raise LLMUnavailable("LLM missed its deadline")
+                timeout = left if timeout is None else min(timeout, left)
+
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if not remaining or len(in_flight) > 1 or (deadline is not None and time.monotonic() >= deadline):
+                    # Only the deadline can have run out; the top of the loop gives up
+                    continue
+                # The provider is slower than its p95; race a second one
+                provider = remaining.pop(0)
+                logger.info(f"🏁 Hedging LLM request to {provider['name']} after {timeout:.1f}s")
+                in_flight[self._start(provider, body, deadline)] = provider
+                continue
+
+            for future in done:
+                provider = in_flight.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    logger.warning(f"LLM provider {provider['name']} failed: {e}")
+                    last_error = e
+                    continue
+                if response.status_code == 200:
+                    for loser in in_flight:
+                        loser.add_done_callback(_close_response)
+                    if not body.get('stream'):
+                        usage = response.json().get('usage') or {}
+                        self.ledger.spend(usage.get('total_tokens') or _prompt_tokens(body))
+                    return response
+                last_response = response
+
+        if last_response is not None:
+            return last_response
+        raise last_error or RuntimeError("No LLM provider answered")
+
+    def deadline(self, timeout: Optional[float] = None) -> float:
+        """Return the time.monotonic() timestamp a generation started now must finish by.
+
+        That is timeout seconds from now (LLM_DEADLINE by default), or the
+        active bot run's deadline if it comes first.
+        """
+        deadline = time.monotonic() + (timeout or self.stream_deadline)
+        run = current_deadline()
+        if run is not None:
+            # A late stage of the run only gets what the earlier ones left
+            deadline = min(deadline, run.at())
+        return deadline
+
+    def stream_text(self, body: Dict, max_chars: int, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Stream a chat completion, reading only until max_chars of text have arrived.
+
+        Returns text, ttft (seconds to the first token), truncated (whether
+        reading stopped at the budget) and usage when the provider sent it, or
+        None if no provider returned a stream. Raises LLMUnavailable when the
+        text is not complete within timeout seconds (LLM_DEADLINE by default)
+        or before the active bot run's deadline.
+        """
+        started = time.monotonic()
+        deadline = self.deadline(timeout)
+        response = self.chat_completion(dict(body, stream=True), deadline)
+        if response.status_code != 200:
+            logger.error(f"LLM completion failed: {response.status_code} - {response.text}")
+            return None
+
+        text = ''
+        ttft = None
+        truncated = False
+        usage: Dict = {}
+        response.encoding = 'utf-8'
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+
+                chunk = json.loads(data)
+                usage = chunk.get('usage') or usage
+                for choice in chunk.get('choices') or []:
+                    delta = (choice.get('delta') or {}).get('content')
+                    if delta:
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        text += delta
+
+                if len(text) >= max_chars:
+                    # Everything past the budget would be cut anyway; stop paying for it
+                    truncated = True
+                    break
+                if time.monotonic() > deadline:
+                    raise LLMUnavailable(f"LLM stream missed its deadline after {len(text)} characters")
+        finally:
+            response.close()
+            self.ledger.spend(usage.get('total_tokens') or _prompt_tokens(body) + estimate_tokens(text))
+
+        if ttft is not None:
+            self.stats.record(response.llm_provider, ttft, True)
+            logger.info(f"⚡ {response.llm_provider} first token after {ttft:.2f}s"
+                        f"{', stopped at the length budget' if truncated else ''}")
+        return {'text': text, 'ttft': ttft, 'truncated': truncated, 'usage': usage}
+
+def _close_response(future: Future) -> None:
+    """Release the connection of a hedged request that lost the race."""
+    if not future.exception():
+        future.result().close()
+
+_router: Optional[LLMRouter] = None
+_router_lock = threading.Lock()
+
+def get_llm_router() -> LLMRouter:
+    """Return the process-wide LLM router."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = LLMRouter()
+        return _router
+
+async def generate_async(generate: Callable[[Dict], Optional[str]], article: Dict) -> Optional[str]:
+    """Run a blocking generator off the event loop, at most LLM_CONCURRENCY at a time.
+
+    The router streams and hedges on its own threads, so the event loop only
+    bounds how many generations are in flight.
+    """
+    async with async_transport.semaphore('llm', int(os.getenv('LLM_CONCURRENCY', '8'))):
+        return await asyncio.to_thread(generate, article)
@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
 """
 Master Social Media Bot
-Runs all social media bots in sequence.
+Runs all social media bots in sequence, or concurrently in-process with --concurrent
+(a thread per bot) or --async (every bot on one asyncio event loop).
+With --daemon it keeps running and posts queued articles as they arrive.
 """
 
 import os
+import asyncio
+import argparse
+import importlib
 import subprocess
 import sys
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from run_budget import RunDeadline, call_with_deadline, current_deadline, use_deadline
 try:
     from dotenv import load_dotenv
 except ImportError:
@@ -31,17 +40,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def run_bot(bot_name: str, script_path: str) -> bool:
+class RunLogFilter(logging.Filter):
+    """Passes records logged under one bot run's deadline, on any of its threads or tasks."""
+
+    def __init__(self, deadline: RunDeadline):
+        super().__init__()
+        self.deadline = deadline
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return current_deadline() is self.deadline
+
+def add_bot_log(module_name: str, deadline: RunDeadline) -> logging.Handler:
+    """Write an in-process bot run's records to <module>.log, as its own process would.
+
+    The bot module's logging.basicConfig does nothing once this module has
+    configured logging, so its file handler is added here for the run.
+    """
+    handler = logging.FileHandler(f"{module_name}.log")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    handler.addFilter(RunLogFilter(deadline))
+    logging.getLogger().addHandler(handler)
+    return handler
+
+def remove_bot_log(handler: logging.Handler) -> None:
+    logging.getLogger().removeHandler(handler)
+    handler.close()
+
+def run_bot(bot_name: str, script_path: str, timeout: float = 300, batch: Optional[int] = None) -> bool:
     """Run a specific bot and return success status."""
     try:
         logger.info(f"🚀 Running {bot_name}...")
         start_time = time.time()
         
+        command = [sys.executable, script_path]
+        if batch:
+            command += ['--batch', str(batch)]
+        
         result = subprocess.run(
-            [sys.executable, script_path], 
+            command, 
             capture_output=True, 
             text=True,
-            timeout=300  # 5 minute timeout per bot
+            timeout=timeout,  # 5 minute timeout per bot by default
+            # The bot budgets its network calls to the time we wait for it
+            env=dict(os.environ, BOT_RUN_TIMEOUT=str(timeout))
         )
         
         end_time = time.time()
@@ -59,12 +100,239 @@ def run_bot(bot_name: str, script_path: str) -> bool:
             return False
             
     except subprocess.TimeoutExpired:
-        logger.error(f"⏰ {bot_name} timed out after 5 minutes")
+        logger.error(f"⏰ {bot_name} timed out after {timeout}s")
         return False
     except Exception as e:
         logger.error(f"💥 Error running {bot_name}: {e}")
         return False
 
+def fetch_shared_articles(platforms: List[str], window: int = 10) -> Dict[str, Dict]:
+    """Fetch candidate articles once and pick the newest unposted one per platform.
+
+    A platform with no candidate in the window is left out so its bot can
+    run its own query.
+    """
+    try:
+        from linkedin_bot import SupabaseClient
+        from article_queries import build_candidates_query, fetch_articles, pick_per_platform
+        supabase = SupabaseClient()
+        articles = fetch_articles(supabase.url, supabase.headers,
+                                  build_candidates_query(platforms, window)) or []
+        picks = pick_per_platform(articles, platforms)
+        for platform, article in picks.items():
+            logger.info(f"📰 {platform} candidate for this cycle: {article.get('title', 'Unknown')}")
+        return picks
+    except Exception as e:
+        logger.error(f"💥 Error fetching shared articles: {e}")
+        return {}
+
+def attach_shared_copy(article: Dict, platforms: List[str]) -> Dict:
+    """Attach copy for the platforms posting the article, generated in one LLM call.
+
+    Copy the platforms' generators already cached, such as pre-generated
+    copy, is used first; the combined call only runs when some platform has
+    none. Bots read the attached copy before calling their own generator, so a
+    platform missing from the combined response still gets generated. When the
+    combined call fails or misses its deadline, the missing platforms get
+    template copy instead, as the LLM is not answering in time anyway.
+    Articles the enrichment worker already wrote copy for are left as they are.
+    """
+    if article.get('social_copy'):
+        return article
+    social_copy: Dict[str, str] = {}
+    try:
+        from multi_platform_generator import MultiPlatformGenerator, get_cached_platform_copy
+        social_copy = get_cached_platform_copy(article, platforms)
+        if social_copy:
+            logger.info(f"♻️  Using cached copy for: {', '.join(sorted(social_copy))}")
+        if any(platform not in social_copy for platform in platforms):
+            generated = MultiPlatformGenerator().generate_all_posts(article)
+            if generated:
+                logger.info(f"🧠 Generated shared copy for: {', '.join(sorted(generated))}")
+                social_copy = dict(generated, **social_copy)
+            else:
+                from template_generator import fallback_copy
+                for platform in platforms:
+                    copy = social_copy.get(platform) or fallback_copy(article, platform)
+                    if copy:
+                        social_copy[platform] = copy
+    except Exception as e:
+        logger.error(f"💥 Error generating shared copy: {e}")
+    return dict(article, social_copy=social_copy) if social_copy else article
+
+def prepare_shared_articles(platforms: List[str], timeout: Optional[float] = None) -> Dict[str, Dict]:
+    """Fetch each platform's candidate and attach copy generated once per article.
+
+    The fetch and generation share a budget of timeout seconds
+    (BOT_RUN_TIMEOUT by default), like a bot run.
+    """
+    return call_with_deadline(RunDeadline(timeout), _prepare_shared_articles, platforms)
+
+def _prepare_shared_articles(platforms: List[str]) -> Dict[str, Dict]:
+    picks = fetch_shared_articles(platforms)
+    platforms_by_article: Dict[str, List[str]] = {}
+    for platform, article in picks.items():
+        platforms_by_article.setdefault(article['id'], []).append(platform)
+    prepared: Dict[str, Dict] = {}
+    for platform, article in picks.items():
+        if article['id'] not in prepared:
+            prepared[article['id']] = attach_shared_copy(article, platforms_by_article[article['id']])
+        picks[platform] = prepared[article['id']]
+    return picks
+
+def run_bot_in_process(bot_name: str, module_name: str, class_name: str,
+                       article_source: Optional[Callable[[], Optional[Dict]]] = None,
+                       batch: Optional[int] = None, timeout: Optional[float] = None) -> bool:
+    """Import a bot class, run it in the current process and return success status.
+
+    Mirrors the subprocess mode: a bot that raises during setup or execution has
+    failed, while a run() that returns False only completed with issues. The
+    run's network calls share a budget of timeout seconds (BOT_RUN_TIMEOUT by
+    default), counted from the start of setup; a run that comes back without
+    success once that budget is spent has timed out and failed.
+    """
+    deadline = RunDeadline(timeout)
+    log_handler = add_bot_log(module_name, deadline)
+    try:
+        logger.info(f"🚀 Running {bot_name} in-process...")
+        module = importlib.import_module(module_name)
+        bot = call_with_deadline(deadline, getattr(module, class_name), article_source=article_source)
+        
+        run = (lambda: bot.run_batch(batch)) if batch else bot.run
+        success = call_with_deadline(deadline, run)
+        if not success and deadline.exhausted():
+            logger.error(f"⏰ {bot_name} ran out of its {timeout}s budget")
+            return False
+        if success:
+            logger.info(f"✅ {bot_name} completed successfully")
+        else:
+            logger.warning(f"⚠️  {bot_name} completed with issues")
+        return True
+        
+    except Exception as e:
+        logger.error(f"💥 Error running {bot_name}: {e}")
+        return False
+    finally:
+        remove_bot_log(log_handler)
+
+def run_bots_concurrently(bots: List[Tuple[str, str, str, str]], max_workers: int,
+                          bot_timeout: float,
+                          article_sources: Optional[Dict[str, Callable[[], Optional[Dict]]]] = None,
+                          batch: Optional[int] = None) -> Dict[str, Tuple[bool, float]]:
+    """Run bots on a bounded thread pool and return (success, duration) per bot.
+
+    article_sources optionally maps a bot name to the source of its article;
+    batch makes each bot post up to that many pending articles instead.
+
+    Each bot's timeout is measured from the moment it starts running, so bots
+    queued behind a full pool are not penalised. The timeout is enforced inside
+    the bot by its RunDeadline, which fails every network call once it is
+    spent, so a bot past its timeout can no longer post and is waited for
+    until it returns; its result is reported as it comes back.
+    """
+    results: Dict[str, Tuple[bool, float]] = {}
+    started_at: Dict[str, float] = {}
+    overdue: Set[str] = set()
+    lock = threading.Lock()
+    
+    def worker(bot_name: str, module_name: str, class_name: str) -> bool:
+        with lock:
+            started_at[bot_name] = time.time()
+        article_source = (article_sources or {}).get(bot_name)
+        return run_bot_in_process(bot_name, module_name, class_name, article_source, batch, bot_timeout)
+    
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bot')
+    pending = {
+        executor.submit(worker, bot_name, module_name, class_name): bot_name
+        for bot_name, _, module_name, class_name in bots
+    }
+    
+    try:
+        while pending:
+            done, _ = wait(list(pending), timeout=1, return_when=FIRST_COMPLETED)
+            now = time.time()
+            
+            for future in done:
+                bot_name = pending.pop(future)
+                duration = round(now - started_at.get(bot_name, now), 2)
+                success = future.result()
+                results[bot_name] = (success, duration)
+                logger.info(f"⏱️  {bot_name} wall time: {duration}s")
+            
+            for future, bot_name in list(pending.items()):
+                with lock:
+                    bot_started = started_at.get(bot_name)
+                if bot_started is not None and now - bot_started > bot_timeout and bot_name not in overdue:
+                    overdue.add(bot_name)
+                    logger.warning(f"⏰ {bot_name} passed its {bot_timeout}s timeout; "
+                                   f"waiting for its in-flight calls to finish")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    return results
+
+async def run_bots_async(bots: List[Tuple[str, str, str, str]], max_concurrency: int,
+                         bot_timeout: float, articles: Optional[Dict[str, Dict]] = None,
+                         batch: Optional[int] = None) -> Dict[str, Tuple[bool, float]]:
+    """Run each bot's async variant on the current event loop and return (success, duration) per bot.
+
+    At most max_concurrency bots run at once; articles optionally maps a bot
+    name to its already-fetched article. Like run_bot_in_process, a bot only
+    fails when it raises or times out.
+    """
+    slots = asyncio.Semaphore(max_concurrency)
+    
+    async def run_one(bot_name: str, module_name: str, class_name: str) -> Tuple[bool, float]:
+        async with slots:
+            started = time.time()
+            # Each bot task gets its own budget, inherited by everything it awaits
+            deadline = RunDeadline(bot_timeout)
+            use_deadline(deadline)
+            log_handler = add_bot_log(module_name, deadline)
+            try:
+                logger.info(f"🚀 Running {bot_name} on the event loop...")
+                module = importlib.import_module(module_name)
+                article = (articles or {}).get(bot_name)
+                
+                async def shared_article() -> Optional[Dict]:
+                    return article
+                
+                bot = getattr(module, f"Async{class_name}")(article_source=shared_article if article else None)
+                success = await asyncio.wait_for(bot.run_batch(batch) if batch else bot.run(), bot_timeout)
+                if success:
+                    logger.info(f"✅ {bot_name} completed successfully")
+                else:
+                    logger.warning(f"⚠️  {bot_name} completed with issues")
+                result = True
+            except asyncio.TimeoutError:
+                logger.error(f"⏰ {bot_name} timed out after {bot_timeout}s")
+                result = False
+            except Exception as e:
+                logger.error(f"💥 Error running {bot_name}: {e}")
+                result = False
+            finally:
+                remove_bot_log(log_handler)
+            
+            duration = round(time.time() - started, 2)
+            logger.info(f"⏱️  {bot_name} wall time: {duration}s")
+            return result, duration
+    
+    outcomes = await asyncio.gather(*(run_one(bot_name, module_name, class_name)
+                                      for bot_name, _, module_name, class_name in bots))
+    return {bot_name: outcome for (bot_name, _, _, _), outcome in zip(bots, outcomes)}
+
+def run_daemon() -> int:
+    """Process posting jobs as soon as articles are inserted instead of once per cron run."""
+    try:
+        from posting_worker import PostingWorker, get_job_store
+        PostingWorker(get_job_store()).run_forever()
+    except KeyboardInterrupt:
+        logger.info("🛑 Interrupted by user")
+    except Exception as e:
+        logger.error(f"💥 Posting daemon stopped: {e}")
+        return 1
+    return 0
+
 def check_environment_variables() -> bool:
     """Check if all required environment variables are set."""
     required_vars = [
@@ -85,8 +353,27 @@ def check_environment_variables() -> bool:
     logger.info("✅ All required environment variables are set")
     return True
 
-def main():
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Run all social media bots.")
+    parser.add_argument('--concurrent', action='store_true',
+                        help="Run the bots in-process on a thread pool instead of sequential subprocesses")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Run the bots' asyncio variants on one event loop (requires aiohttp)")
+    parser.add_argument('--max-workers', type=int, default=4,
+                        help="Maximum number of bots running at once in concurrent or async mode")
+    parser.add_argument('--bot-timeout', type=float, default=300,
+                        help="Per-bot timeout in seconds")
+    parser.add_argument('--batch', type=int, default=None, metavar='N',
+                        help="Post up to N pending articles per platform in this run")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Keep running and post queued articles as they arrive (see posting_worker.py)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Run all social media bots."""
+    args = parse_args(argv)
+    
     logger.info("🎯 Starting Master Social Media Bot")
     logger.info("=" * 50)
     
@@ -94,12 +381,15 @@ def main():
     if not check_environment_variables():
         return 1
     
-    # Define bots to run
+    if args.daemon:
+        return run_daemon()
+    
+    # Define bots to run: (name, script, module, class)
     bots = [
-        ("Twitter", "twitter_bot.py"),
-        ("LinkedIn", "linkedin_bot.py"),
-        ("Facebook", "facebook_bot.py"),
-        ("Reddit", "reddit_bot.py")
+        ("Twitter", "twitter_bot.py", "twitter_bot", "TwitterBot"),
+        ("LinkedIn", "linkedin_bot.py", "linkedin_bot", "LinkedInBot"),
+        ("Facebook", "facebook_bot.py", "facebook_bot", "FacebookBot"),
+        ("Reddit", "reddit_bot.py", "reddit_bot", "RedditBot")
     ]
     
     success_count = 0
@@ -108,21 +398,50 @@ def main():
     
     start_time = time.time()
     
-    for bot_name, script_path in bots:
+    results: Dict[str, Tuple[bool, float]] = {}
+    
+    if args.concurrent or args.use_async:
         try:
-            if run_bot(bot_name, script_path):
-                success_count += 1
+            # Fetch once and fan the same in-memory records out to every bot
+            platforms = {bot_name: module_name[:-len('_bot')] for bot_name, _, module_name, _ in bots}
+            # Batch runs fetch their own backlog per platform
+            picks = {} if args.batch else prepare_shared_articles(list(platforms.values()), args.bot_timeout)
+            if args.use_async:
+                import async_transport
+                articles = {bot_name: picks[platform] for bot_name, platform in platforms.items() if platform in picks}
+                results = async_transport.run(run_bots_async(bots, args.max_workers, args.bot_timeout,
+                                                             articles=articles, batch=args.batch))
             else:
-                failed_bots.append(bot_name)
-            
-            # Add delay between bots to avoid overwhelming APIs
-            if bot_name != bots[-1][0]:  # Don't delay after the last bot
-                logger.info("⏳ Waiting 30 seconds before next bot...")
-                time.sleep(30)
-                
+                article_sources = {
+                    bot_name: (lambda article=picks[platform]: article)
+                    for bot_name, platform in platforms.items()
+                    if platform in picks
+                }
+                results = run_bots_concurrently(bots, args.max_workers, args.bot_timeout,
+                                                article_sources=article_sources, batch=args.batch)
         except KeyboardInterrupt:
             logger.info("🛑 Interrupted by user")
             return 1
+        
+        for bot_name, _, _, _ in bots:
+            success, _ = results.get(bot_name, (False, 0.0))
+            if success:
+                success_count += 1
+            else:
+                failed_bots.append(bot_name)
+    else:
+        for bot_name, script_path, _, _ in bots:
+            try:
+                # Each bot paces its own posts through posting_scheduler, so
+                # there is no fixed delay between bots
+                if run_bot(bot_name, script_path, args.bot_timeout, args.batch):
+                    success_count += 1
+                else:
+                    failed_bots.append(bot_name)
+                    
+            except KeyboardInterrupt:
+                logger.info("🛑 Interrupted by user")
+                return 1
     
     end_time = time.time()
     total_duration = round(end_time - start_time, 2)
@@ -134,6 +453,13 @@ def main():
     logger.info(f"✅ Successful: {success_count}/{total_bots}")
     logger.info(f"❌ Failed: {total_bots - success_count}/{total_bots}")
     
+    for bot_name, (_, duration) in results.items():
+        logger.info(f"⏱️  {bot_name}: {duration}s")
+    
+    if args.concurrent or args.use_async:
+        import http_transport
+        http_transport.log_connection_stats()
+    
     if failed_bots:
         logger.info(f"🔴 Failed bots: {', '.join(failed_bots)}")
     
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Multi-Platform Post Generator for Affiliate Content Feed
+Generates the Twitter, LinkedIn, Facebook and Reddit copy for an article in a
+single OpenAI chat completion.
+"""
+
+import json
+import sqlite3
+import importlib
+from typing import Dict, List, Optional
+import logging
+from generation_cache import cached_generation, generation_key, get_generation_cache
+from llm_router import get_llm_router
+from prompt_builder import PLATFORM_LIMITS, build_prompt_source, log_token_usage
+
+logger = logging.getLogger(__name__)
+
+def finish_tweet(text: str, article: Dict) -> str:
+    """Append the affiliate link and enforce the tweet length limit."""
+    affiliate_url = article.get('affiliate_url')
+    if affiliate_url and len(text) < 200:  # Leave room for URL
+        text += f"\n\n{affiliate_url}"
+
+    if len(text) > PLATFORM_LIMITS['twitter']:
+        text = text[:277] + "..."
+
+    return text
+
+def finish_linkedin_post(text: str, article: Dict) -> str:
+    """Append the affiliate link and enforce LinkedIn's character limit."""
+    affiliate_url = article.get('affiliate_url')
+    if affiliate_url and len(text) < 1200:  # Leave room for URL
+        text += f"\n\nRead more: {affiliate_url}"
+
+    if len(text) > PLATFORM_LIMITS['linkedin']:
+        text = text[:1297] + "..."
+
+    return text
+
+def finish_facebook_post(text: str, article: Dict) -> str:
+    """Append the affiliate link and enforce Facebook's character limit."""
+    affiliate_url = article.get('affiliate_url')
+    if affiliate_url and len(text) < 63000:  # Leave room for URL
+        text += f"\n\nRead more: {affiliate_url}"
+
+    if len(text) > PLATFORM_LIMITS['facebook']:
+        text = text[:63203] + "..."
+
+    return text
+
+def finish_reddit_title(text: str, article: Dict) -> str:
+    """Strip wrapping quotes and enforce Reddit's title limit."""
+    if text.startswith('"') and text.endswith('"'):
+        text = text[1:-1]
+
+    if len(text) > PLATFORM_LIMITS['reddit']:
+        text = text[:297] + "..."
+
+    return text
+
+FINISHERS = {
+    'twitter': finish_tweet,
+    'linkedin': finish_linkedin_post,
+    'facebook': finish_facebook_post,
+    'reddit': finish_reddit_title
+}
+
+# What each platform's copy should be, shared by the combined and batched prompts
+PLATFORM_INSTRUCTIONS = {
+    'twitter': 'an engaging tweet under 280 characters with 2-3 hashtags at the end',
+    'linkedin': 'a professional, business-focused post under 1300 characters with a call-to-action and 3-5 hashtags at the end',
+    'facebook': 'a conversational, friendly post with a call-to-action and 2-3 hashtags at the end',
+    'reddit': 'an interesting, rule-compliant post title under 300 characters, not clickbait, no quotes or hashtags'
+}
+
+# Each bot's own single-platform generator: (module, OpenAIClient method)
+PLATFORM_GENERATORS = {
+    'twitter': ('twitter_bot', 'generate_tweet'),
+    'linkedin': ('linkedin_bot', 'generate_linkedin_post'),
+    'facebook': ('facebook_bot', 'generate_facebook_post'),
+    'reddit': ('reddit_bot', 'generate_reddit_title')
+}
+
+def get_precomputed_copy(article: Dict, platform: str) -> Optional[str]:
+    """Return copy already generated for a platform and attached to the article."""
+    social_copy = article.get('social_copy') or {}
+    return social_copy.get(platform) or None
+
+def get_cached_platform_copy(article: Dict, platforms: List[str]) -> Dict[str, str]:
+    """Return copy the platforms' own generators already cached for the article.
+
+    Finds copy pre-generated by batch_pregeneration or left by an earlier run
+    without calling the LLM.
+    """
+    cache = get_generation_cache()
+    if not cache.enabled:
+        return {}
+    found = {}
+    for platform in platforms:
+        module_name, method_name = PLATFORM_GENERATORS[platform]
+        client_class = importlib.import_module(module_name).OpenAIClient
+        try:
+            cached = cache.get(generation_key(getattr(client_class, method_name), client_class(), article))
+        except sqlite3.Error as e:
+            logger.warning(f"Generation cache unavailable: {e}")
+            return found
+        if cached:
+            found[platform] = cached
+    return found
+
+class MultiPlatformGenerator:
+    """Client for OpenAI API to generate posts for every platform at once."""
+
+    def __init__(self):
+        # Sends each completion to the fastest healthy configured provider
+        self.router = get_llm_router()
+        self.model = 'gpt-3.5-turbo'
+        self.temperature = 0.7
+
+    @cached_generation('all', prompt_version=2)
+    def generate_all_posts(self, article: Dict) -> Optional[Dict[str, str]]:
+        """Generate copy for every platform with one chat completion.
+
+        Returns a dict keyed by platform name. Platforms whose copy is missing
+        or empty in the response are left out so the bot can fall back to its
+        own generator. Returns None when the LLM fails or misses LLM_DEADLINE
+        (or the run's deadline, if sooner).
+        """
+        try:
+            # Budget the article text by tokens for the combined prompt
+            plan = build_prompt_source(article, 'all')
+            text_to_summarize = plan['text']
+            platform_lines = '\n            '.join(
+                f'- "{platform}": {instructions}' for platform, instructions in PLATFORM_INSTRUCTIONS.items()
+            )
+
+            prompt = f"""
+            Create social media copy about this article for four platforms.
+            Respond with a JSON object with exactly these keys:
+            {platform_lines}
+
+            Article: {text_to_summarize}
+            """
+
+            response = self.router.chat_completion({
+                'model': self.model,
+                'messages': [
+                    {
+                        'role': 'system',
+                        'content': 'You are a social media expert who writes engaging, platform-appropriate posts about tech and business articles. You always answer with valid JSON.'
+                    },
+                    {
+                        'role': 'user',
+                        'content': prompt
+                    }
+                ],
+                'response_format': {'type': 'json_object'},
+                'max_tokens': plan['max_tokens'],
+                'temperature': self.temperature
+            }, self.router.deadline())
+
+            if response.status_code != 200:
+                logger.error(f"OpenAI API error: {response.status_code} - {response.text}")
+                return None
+
+            result = response.json()
+            log_token_usage('all', plan, result)
+            variants = json.loads(result['choices'][0]['message']['content'])
+            if not isinstance(variants, dict):
+                logger.error("OpenAI returned a non-object JSON payload for multi-platform posts")
+                return None
+
+            posts = {}
+            for platform, finish in FINISHERS.items():
+                text = variants.get(platform)
+                if isinstance(text, str) and text.strip():
+                    posts[platform] = finish(text.strip(), article)
+                else:
+                    logger.warning(f"Multi-platform response is missing {platform} copy")
+
+            return posts or None
+
+        except Exception as e:
+            logger.error(f"Error generating multi-platform posts: {e}")
+            return None
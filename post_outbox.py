@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Durable posting outbox for the social media bots.
+A local SQLite (WAL) table keyed by (article_id, platform, account) records the
+intent to post, the platform post id and the Supabase acknowledgement, so a
+crash or a failed "mark as posted" never leads to the same article being
+posted twice. Failed posts are kept as dead letters with a scheduled retry
+time and are re-sent from their stored payload without re-running generation.
+An intent whose outcome never became known (the run died or the request timed
+out mid-flight) may already be live, so it is never re-sent automatically:
+after OUTBOX_PENDING_EXPIRY seconds it moves to the review state until someone
+checks the platform and resolves it with resolve_review.
+"""
+
+import os
+import json
+import time
+import sqlite3
+from typing import Awaitable, Callable, Dict, List, Optional
+import logging
+from bot_state import state_path
+from circuit_breaker import CircuitOpenError
+from http_transport import is_ambiguous_failure
+from run_budget import budget_exhausted
+
+logger = logging.getLogger(__name__)
+
+# Row states
+PENDING = 'pending'   # intent recorded, platform outcome not yet known
+POSTED = 'posted'     # platform accepted the post, Supabase not yet updated
+ACKED = 'acked'       # Supabase marked the article as posted
+FAILED = 'failed'     # dead letter; retried at retry_at until attempts run out
+REVIEW = 'review'     # outcome still unknown after OUTBOX_PENDING_EXPIRY; never re-sent automatically
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    article_id TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    state TEXT NOT NULL,
+    payload TEXT,
+    post_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    retry_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (article_id, platform, account)
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_platform_state ON outbox(platform, state, retry_at);
+"""
+
+class PostDeferred(Exception):
+    """The post was not sent and should be tried later without counting an attempt."""
+
+# Errors raised before a post was sent that say nothing about the post itself:
+# the scheduler held it back or the platform's circuit is open
+DEFERRED_ERRORS = (PostDeferred, CircuitOpenError)
+
+class PostOutbox:
+    """SQLite-backed outbox; use one instance per thread."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or state_path('outbox.sqlite3')
+        self.max_attempts = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+        self.retry_delay = float(os.getenv('OUTBOX_RETRY_DELAY', '900'))
+        # Far longer than any run, so an intent still in flight is never flagged
+        self.pending_expiry = float(os.getenv('OUTBOX_PENDING_EXPIRY', str(6 * 3600)))
+
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def _get(self, article_id: str, platform: str, account: str) -> Optional[sqlite3.Row]:
+        return self.conn.execute(
+            'SELECT * FROM outbox WHERE article_id = ? AND platform = ? AND account = ?',
+            (str(article_id), platform, account)
+        ).fetchone()
+
+    def _retryable(self, row: sqlite3.Row, now: float) -> bool:
+        return row['state'] == FAILED and row['retry_at'] is not None and row['retry_at'] <= now
+
+    def _expired(self, row: sqlite3.Row, now: float) -> bool:
+        return row['state'] == PENDING and row['updated_at'] <= now - self.pending_expiry
+
+    def _flag_for_review(self, row: sqlite3.Row, now: float) -> None:
+        logger.error(f"📮 {row['platform']} post for article {row['article_id']} stayed unresolved for "
+                     f"{(now - row['updated_at']) / 3600:.1f}h and may be live; check the platform and "
+                     f"resolve it with resolve_review before it is posted again")
+        self.conn.execute(
+            'UPDATE outbox SET state = ?, updated_at = ? WHERE article_id = ? AND platform = ? AND account = ? '
+            'AND state = ?',
+            (REVIEW, now, row['article_id'], row['platform'], row['account'], PENDING)
+        )
+
+    def can_post(self, article_id: str, platform: str, account: str) -> bool:
+        """Return True if nothing blocks posting this article to the account now."""
+        row = self._get(article_id, platform, account)
+        if row is None:
+            return True
+        return self._retryable(row, time.time())
+
+    def claim(self, article_id: str, platform: str, account: str, payload: Dict) -> bool:
+        """Atomically record the intent to post; False if it must not be posted.
+
+        An intent left pending by a crashed run or an ambiguous failure blocks
+        the key for good, as the platform may already have the post; after
+        OUTBOX_PENDING_EXPIRY seconds it is flagged for review instead.
+        """
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._get(article_id, platform, account)
+            if row is None:
+                self.conn.execute(
+                    'INSERT INTO outbox (article_id, platform, account, state, payload, created_at, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (str(article_id), platform, account, PENDING, json.dumps(payload), now, now)
+                )
+            elif self._retryable(row, now):
+                self.conn.execute(
+                    'UPDATE outbox SET state = ?, payload = ?, updated_at = ? '
+                    'WHERE article_id = ? AND platform = ? AND account = ?',
+                    (PENDING, json.dumps(payload), now, str(article_id), platform, account)
+                )
+            else:
+                if self._expired(row, now):
+                    self._flag_for_review(row, now)
+                self.conn.execute('COMMIT')
+                if row['state'] in (PENDING, REVIEW):
+                    logger.error(f"📮 {platform} post for article {article_id} has an unresolved intent; not re-posting")
+                else:
+                    logger.info(f"📮 {platform} post for article {article_id} is already {row['state']}; skipping")
+                return False
+            self.conn.execute('COMMIT')
+            return True
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def record_posted(self, article_id: str, platform: str, account: str, post_id: str) -> None:
+        """Record the platform post id once the platform accepted the post."""
+        self.conn.execute(
+            'UPDATE outbox SET state = ?, post_id = ?, last_error = NULL, retry_at = NULL, updated_at = ? '
+            'WHERE article_id = ? AND platform = ? AND account = ?',
+            (POSTED, post_id, time.time(), str(article_id), platform, account)
+        )
+
+    def record_failure(self, article_id: str, platform: str, account: str, error: str) -> None:
+        """Dead-letter a post the platform rejected, scheduling a retry with backoff."""
+        row = self._get(article_id, platform, account)
+        attempts = (row['attempts'] if row else 0) + 1
+        retry_at = None
+        if attempts < self.max_attempts:
+            retry_at = time.time() + self.retry_delay * (2 ** (attempts - 1))
+        self.conn.execute(
+            'UPDATE outbox SET state = ?, attempts = ?, last_error = ?, retry_at = ?, updated_at = ? '
+            'WHERE article_id = ? AND platform = ? AND account = ?',
+            (FAILED, attempts, error, retry_at, time.time(), str(article_id), platform, account)
+        )
+
+    def release(self, article_id: str, platform: str, account: str, reason: str) -> None:
+        """Give back a claim whose post was never sent, without counting an attempt."""
+        now = time.time()
+        self.conn.execute(
+            'UPDATE outbox SET state = ?, last_error = ?, retry_at = ?, updated_at = ? '
+            'WHERE article_id = ? AND platform = ? AND account = ? AND state = ?',
+            (FAILED, reason, now, now, str(article_id), platform, account, PENDING)
+        )
+
+    def _defer(self, article_id: str, platform: str, account: str, error: Exception) -> None:
+        logger.warning(f"📮 {platform} post for article {article_id} was not sent ({error}); leaving it for a later run")
+        self.release(article_id, platform, account, str(error))
+
+    def record_acked(self, article_ids: List[str], platform: str) -> None:
+        """Record that Supabase marked these articles as posted to the platform."""
+        self.conn.executemany(
+            'UPDATE outbox SET state = ?, updated_at = ? WHERE article_id = ? AND platform = ? AND state = ?',
+            [(ACKED, time.time(), str(article_id), platform, POSTED) for article_id in article_ids]
+        )
+
+    def unacked(self, platform: str) -> List[str]:
+        """Return ids of articles posted to the platform but not yet acknowledged."""
+        rows = self.conn.execute(
+            'SELECT DISTINCT article_id FROM outbox WHERE platform = ? AND state = ?',
+            (platform, POSTED)
+        ).fetchall()
+        return [row['article_id'] for row in rows]
+
+    def due_retries(self, platform: str) -> List[sqlite3.Row]:
+        """Return dead letters for the platform whose retry time has come."""
+        return self.conn.execute(
+            'SELECT * FROM outbox WHERE platform = ? AND state = ? AND retry_at IS NOT NULL AND retry_at <= ? '
+            'ORDER BY retry_at',
+            (platform, FAILED, time.time())
+        ).fetchall()
+
+    def flag_expired(self, platform: str) -> int:
+        """Move the platform's intents unresolved for OUTBOX_PENDING_EXPIRY to review; return how many."""
+        now = time.time()
+        rows = self.conn.execute(
+            'SELECT * FROM outbox WHERE platform = ? AND state = ? AND updated_at <= ?',
+            (platform, PENDING, now - self.pending_expiry)
+        ).fetchall()
+        for row in rows:
+            self._flag_for_review(row, now)
+        return len(rows)
+
+    def needs_review(self, platform: str) -> List[sqlite3.Row]:
+        """Return the platform's posts whose outcome has to be checked by hand."""
+        return self.conn.execute(
+            'SELECT * FROM outbox WHERE platform = ? AND state = ? ORDER BY updated_at',
+            (platform, REVIEW)
+        ).fetchall()
+
+    def resolve_review(self, article_id: str, platform: str, account: str, post_id: Optional[str] = None) -> None:
+        """Settle a post flagged for review: record its post id if it is live, else allow posting it again."""
+        if post_id:
+            state, retry_at = POSTED, None
+        else:
+            state, retry_at = FAILED, time.time()
+        self.conn.execute(
+            'UPDATE outbox SET state = ?, post_id = ?, retry_at = ?, updated_at = ? '
+            'WHERE article_id = ? AND platform = ? AND account = ? AND state = ?',
+            (state, post_id, retry_at, time.time(), str(article_id), platform, account, REVIEW)
+        )
+
+    def replay_acks(self, platform: str, mark: Callable[[List[str]], bool]) -> None:
+        """Acknowledge every posted-but-unacked article for the platform in one batch."""
+        article_ids = self.unacked(platform)
+        if article_ids and mark(article_ids):
+            self.record_acked(article_ids, platform)
+
+    async def replay_acks_async(self, platform: str, mark: Callable[[List[str]], Awaitable[bool]]) -> None:
+        """Like replay_acks, for a coroutine that marks the articles."""
+        article_ids = self.unacked(platform)
+        if article_ids and await mark(article_ids):
+            self.record_acked(article_ids, platform)
+
+    def _record_error(self, article_id: str, platform: str, account: str, error: Exception) -> None:
+        if is_ambiguous_failure(error):
+            # The post may have gone through; keep the intent pending so it
+            # is never re-sent without a check
+            self.conn.execute(
+                'UPDATE outbox SET last_error = ?, updated_at = ? '
+                'WHERE article_id = ? AND platform = ? AND account = ?',
+                (str(error), time.time(), str(article_id), platform, account)
+            )
+        else:
+            self.record_failure(article_id, platform, account, str(error))
+
+    def _record_result(self, article_id: str, platform: str, account: str, post_id: Optional[str]) -> None:
+        if post_id:
+            self.record_posted(article_id, platform, account, post_id)
+        else:
+            self.record_failure(article_id, platform, account, "platform rejected the post")
+
+    def publish(self, article_id: str, platform: str, account: str, payload: Dict,
+                post: Callable[[Dict], Optional[str]]) -> Optional[str]:
+        """Post the payload at most once for the key and record the outcome."""
+        if not self.claim(article_id, platform, account, payload):
+            return None
+
+        try:
+            post_id = post(payload)
+        except DEFERRED_ERRORS as e:
+            self._defer(article_id, platform, account, e)
+            return None
+        except Exception as e:
+            self._record_error(article_id, platform, account, e)
+            raise
+
+        self._record_result(article_id, platform, account, post_id)
+        return post_id
+
+    async def publish_async(self, article_id: str, platform: str, account: str, payload: Dict,
+                            post: Callable[[Dict], Awaitable[Optional[str]]]) -> Optional[str]:
+        """Like publish, for a coroutine that posts the payload."""
+        if not self.claim(article_id, platform, account, payload):
+            return None
+
+        try:
+            post_id = await post(payload)
+        except DEFERRED_ERRORS as e:
+            self._defer(article_id, platform, account, e)
+            return None
+        except Exception as e:
+            self._record_error(article_id, platform, account, e)
+            raise
+
+        self._record_result(article_id, platform, account, post_id)
+        return post_id
+
+    def retry_due(self, platform: str, post: Callable[[Dict], Optional[str]]) -> int:
+        """Re-send due dead letters from their stored payloads; return how many succeeded."""
+        self.flag_expired(platform)
+        succeeded = 0
+        for row in self.due_retries(platform):
+            if budget_exhausted():
+                logger.warning(f"⏳ Run budget spent; leaving the remaining {platform} retries for the next run")
+                break
+            logger.info(f"📮 Retrying {platform} post for article {row['article_id']} (attempt {row['attempts'] + 1})")
+            try:
+                if self.publish(row['article_id'], platform, row['account'], json.loads(row['payload']), post):
+                    succeeded += 1
+            except Exception as e:
+                logger.error(f"Error retrying {platform} post for article {row['article_id']}: {e}")
+        return succeeded
+
+    async def retry_due_async(self, platform: str, post: Callable[[Dict], Awaitable[Optional[str]]]) -> int:
+        """Like retry_due, for a coroutine that posts the payload."""
+        self.flag_expired(platform)
+        succeeded = 0
+        for row in self.due_retries(platform):
+            if budget_exhausted():
+                logger.warning(f"⏳ Run budget spent; leaving the remaining {platform} retries for the next run")
+                break
+            logger.info(f"📮 Retrying {platform} post for article {row['article_id']} (attempt {row['attempts'] + 1})")
+            try:
+                if await self.publish_async(row['article_id'], platform, row['account'],
+                                            json.loads(row['payload']), post):
+                    succeeded += 1
+            except Exception as e:
+                logger.error(f"Error retrying {platform} post for article {row['article_id']}: {e}")
+        return succeeded
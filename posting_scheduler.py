@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Token-bucket posting scheduler for the social media bots.
+Each (platform, account) pair gets a bucket that refills at the platform's
+posting rate and is corrected from the rate-limit headers observed on real
+responses, so posts are released as soon as the quota allows instead of after
+fixed sleeps. Buckets are saved in the bot state directory, so the limits hold
+across cron runs and bot processes.
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+import requests
+from typing import Callable, Dict, Optional, Tuple
+import logging
+from bot_state import state_path
+from retry_policy import rate_limit_state, run_deadline
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_FILE = 'posting_quota.json'
+
+# Default (burst capacity, seconds to refill the full capacity) per platform.
+# Override with POST_RATE_<PLATFORM>=capacity/seconds, e.g. POST_RATE_REDDIT=3/180
+DEFAULT_RATES = {
+    'twitter': (17, 24 * 3600),
+    'linkedin': (100, 24 * 3600),
+    'facebook': (200, 3600),
+    'reddit': (3, 180)
+}
+
+class TokenBucket:
+    """A token bucket with header-driven corrections.
+
+    Without quota headers it refills steadily at the configured rate. Once a
+    platform reports its remaining quota and reset time, the reported count
+    is used as is until the reset, when the bucket refills to capacity.
+    Times are wall-clock so the state can be saved and reloaded by later runs.
+    """
+
+    def __init__(self, capacity: float, refill_seconds: float, state: Optional[Dict] = None):
+        self.capacity = capacity
+        self.rate = capacity / refill_seconds
+        state = state or {}
+        self.tokens = min(capacity, state.get('tokens', capacity))
+        # When the platform's reported window resets; 0 while refilling steadily
+        self.reset_at = state.get('reset_at', 0.0)
+        self.updated_at = state.get('updated_at', time.time())
+
+    def state(self) -> Dict:
+        """Return the bucket's state for the state file."""
+        return {'tokens': self.tokens, 'reset_at': self.reset_at, 'updated_at': self.updated_at}
+
+    def _refill(self, now: float) -> None:
+        if self.reset_at:
+            if now < self.reset_at:
+                self.updated_at = now
+                return
+            # The platform's window has reset, so its full quota is back
+            self.tokens = self.capacity
+            self.reset_at = 0.0
+        self.tokens = min(self.capacity, self.tokens + max(now - self.updated_at, 0.0) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        """Return how long until a token is available."""
+        now = time.time()
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        if self.reset_at:
+            return self.reset_at - now
+        return (1 - self.tokens) / self.rate
+
+    def try_take(self) -> bool:
+        """Take a token if one is available right now."""
+        self._refill(time.time())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def observe(self, remaining: float, reset_seconds: Optional[float]) -> None:
+        """Set the bucket to the quota the platform reports, refilling it when the window resets."""
+        now = time.time()
+        self._refill(now)
+        self.tokens = min(self.capacity, max(remaining, 0.0))
+        if reset_seconds is not None:
+            self.reset_at = now + reset_seconds
+        elif self.reset_at:
+            # No reset time this time; fall back to the steady refill
+            self.reset_at = 0.0
+
+class PostingScheduler:
+    """Releases posts per (platform, account) as soon as their quota allows.
+
+    Bucket state is kept in a state file, read and rewritten under an
+    exclusive lock, so cron runs and concurrent bot processes share one quota
+    per account instead of each starting with a full bucket.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or state_path(SCHEDULER_FILE)
+        self.lock = threading.Lock()
+
+    def _rate_for(self, platform: str) -> Tuple[float, float]:
+        override = os.getenv(f'POST_RATE_{platform.upper()}')
+        if override:
+            try:
+                capacity, seconds = override.split('/')
+                return float(capacity), float(seconds)
+            except ValueError:
+                logger.warning(f"Ignoring invalid POST_RATE_{platform.upper()}: {override}")
+        return DEFAULT_RATES.get(platform, (1, 60))
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, buckets: Dict) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(buckets, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write posting quota state: {e}")
+
+    def _update(self, platform: str, account: str, change: Callable[[TokenBucket], Optional[float]]) -> Optional[float]:
+        """Apply change to the stored bucket and write it back under the file lock."""
+        key = f"{platform}:{account}"
+        with self.lock:
+            lock_file = None
+            try:
+                lock_file = open(f"{self.path}.lock", 'a')
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+            except OSError as e:
+                logger.warning(f"Could not lock posting quota state: {e}")
+            try:
+                buckets = self._load()
+                bucket = TokenBucket(*self._rate_for(platform), buckets.get(key))
+                result = change(bucket)
+                buckets[key] = bucket.state()
+                self._save(buckets)
+            finally:
+                if lock_file is not None:
+                    lock_file.close()
+        return result
+
+    def bucket(self, platform: str, account: str) -> TokenBucket:
+        """Return a snapshot of the stored bucket for a platform account."""
+        return TokenBucket(*self._rate_for(platform), self._load().get(f"{platform}:{account}"))
+
+    def _next_wait(self, platform: str, account: str, deadline: Optional[float]) -> Optional[float]:
+        """Take a token and return 0, or return the wait for the next one; None if past the deadline."""
+        deadline = deadline if deadline is not None else run_deadline()
+        wait = self._update(platform, account, lambda bucket: 0.0 if bucket.try_take() else bucket.wait_time())
+        if wait == 0:
+            return 0.0
+
+        if deadline is not None and time.monotonic() + wait >= deadline:
+            logger.warning(f"⏳ {platform} quota for {account} frees up in {wait:.0f}s, past the run deadline")
+            return None
+
+        logger.info(f"⏳ Waiting {wait:.1f}s for {platform} posting quota")
+        return wait
+
+    def acquire(self, platform: str, account: str, deadline: Optional[float] = None) -> bool:
+        """Block until a post is allowed and take the token.
+
+        Returns False without waiting when the next token would only arrive
+        after the deadline (a time.monotonic() timestamp, defaulting to the
+        run deadline).
+        """
+        while True:
+            wait = self._next_wait(platform, account, deadline)
+            if wait is None:
+                return False
+            if wait == 0:
+                return True
+            time.sleep(wait)
+
+    async def acquire_async(self, platform: str, account: str, deadline: Optional[float] = None) -> bool:
+        """Like acquire, but waits without blocking the event loop."""
+        while True:
+            wait = self._next_wait(platform, account, deadline)
+            if wait is None:
+                return False
+            if wait == 0:
+                return True
+            await asyncio.sleep(wait)
+
+    def has_quota(self, platform: str, account: str, deadline: Optional[float] = None) -> bool:
+        """Return True if a post would be allowed before the deadline, without taking a token."""
+        deadline = deadline if deadline is not None else run_deadline()
+        return deadline is None or time.monotonic() + self.bucket(platform, account).wait_time() < deadline
+
+    def observe(self, platform: str, account: str, response: requests.Response) -> None:
+        """Refill or drain the bucket from a response's rate-limit headers."""
+        state = rate_limit_state(response)
+        if state:
+            self._update(platform, account, lambda bucket: bucket.observe(*state))
+
+    def throttle(self, platform: str, account: str, seconds: float) -> None:
+        """Empty the bucket until a limit the platform reported in a response body lifts."""
+        logger.warning(f"⏳ {platform} says {account} is posting too fast; holding posts for {seconds:.0f}s")
+        self._update(platform, account, lambda bucket: bucket.observe(0, seconds))
+
+_scheduler: Optional[PostingScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> PostingScheduler:
+    """Return the process-wide posting scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PostingScheduler()
+        return _scheduler
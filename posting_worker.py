@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Posting Job Worker
+Claims posting jobs from the posting_jobs table (supabase/migrations/004) with a
+lease and runs the matching bot for each claimed article, so any number of
+workers can run side by side without picking the same job. Jobs whose worker
+dies are picked up again once their lease expires.
+
+With DATABASE_URL set the worker LISTENs for new jobs (supabase/migrations/005)
+and posts as soon as an article lands; otherwise it polls with a backoff.
+"""
+
+import os
+import sys
+import time
+import select
+import socket
+import argparse
+import importlib
+from typing import Dict, List, Optional
+import logging
+import http_transport
+from article_queries import OPTIONAL_COLUMNS, POSTED_COLUMNS, PLATFORM_COLUMNS, fetch_articles, normalize_article
+try:
+    import psycopg2
+    import psycopg2.extras
+except ImportError:
+    psycopg2 = None
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('posting_worker.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Channel the posting_jobs insert trigger notifies
+NOTIFY_CHANNEL = 'posting_jobs'
+
+# Bot class run for each platform's jobs: (module, class)
+BOT_CLASSES = {
+    'twitter': ('twitter_bot', 'TwitterBot'),
+    'linkedin': ('linkedin_bot', 'LinkedInBot'),
+    'facebook': ('facebook_bot', 'FacebookBot'),
+    'reddit': ('reddit_bot', 'RedditBot')
+}
+
+def _article_columns(platform: str) -> List[str]:
+    return PLATFORM_COLUMNS[platform] + [POSTED_COLUMNS[platform]]
+
+class PostgresJobStore:
+    """Job store talking to Postgres directly through DATABASE_URL."""
+
+    def __init__(self, dsn: Optional[str] = None):
+        if psycopg2 is None:
+            raise ImportError("psycopg2 is required for DATABASE_URL. Install with: pip install psycopg2-binary")
+        self.dsn = dsn or os.getenv('DATABASE_URL')
+        if not self.dsn:
+            raise ValueError("DATABASE_URL must be set in environment variables")
+        self.conn = psycopg2.connect(self.dsn)
+        self.conn.autocommit = True
+        self.article_columns: Optional[List[str]] = None
+
+    def _call(self, sql: str, params: tuple) -> List[Dict]:
+        if self.conn.closed:
+            logger.warning("Reconnecting to Postgres")
+            self.conn = psycopg2.connect(self.dsn)
+            self.conn.autocommit = True
+        with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            cursor.execute(sql, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def claim(self, platform: str, worker: str, limit: int, lease_seconds: int) -> List[Dict]:
+        return self._call('SELECT * FROM claim_posting_jobs(%s, %s, %s, %s)',
+                          (platform, worker, limit, lease_seconds))
+
+    def complete(self, job_id: int, worker: str) -> bool:
+        return self._call('SELECT complete_posting_job(%s, %s) AS ok', (job_id, worker))[0]['ok']
+
+    def fail(self, job_id: int, worker: str, error: str, max_attempts: int) -> bool:
+        return self._call('SELECT fail_posting_job(%s, %s, %s, %s) AS ok',
+                          (job_id, worker, error, max_attempts))[0]['ok']
+
+    def listen(self) -> bool:
+        """Subscribe to job notifications; returns True as Postgres supports them."""
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        return True
+
+    def wait_for_jobs(self, timeout: float) -> List[str]:
+        """Block until jobs are queued or the timeout passes; return the notified platforms."""
+        if not self.conn.notifies:
+            select.select([self.conn], [], [], timeout)
+            self.conn.poll()
+        platforms = sorted({notify.payload for notify in self.conn.notifies})
+        self.conn.notifies.clear()
+        return platforms
+
+    def _existing_columns(self) -> List[str]:
+        if self.article_columns is None:
+            rows = self._call("SELECT column_name FROM information_schema.columns "
+                              "WHERE table_schema = current_schema() AND table_name = 'articles'", ())
+            self.article_columns = [row['column_name'] for row in rows]
+        return self.article_columns
+
+    def fetch_article(self, article_id: str, platform: str) -> Optional[Dict]:
+        # Like the PostgREST queries, leave out optional columns the database lacks
+        existing = self._existing_columns()
+        columns = ['left(content, 500) AS content_excerpt' if column == 'content_excerpt' else column
+                   for column in _article_columns(platform)
+                   if column not in OPTIONAL_COLUMNS or column in existing]
+        rows = self._call(f"SELECT {', '.join(columns)} FROM articles WHERE id = %s", (article_id,))
+        return normalize_article(rows[0]) if rows else None
+
+class SupabaseJobStore:
+    """Job store calling the posting_jobs RPCs through PostgREST."""
+
+    def __init__(self):
+        self.url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+        # The posting_jobs RPCs are only granted to the service role
+        key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+        if not self.url or not key:
+            raise ValueError("NEXT_PUBLIC_SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set "
+                             "in environment variables (or set DATABASE_URL)")
+
+        self.headers = {
+            'apikey': key,
+            'Authorization': f'Bearer {key}',
+            'Content-Type': 'application/json'
+        }
+
+    def _rpc(self, name: str, payload: Dict):
+        response = http_transport.post(f"{self.url}/rest/v1/rpc/{name}", headers=self.headers, json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"{name} failed: {response.status_code} - {response.text}")
+        return response.json()
+
+    def claim(self, platform: str, worker: str, limit: int, lease_seconds: int) -> List[Dict]:
+        return self._rpc('claim_posting_jobs', {
+            'p_platform': platform,
+            'p_worker': worker,
+            'p_limit': limit,
+            'p_lease_seconds': lease_seconds
+        })
+
+    def complete(self, job_id: int, worker: str) -> bool:
+        return bool(self._rpc('complete_posting_job', {'p_id': job_id, 'p_worker': worker}))
+
+    def fail(self, job_id: int, worker: str, error: str, max_attempts: int) -> bool:
+        return bool(self._rpc('fail_posting_job', {
+            'p_id': job_id,
+            'p_worker': worker,
+            'p_error': error,
+            'p_max_attempts': max_attempts
+        }))
+
+    def listen(self) -> bool:
+        """PostgREST cannot LISTEN, so this store is always polled."""
+        return False
+
+    def fetch_article(self, article_id: str, platform: str) -> Optional[Dict]:
+        articles = fetch_articles(self.url, self.headers, {
+            'select': ','.join(_article_columns(platform)),
+            'id': f"eq.{article_id}"
+        })
+        if articles is None:
+            raise RuntimeError(f"Could not load article {article_id}")
+        return articles[0] if articles else None
+
+def get_job_store():
+    """Use Postgres directly when DATABASE_URL is set, otherwise Supabase RPCs."""
+    if os.getenv('DATABASE_URL'):
+        return PostgresJobStore()
+    return SupabaseJobStore()
+
+class PostingWorker:
+    """Claims posting jobs and runs the platform bot for each one."""
+
+    def __init__(self, store, platforms: Optional[List[str]] = None, worker_id: Optional[str] = None,
+                 batch_size: int = 1, lease_seconds: Optional[int] = None):
+        self.store = store
+        self.platforms = platforms or list(BOT_CLASSES)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds or int(os.getenv('POSTING_JOB_LEASE', '600'))
+        self.max_attempts = int(os.getenv('POSTING_JOB_MAX_ATTEMPTS', '5'))
+        self.bots: Dict[str, object] = {}
+
+    def _bot_for(self, platform: str):
+        # One bot per platform keeps clients, sessions and the outbox warm across jobs
+        if platform not in self.bots:
+            module_name, class_name = BOT_CLASSES[platform]
+            module = importlib.import_module(module_name)
+            self.bots[platform] = getattr(module, class_name)()
+        return self.bots[platform]
+
+    def process_job(self, job: Dict) -> bool:
+        """Run one claimed job and settle it in the queue; return True if it is done."""
+        platform = job['platform']
+        try:
+            article = self.store.fetch_article(job['article_id'], platform)
+            if not article:
+                logger.info(f"🗑️  Article {job['article_id']} no longer exists; closing {platform} job {job['id']}")
+                return self.store.complete(job['id'], self.worker_id)
+
+            if article.get(POSTED_COLUMNS[platform]):
+                logger.info(f"✅ Article {job['article_id']} already posted to {platform}; closing job {job['id']}")
+                return self.store.complete(job['id'], self.worker_id)
+
+            bot = self._bot_for(platform)
+            bot.article_source = lambda: article
+            if bot.run():
+                logger.info(f"✅ {platform} job {job['id']} done")
+                return self.store.complete(job['id'], self.worker_id)
+            error = "bot run completed with issues"
+        except Exception as e:
+            error = str(e)
+
+        logger.warning(f"⚠️  {platform} job {job['id']} failed (attempt {job['attempts']}): {error}")
+        self.store.fail(job['id'], self.worker_id, error, self.max_attempts)
+        return False
+
+    def run_once(self, platforms: Optional[List[str]] = None) -> int:
+        """Claim and process one batch per platform; return how many jobs were done."""
+        done = 0
+        for platform in self.platforms if platforms is None else platforms:
+            try:
+                jobs = self.store.claim(platform, self.worker_id, self.batch_size, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Error claiming {platform} jobs: {e}")
+                continue
+
+            for job in jobs:
+                if self.process_job(job):
+                    done += 1
+        return done
+
+    def drain(self, platforms: Optional[List[str]] = None) -> int:
+        """Process jobs until a sweep gets none done; return how many were done.
+
+        Stopping at a sweep with no progress keeps a failing job from being
+        retried back to back; it is picked up again on a later sweep.
+        """
+        total = 0
+        while True:
+            done = self.run_once(platforms)
+            if not done:
+                return total
+            total += done
+
+    def run_forever(self, idle_delay: float = 5.0, max_idle_delay: float = 300.0, listen: bool = True) -> None:
+        """Keep processing jobs, woken by notifications or polling with a backoff.
+
+        While listening, the backoff only bounds how long the worker sleeps
+        between sweeps for requeued and expired-lease jobs, which do not notify.
+        """
+        listening = listen and self.store.listen()
+        mode = "listening for new jobs" if listening else "polling"
+        logger.info(f"🎯 Posting worker {self.worker_id} started for: {', '.join(self.platforms)} ({mode})")
+
+        delay = idle_delay
+        platforms = self.platforms
+        while True:
+            if platforms and self.drain(platforms):
+                delay = idle_delay
+
+            if listening:
+                try:
+                    notified = self.store.wait_for_jobs(delay)
+                except Exception as e:
+                    logger.error(f"Lost job notifications, falling back to polling: {e}")
+                    listening = False
+                    continue
+                if notified:
+                    # Only sweep the platforms that have new jobs
+                    platforms = [platform for platform in notified if platform in self.platforms]
+                    if platforms:
+                        logger.info(f"🔔 New posting jobs for: {', '.join(platforms)}")
+                    continue
+            else:
+                logger.info(f"💤 No posting jobs; checking again in {delay:.0f}s")
+                time.sleep(delay)
+
+            platforms = self.platforms
+            delay = min(delay * 2, max_idle_delay)
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Process queued posting jobs.")
+    parser.add_argument('--platform', action='append', choices=sorted(BOT_CLASSES),
+                        help="Only process jobs for this platform (repeatable)")
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help="Jobs claimed per platform at a time")
+    parser.add_argument('--lease', type=int, default=None,
+                        help="Seconds a claimed job stays leased to this worker")
+    parser.add_argument('--once', action='store_true',
+                        help="Process one batch and exit instead of running as a daemon")
+    parser.add_argument('--poll', action='store_true',
+                        help="Poll for jobs even when DATABASE_URL allows listening for them")
+    parser.add_argument('--max-idle-delay', type=float, default=300,
+                        help="Longest wait in seconds between sweeps of an idle queue")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Main entry point."""
+    args = parse_args(argv)
+    try:
+        worker = PostingWorker(get_job_store(), platforms=args.platform,
+                               batch_size=args.batch_size, lease_seconds=args.lease)
+        if args.once:
+            logger.info(f"Completed {worker.run_once()} posting job(s)")
+        else:
+            worker.run_forever(max_idle_delay=args.max_idle_delay, listen=not args.poll)
+    except KeyboardInterrupt:
+        logger.info("🛑 Interrupted by user")
+    except Exception as e:
+        logger.error(f"Fatal error in main: {e}")
+        return 1
+    finally:
+        http_transport.log_connection_stats()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Token-budgeted prompt builder for the social copy generators.
+Picks the cheapest article field that says enough about the article
+(ai_summary, seo_description, summary, then content), trims it to a per-platform
+token budget at sentence boundaries and sizes max_tokens from the platform's
+character limit, logging the prompt and completion tokens saved against the
+fixed prompts and max_tokens used before. LinkedIn's budget is larger than its
+old max_tokens, which is reported as extra tokens rather than a saving.
+"""
+
+import re
+import math
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Character limits enforced by each platform
+PLATFORM_LIMITS = {
+    'twitter': 280,
+    'linkedin': 1300,
+    'facebook': 63206,
+    'reddit': 300
+}
+
+# Rough characters per token for English text with the GPT tokenizers
+CHARS_PER_TOKEN = 4
+
+# Candidate source fields; ingestion fills ai_summary and seo_description
+SOURCE_FIELDS = ['ai_summary', 'seo_description', 'summary', 'content']
+
+# (minimum tokens a source needs to be sufficient, token budget for the source)
+SOURCE_BUDGETS = {
+    'twitter': (25, 120),
+    'linkedin': (60, 250),
+    'facebook': (50, 200),
+    'reddit': (20, 100),
+    'all': (60, 250)
+}
+
+# Characters each platform's generated copy should fit in. Facebook's hard
+# limit is far beyond any useful post, so a practical length is used instead.
+OUTPUT_CHARS = dict(PLATFORM_LIMITS, facebook=1000)
+
+# Headroom for hashtags and punctuation, which tokenize worse than prose
+OUTPUT_HEADROOM = 1.15
+
+# Extra completion tokens for the JSON keys of the multi-platform response
+JSON_OVERHEAD_TOKENS = 30
+
+# Fixed max_tokens the generators used before, for reporting savings
+LEGACY_MAX_TOKENS = {
+    'twitter': 150,
+    'linkedin': 300,
+    'facebook': 400,
+    'reddit': 100,
+    'all': 900
+}
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def trim_to_tokens(text: str, budget: int) -> str:
+    """Trim text to about budget tokens, cutting at a sentence boundary when possible."""
+    text = ' '.join(text.split())
+    if estimate_tokens(text) <= budget:
+        return text
+
+    kept = ''
+    for sentence in _SENTENCE_END.split(text):
+        candidate = f"{kept} {sentence}".strip()
+        if estimate_tokens(candidate) > budget:
+            break
+        kept = candidate
+    if kept:
+        return kept
+
+    # The first sentence alone is over budget; cut at a word boundary
+    cut = text[:budget * CHARS_PER_TOKEN].rsplit(' ', 1)[0]
+    return f"{cut}..."
+
+def trim_to_chars(text: str, limit: int) -> str:
+    """Trim generated text to limit characters at the last sentence or word boundary."""
+    if len(text) <= limit:
+        return text
+
+    cut = text[:limit]
+    sentence_end = max(cut.rfind('. '), cut.rfind('! '), cut.rfind('? '), cut.rfind('\n'))
+    if sentence_end >= limit // 2:
+        return cut[:sentence_end + 1].strip()
+    return cut.rsplit(' ', 1)[0].strip()
+
+def pick_source(article: Dict, platform: str) -> Optional[str]:
+    """Return the cheapest source field that is sufficient for the platform."""
+    minimum, _ = SOURCE_BUDGETS[platform]
+    available = [field for field in SOURCE_FIELDS if (article.get(field) or '').strip()]
+    if not available:
+        return None
+
+    sufficient = [field for field in available if estimate_tokens(article[field]) >= minimum]
+    if sufficient:
+        return min(sufficient, key=lambda field: len(article[field]))
+    # Nothing is long enough; use the most informative field there is
+    return max(available, key=lambda field: len(article[field]))
+
+def max_tokens_for(platform: str) -> int:
+    """Size the completion budget from the platform's character limit."""
+    if platform == 'all':
+        return sum(max_tokens_for(name) for name in PLATFORM_LIMITS) + JSON_OVERHEAD_TOKENS
+    return math.ceil(OUTPUT_CHARS[platform] / CHARS_PER_TOKEN * OUTPUT_HEADROOM)
+
+def _legacy_text(article: Dict, platform: str) -> str:
+    """Rebuild the article text the generators sent before prompts were budgeted.
+
+    They read summary, else the first 500 characters of content (the Reddit
+    generator only summary), which are the fields the article queries fetch.
+    """
+    text = article.get('title', '')
+    if article.get('summary'):
+        text += f"\n\n{article['summary']}"
+    elif article.get('content') and platform != 'reddit':
+        text += f"\n\n{article['content'][:500]}..."
+    return text
+
+def build_prompt_source(article: Dict, platform: str) -> Dict:
+    """Return the article text and completion budget for a platform's prompt.
+
+    The result holds text, field (the source used), max_tokens, max_chars
+    (the length budget for the generated copy), the estimated prompt tokens
+    of the text, and the prompt and completion tokens saved against the fixed
+    prompts; a saving is negative where the new budget is larger.
+    """
+    _, budget = SOURCE_BUDGETS[platform]
+    field = pick_source(article, platform)
+
+    text = article.get('title', '')
+    if field:
+        text += f"\n\n{trim_to_tokens(article[field], budget)}"
+
+    max_tokens = max_tokens_for(platform)
+    return {
+        'text': text,
+        'field': field,
+        'max_tokens': max_tokens,
+        'max_chars': OUTPUT_CHARS.get(platform),
+        'prompt_tokens': estimate_tokens(text),
+        'prompt_tokens_saved': estimate_tokens(_legacy_text(article, platform)) - estimate_tokens(text),
+        'completion_tokens_saved': LEGACY_MAX_TOKENS[platform] - max_tokens
+    }
+
+def _describe_saving(tokens: int, kind: str) -> str:
+    if tokens < 0:
+        return f"{-tokens} {kind} tokens more"
+    return f"{tokens} {kind} tokens saved"
+
+def log_token_usage(platform: str, plan: Dict, result: Dict) -> None:
+    """Log a completion's token usage next to the savings from the budgeted prompt."""
+    usage = result.get('usage') or {}
+    logger.info(
+        f"🪙 {platform} prompt from {plan['field'] or 'title'}: ~{plan['prompt_tokens']} prompt tokens; "
+        f"against the fixed prompts ~{_describe_saving(plan['prompt_tokens_saved'], 'prompt')}, "
+        f"{_describe_saving(plan['completion_tokens_saved'], 'max completion')}; "
+        f"used {usage.get('prompt_tokens', '?')} prompt + {usage.get('completion_tokens', '?')} completion tokens"
+    )
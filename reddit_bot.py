@@ -5,11 +5,29 @@ Retrieves latest article from Supabase, summarizes it, and posts to relevant sub
 """
 
 import os
+import re
 import json
-import requests
+import asyncio
+import argparse
+import http_transport
+import async_transport
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List
+from typing import Awaitable, Callable, Dict, Optional, List, Tuple
 import logging
+from article_queries import (fetch_next_unposted, fetch_next_unposted_async, mark_articles_posted,
+                            mark_articles_posted_async)
+from batch_posting import run_batch, run_batch_async
+from post_outbox import DEFERRED_ERRORS, PostDeferred, PostOutbox
+from posting_scheduler import get_scheduler
+from multi_platform_generator import finish_reddit_title, get_precomputed_copy
+from generation_cache import cached_generation
+from llm_router import generate_async, get_llm_router
+from prompt_builder import build_prompt_source, log_token_usage, trim_to_chars
+from template_generator import fallback_copy
+from run_prefetch import Prefetch
+from run_budget import budget_exhausted, finish_run, run_scoped
+from circuit_breaker import get_circuit_breaker
+from identity_cache import credential_key, get_identity_cache
 try:
     from dotenv import load_dotenv
 except ImportError:
@@ -31,6 +49,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Wait in a RATELIMIT error, e.g. "Take a break for 9 minutes before trying again"
+RATELIMIT_WAIT = re.compile(r'(\d+)\s*(second|minute|hour)', re.IGNORECASE)
+UNIT_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+def ratelimit_seconds(body: Dict) -> Optional[float]:
+    """Return how long Reddit asks to wait if a submit body carries a RATELIMIT error."""
+    for error in body.get('errors') or []:
+        if error and error[0] == 'RATELIMIT':
+            if body.get('ratelimit'):
+                return float(body['ratelimit'])
+            match = RATELIMIT_WAIT.search(error[1] if len(error) > 1 else '')
+            if match:
+                return float(match.group(1)) * UNIT_SECONDS[match.group(2).lower()]
+            return 60.0
+    return None
+
 class SupabaseClient:
     """Client for interacting with Supabase database."""
     
@@ -47,25 +81,15 @@ class SupabaseClient:
             'Content-Type': 'application/json'
         }
     
-    def get_latest_article(self) -> Optional[Dict]:
-        """Retrieve the latest article from the database."""
+    def get_latest_article(self, accept: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        """Retrieve the newest article not yet posted to Reddit."""
         try:
-            response = requests.get(
-                f"{self.url}/rest/v1/articles",
-                headers=self.headers,
-                params={
-                    'select': '*',
-                    'order': 'published_at.desc',
-                    'limit': '1'
-                }
-            )
+            # Filter on posted_to_reddit_at server-side and fetch only the columns we use
+            article = fetch_next_unposted(self.url, self.headers, 'reddit', accept)
+            if article:
+                return article
             
-            if response.status_code == 200:
-                data = response.json()
-                if data and len(data) > 0:
-                    return data[0]
-            
-            logger.warning("No articles found in database")
+            logger.warning("No unposted articles found in database")
             return None
             
         except Exception as e:
@@ -77,7 +101,7 @@ class SupabaseClient:
         try:
             field_name = f"posted_to_{platform}_at"
             
-            response = requests.patch(
+            response = http_transport.patch(
                 f"{self.url}/rest/v1/articles",
                 headers=self.headers,
                 json={
@@ -86,7 +110,7 @@ class SupabaseClient:
                 params={'id': f'eq.{article_id}'}
             )
             
-            if response.status_code == 200:
+            if response.status_code in (200, 204):
                 logger.info(f"Marked article {article_id} as posted to {platform}")
                 return True
             else:
@@ -101,25 +125,18 @@ class OpenAIClient:
     """Client for OpenAI API to generate Reddit post content."""
     
     def __init__(self):
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
-            raise ValueError("OpenAI API key must be set in environment variables")
-        
-        self.base_url = "https://api.openai.com/v1"
-        self.headers = {
-            'Authorization': f'Bearer {self.api_key}',
-            'Content-Type': 'application/json'
-        }
+        # Sends each completion to the fastest healthy configured provider
+        self.router = get_llm_router()
+        self.model = 'gpt-3.5-turbo'
+        self.temperature = 0.7
     
+    @cached_generation('reddit', prompt_version=3)
     def generate_reddit_title(self, article: Dict) -> Optional[str]:
         """Generate a Reddit post title from article content."""
         try:
-            title = article.get('title', '')
-            summary = article.get('summary', '')
-            
-            text_to_summarize = title
-            if summary:
-                text_to_summarize += f"\n\n{summary}"
+            # Budget the article text by tokens for this platform
+            plan = build_prompt_source(article, 'reddit')
+            text_to_summarize = plan['text']
             
             prompt = f"""
             Create an engaging Reddit post title about this article. The title should:
@@ -134,41 +151,31 @@ class OpenAIClient:
             Format: Just the title, no quotes or extra formatting
             """
             
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={
-                    'model': 'gpt-3.5-turbo',
-                    'messages': [
-                        {
-                            'role': 'system',
-                            'content': 'You are a Reddit expert who creates engaging, rule-compliant post titles.'
-                        },
-                        {
-                            'role': 'user',
-                            'content': prompt
-                        }
-                    ],
-                    'max_tokens': 100,
-                    'temperature': 0.7
-                }
-            )
+            result = self.router.stream_text({
+                'model': self.model,
+                'messages': [
+                    {
+                        'role': 'system',
+                        'content': 'You are a Reddit expert who creates engaging, rule-compliant post titles.'
+                    },
+                    {
+                        'role': 'user',
+                        'content': prompt
+                    }
+                ],
+                'max_tokens': plan['max_tokens'],
+                'temperature': self.temperature
+            }, plan['max_chars'])
             
-            if response.status_code == 200:
-                result = response.json()
-                reddit_title = result['choices'][0]['message']['content'].strip()
-                
-                # Remove quotes if present
-                if reddit_title.startswith('"') and reddit_title.endswith('"'):
-                    reddit_title = reddit_title[1:-1]
-                
-                # Ensure title is under Reddit's limit
-                if len(reddit_title) > 300:
-                    reddit_title = reddit_title[:297] + "..."
+            if result:
+                log_token_usage('reddit', plan, result)
+                # Reading stopped at the length budget; end on a clean boundary
+                reddit_title = trim_to_chars(result['text'].strip(), plan['max_chars'])
                 
-                return reddit_title
+                # Remove quotes and enforce Reddit's title limit
+                return finish_reddit_title(reddit_title, article)
             else:
-                logger.error(f"OpenAI API error: {response.status_code} - {response.text}")
+                logger.error("Failed to get a completion from any LLM provider")
                 return None
                 
         except Exception as e:
@@ -189,17 +196,32 @@ class RedditClient:
             raise ValueError("Reddit API credentials must be set in environment variables")
         
         self.access_token = None
+        self.account = self.username
+        self.scheduler = get_scheduler()
+        self.identity = get_identity_cache()
+        self.token_key = f"reddit:token:{credential_key(self.client_id, self.username)}"
         self.base_url = "https://oauth.reddit.com"
         self.headers = {
             'User-Agent': self.user_agent
         }
     
     def authenticate(self) -> bool:
-        """Authenticate with Reddit API."""
+        """Authenticate with Reddit API, reusing the cached token while it is valid."""
+        access_token = self.identity.get_or_fetch(self.token_key, self.fetch_token)
+        if not access_token:
+            return False
+        
+        self.access_token = access_token
+        self.headers['Authorization'] = f'Bearer {self.access_token}'
+        return True
+    
+    def fetch_token(self) -> Optional[Tuple[str, float]]:
+        """Request a new password-grant access token; return it with its lifetime."""
         try:
-            auth_response = requests.post(
+            auth_response = http_transport.post(
                 'https://www.reddit.com/api/v1/access_token',
-                headers=self.headers,
+                headers={'User-Agent': self.user_agent},
+                idempotent=True,
                 data={
                     'grant_type': 'password',
                     'username': self.username,
@@ -210,17 +232,16 @@ class RedditClient:
             
             if auth_response.status_code == 200:
                 token_data = auth_response.json()
-                self.access_token = token_data.get('access_token')
-                self.headers['Authorization'] = f'Bearer {self.access_token}'
                 logger.info("Successfully authenticated with Reddit")
-                return True
+                # Expire the cached token a minute early so it is never used stale
+                return token_data['access_token'], max(60, token_data.get('expires_in', 3600) - 60)
             else:
                 logger.error(f"Reddit authentication failed: {auth_response.status_code}")
-                return False
+                return None
                 
         except Exception as e:
             logger.error(f"Error authenticating with Reddit: {e}")
-            return False
+            return None
     
     def get_subreddit_suggestions(self, article: Dict) -> List[str]:
         """Get relevant subreddits for an article."""
@@ -244,96 +265,203 @@ class RedditClient:
         
         return subreddits[:3]  # Limit to 3 subreddits
     
+    def is_down(self) -> bool:
+        """Return True while the circuit of the posting endpoint is open."""
+        return get_circuit_breaker().is_open(f"{self.base_url}/api/submit")
+    
+    def submitted_id(self, subreddit: str, result: Dict) -> Optional[str]:
+        """Return the post id from a submit response, deferring the post if Reddit rate-limited it.
+        
+        Reddit reports its posting limit as HTTP 200 with a RATELIMIT error,
+        which the rate-limit headers do not show, so it is fed to the scheduler.
+        """
+        body = result.get('json', result)
+        wait = ratelimit_seconds(body)
+        if wait is not None:
+            self.scheduler.throttle('reddit', self.account, wait)
+            raise PostDeferred(f"Reddit rate-limited posting for {wait:.0f}s")
+        
+        if 'data' in body and 'id' in body['data']:
+            post_id = body['data']['id']
+            logger.info(f"Successfully posted to r/{subreddit}: {post_id}")
+            return post_id
+        logger.error(f"Unexpected Reddit response format: {result}")
+        return None
+    
     def post_link(self, subreddit: str, title: str, url: str) -> Optional[str]:
         """Post a link to a subreddit."""
         try:
-            if not self.access_token:
-                if not self.authenticate():
-                    return None
+            # A local cache lookup; picks up tokens refreshed in the background
+            if not self.authenticate():
+                return None
+            
+            if not self.scheduler.acquire('reddit', self.account):
+                raise PostDeferred("Reddit posting quota exhausted for this run")
             
-            response = requests.post(
+            response = http_transport.post(
                 f"{self.base_url}/api/submit",
                 headers=self.headers,
                 data={
                     'sr': subreddit,
                     'title': title,
                     'url': url,
-                    'kind': 'link'
+                    'kind': 'link',
+                    'api_type': 'json'
                 }
             )
+            self.scheduler.observe('reddit', self.account, response)
+            
+            if response.status_code == 401:
+                # The cached token was revoked; authenticate again on the next post
+                self.identity.invalidate(self.token_key)
+                self.access_token = None
             
             if response.status_code == 200:
-                result = response.json()
-                if 'data' in result and 'id' in result['data']:
-                    post_id = result['data']['id']
-                    logger.info(f"Successfully posted to r/{subreddit}: {post_id}")
-                    return post_id
-                else:
-                    logger.error(f"Unexpected Reddit response format: {result}")
-                    return None
+                return self.submitted_id(subreddit, response.json())
             else:
                 logger.error(f"Reddit API error: {response.status_code} - {response.text}")
                 return None
                 
+        except DEFERRED_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Error posting to Reddit: {e}")
+            # The platform may have accepted the post; let the outbox decide
+            if http_transport.is_ambiguous_failure(e):
+                raise
             return None
 
 class RedditBot:
     """Main bot class that orchestrates the Reddit posting process."""
     
-    def __init__(self):
+    def __init__(self, article_source: Optional[Callable[[], Optional[Dict]]] = None):
         self.supabase = SupabaseClient()
+        # Callers such as master_social_bot can inject an already-fetched article
+        self.article_source = article_source or self.next_article
         self.openai = OpenAIClient()
         self.reddit = RedditClient()
+        self.outbox = PostOutbox()
+    
+    def outbox_account(self, subreddit: str) -> str:
+        """Outbox account key; each subreddit is posted to at most once."""
+        return f"{self.reddit.account}/r/{subreddit}"
+    
+    def post_payload(self, payload: Dict) -> Optional[str]:
+        """Post a payload stored in the outbox."""
+        return self.reddit.post_link(payload['subreddit'], payload['title'], payload['url'])
+    
+    def settle_outbox(self) -> None:
+        """Retry due dead letters and acknowledge posts left unmarked by earlier runs."""
+        self.outbox.retry_due('reddit', self.post_payload)
+        self.outbox.replay_acks(
+            'reddit',
+            lambda article_ids: mark_articles_posted(self.supabase.url, self.supabase.headers, 'reddit', article_ids)
+        )
+    
+    def pending_subreddits(self, article: Dict) -> List[str]:
+        """Return relevant subreddits the outbox allows posting the article to."""
+        return [
+            subreddit for subreddit in self.reddit.get_subreddit_suggestions(article)
+            if self.outbox.can_post(article['id'], 'reddit', self.outbox_account(subreddit))
+        ]
+    
+    def has_pending_post(self, article: Dict) -> bool:
+        """Return True if the article can still be posted to any subreddit."""
+        return bool(self.pending_subreddits(article))
+    
+    def next_article(self) -> Optional[Dict]:
+        """Return the newest unposted article the outbox allows posting now."""
+        return self.supabase.get_latest_article(accept=self.has_pending_post)
     
+    def generate_copy(self, article: Dict) -> Optional[str]:
+        """Return the post title, preferring copy the master bot generated.
+        
+        Falls back to template copy when the LLM is slow, over budget or failing.
+        """
+        return (get_precomputed_copy(article, 'reddit') or self.openai.generate_reddit_title(article)
+                or fallback_copy(article, 'reddit'))
+    
+    def publish_copy(self, article: Dict, reddit_title: str) -> int:
+        """Post to each pending subreddit at most once; return how many posts went through."""
+        posted_count = 0
+        affiliate_url = article.get('affiliate_url') or article.get('url')
+        
+        for subreddit in self.pending_subreddits(article):
+            if posted_count and budget_exhausted():
+                # Extra subreddits are optional; keep the reserve for marking the article
+                logger.warning("⏳ Run budget spent; skipping the remaining subreddits")
+                break
+            try:
+                payload = {'subreddit': subreddit, 'title': reddit_title, 'url': affiliate_url}
+                post_id = self.outbox.publish(article['id'], 'reddit', self.outbox_account(subreddit),
+                                              payload, self.post_payload)
+                if post_id:
+                    posted_count += 1
+                    logger.info(f"Successfully posted to r/{subreddit}")
+                
+            except Exception as e:
+                logger.error(f"Error posting to r/{subreddit}: {e}")
+                continue
+        
+        return posted_count
+    
+    def prefetch(self) -> Prefetch:
+        """Start the steps that do not need the article: authentication and connection warm-up."""
+        return Prefetch({
+            'auth': self.reddit.authenticate,
+            'platform': lambda: http_transport.preconnect(self.reddit.base_url),
+            'llm': lambda: self.openai.router.preconnect(self.openai.model)
+        })
+    
+    @run_scoped
+    def run_batch(self, count: int) -> bool:
+        """Post up to count pending articles in one run."""
+        return run_batch(self, 'reddit', count)
+    
+    @run_scoped
     def run(self) -> bool:
         """Main execution method."""
         try:
             logger.info("Starting Reddit bot execution...")
+            if self.reddit.is_down():
+                logger.warning("⛔ Reddit circuit is open; skipping this run")
+                return False
+            # Auth and connection warm-up overlap the article query and generation
+            prefetch = self.prefetch()
+            self.settle_outbox()
             
             # Get latest article
-            article = self.supabase.get_latest_article()
+            article = self.article_source()
             if not article:
                 logger.info("No new articles to post")
                 return False
             
             logger.info(f"Found article: {article.get('title', 'Unknown')}")
             
+            # Get relevant subreddits not already posted to according to the outbox
+            subreddits = self.pending_subreddits(article)
+            if not subreddits:
+                logger.info("Article already posted or awaiting retry according to the outbox")
+                return False
+            logger.info(f"Targeting subreddits: {subreddits}")
+            
             # Generate Reddit title
-            reddit_title = self.openai.generate_reddit_title(article)
+            reddit_title = self.generate_copy(article)
             if not reddit_title:
                 logger.error("Failed to generate Reddit title")
                 return False
             
             logger.info(f"Generated Reddit title: {reddit_title}")
             
-            # Get relevant subreddits
-            subreddits = self.reddit.get_subreddit_suggestions(article)
-            logger.info(f"Targeting subreddits: {subreddits}")
-            
-            # Post to subreddits
-            posted_count = 0
-            affiliate_url = article.get('affiliate_url') or article.get('url')
-            
-            for subreddit in subreddits:
-                try:
-                    post_id = self.reddit.post_link(subreddit, reddit_title, affiliate_url)
-                    if post_id:
-                        posted_count += 1
-                        logger.info(f"Successfully posted to r/{subreddit}")
-                    
-                    # Add delay between posts to respect rate limits
-                    import time
-                    time.sleep(60)  # Wait 1 minute between posts
-                    
-                except Exception as e:
-                    logger.error(f"Error posting to r/{subreddit}: {e}")
-                    continue
+            prefetch.wait()
+            # Post to subreddits, each at most once per article
+            posted_count = self.publish_copy(article, reddit_title)
             
             if posted_count > 0:
-                # Mark article as posted
+                # Mark article as posted, using the reserve held back for it
+                finish_run()
                 if self.supabase.mark_article_as_posted(article['id'], 'reddit'):
+                    self.outbox.record_acked([article['id']], 'reddit')
                     logger.info(f"Successfully completed Reddit post cycle - posted to {posted_count} subreddits")
                     return True
                 else:
@@ -347,17 +475,264 @@ class RedditBot:
             logger.error(f"Error in Reddit bot execution: {e}")
             return False
 
-def main():
+class AsyncSupabaseClient(SupabaseClient):
+    """SupabaseClient with coroutine methods for the asyncio bots."""
+    
+    async def get_latest_article(self, accept: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        """Retrieve the newest article not yet posted to Reddit."""
+        try:
+            article = await fetch_next_unposted_async(self.url, self.headers, 'reddit', accept)
+            if article:
+                return article
+                
+            logger.warning("No unposted articles found in database")
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error retrieving latest article: {e}")
+            return None
+    
+    async def mark_article_as_posted(self, article_id: str, platform: str) -> bool:
+        """Mark an article as posted to a specific platform."""
+        try:
+            return await mark_articles_posted_async(self.url, self.headers, platform, [article_id])
+        except Exception as e:
+            logger.error(f"Error marking article as posted to {platform}: {e}")
+            return False
+
+class AsyncOpenAIClient(OpenAIClient):
+    """OpenAIClient whose generation runs off the event loop."""
+    
+    async def generate_reddit_title(self, article: Dict) -> Optional[str]:
+        """Generate a Reddit post title from article content."""
+        return await generate_async(super().generate_reddit_title, article)
+
+class AsyncRedditClient(RedditClient):
+    """RedditClient with coroutine methods for the asyncio bots."""
+    
+    async def authenticate(self) -> bool:
+        """Authenticate with Reddit API, reusing the cached token while it is valid."""
+        access_token = await self.identity.get_or_fetch_async(self.token_key, self.fetch_token)
+        if not access_token:
+            return False
+            
+        self.access_token = access_token
+        self.headers['Authorization'] = f'Bearer {self.access_token}'
+        return True
+    
+    async def fetch_token(self) -> Optional[Tuple[str, float]]:
+        """Request a new password-grant access token; return it with its lifetime."""
+        try:
+            auth_response = await async_transport.post(
+                'https://www.reddit.com/api/v1/access_token',
+                headers={'User-Agent': self.user_agent},
+                idempotent=True,
+                data={
+                    'grant_type': 'password',
+                    'username': self.username,
+                    'password': self.password
+                },
+                auth=(self.client_id, self.client_secret)
+            )
+            
+            if auth_response.status_code == 200:
+                token_data = auth_response.json()
+                logger.info("Successfully authenticated with Reddit")
+                return token_data['access_token'], max(60, token_data.get('expires_in', 3600) - 60)
+            else:
+                logger.error(f"Reddit authentication failed: {auth_response.status_code}")
+                return None
+                
+        except Exception as e:
+            logger.error(f"Error authenticating with Reddit: {e}")
+            return None
+    
+    async def post_link(self, subreddit: str, title: str, url: str) -> Optional[str]:
+        """Post a link to a subreddit."""
+        try:
+            if not await self.authenticate():
+                return None
+                
+            if not await self.scheduler.acquire_async('reddit', self.account):
+                raise PostDeferred("Reddit posting quota exhausted for this run")
+                
+            response = await async_transport.post(
+                f"{self.base_url}/api/submit",
+                headers=self.headers,
+                data={
+                    'sr': subreddit,
+                    'title': title,
+                    'url': url,
+                    'kind': 'link',
+                    'api_type': 'json'
+                }
+            )
+            self.scheduler.observe('reddit', self.account, response)
+            
+            if response.status_code == 401:
+                self.identity.invalidate(self.token_key)
+                self.access_token = None
+                
+            if response.status_code == 200:
+                return self.submitted_id(subreddit, response.json())
+            else:
+                logger.error(f"Reddit API error: {response.status_code} - {response.text}")
+                return None
+                
+        except DEFERRED_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Error posting to Reddit: {e}")
+            if http_transport.is_ambiguous_failure(e):
+                raise
+            return None
+
+class AsyncRedditBot(RedditBot):
+    """RedditBot driven by an event loop; run() and run_batch() are coroutines."""
+    
+    def __init__(self, article_source: Optional[Callable[[], Awaitable[Optional[Dict]]]] = None):
+        self.supabase = AsyncSupabaseClient()
+        self.article_source = article_source or self.next_article
+        self.openai = AsyncOpenAIClient()
+        self.reddit = AsyncRedditClient()
+        self.outbox = PostOutbox()
+    
+    async def post_payload(self, payload: Dict) -> Optional[str]:
+        """Post a payload stored in the outbox."""
+        return await self.reddit.post_link(payload['subreddit'], payload['title'], payload['url'])
+    
+    async def settle_outbox(self) -> None:
+        """Retry due dead letters and acknowledge posts left unmarked by earlier runs."""
+        await self.outbox.retry_due_async('reddit', self.post_payload)
+        await self.outbox.replay_acks_async(
+            'reddit',
+            lambda article_ids: mark_articles_posted_async(self.supabase.url, self.supabase.headers, 'reddit',
+                                                           article_ids)
+        )
+    
+    async def next_article(self) -> Optional[Dict]:
+        """Return the newest unposted article the outbox allows posting now."""
+        return await self.supabase.get_latest_article(accept=self.has_pending_post)
+    
+    async def generate_copy(self, article: Dict) -> Optional[str]:
+        """Return the post title, preferring precomputed copy and falling back to a template."""
+        return (get_precomputed_copy(article, 'reddit') or await self.openai.generate_reddit_title(article)
+                or fallback_copy(article, 'reddit'))
+    
+    async def publish_copy(self, article: Dict, reddit_title: str) -> int:
+        """Post to each pending subreddit at most once; return how many posts went through."""
+        posted_count = 0
+        affiliate_url = article.get('affiliate_url') or article.get('url')
+        
+        for subreddit in self.pending_subreddits(article):
+            if posted_count and budget_exhausted():
+                # Extra subreddits are optional; keep the reserve for marking the article
+                logger.warning("⏳ Run budget spent; skipping the remaining subreddits")
+                break
+            try:
+                payload = {'subreddit': subreddit, 'title': reddit_title, 'url': affiliate_url}
+                post_id = await self.outbox.publish_async(article['id'], 'reddit', self.outbox_account(subreddit),
+                                                          payload, self.post_payload)
+                if post_id:
+                    posted_count += 1
+                    logger.info(f"Successfully posted to r/{subreddit}")
+                    
+            except Exception as e:
+                logger.error(f"Error posting to r/{subreddit}: {e}")
+                continue
+                
+        return posted_count
+    
+    def prefetch(self) -> asyncio.Future:
+        """Start authentication and the LLM connection warm-up while the article is fetched."""
+        return asyncio.gather(
+            self.reddit.authenticate(),
+            asyncio.to_thread(self.openai.router.preconnect, self.openai.model),
+            return_exceptions=True
+        )
+    
+    @run_scoped
+    async def run_batch(self, count: int) -> bool:
+        """Post up to count pending articles in one run."""
+        return await run_batch_async(self, 'reddit', count)
+    
+    @run_scoped
+    async def run(self) -> bool:
+        """Main execution method."""
+        try:
+            logger.info("Starting async Reddit bot execution...")
+            if self.reddit.is_down():
+                logger.warning("⛔ Reddit circuit is open; skipping this run")
+                return False
+            prefetch = self.prefetch()
+            await self.settle_outbox()
+            
+            article = await self.article_source()
+            if not article:
+                logger.info("No new articles to post")
+                return False
+                
+            logger.info(f"Found article: {article.get('title', 'Unknown')}")
+            
+            subreddits = self.pending_subreddits(article)
+            if not subreddits:
+                logger.info("Article already posted or awaiting retry according to the outbox")
+                return False
+            logger.info(f"Targeting subreddits: {subreddits}")
+            
+            reddit_title = await self.generate_copy(article)
+            if not reddit_title:
+                logger.error("Failed to generate Reddit title")
+                return False
+                
+            logger.info(f"Generated Reddit title: {reddit_title}")
+            
+            await prefetch
+            posted_count = await self.publish_copy(article, reddit_title)
+            
+            if posted_count > 0:
+                finish_run()
+                if await self.supabase.mark_article_as_posted(article['id'], 'reddit'):
+                    self.outbox.record_acked([article['id']], 'reddit')
+                    logger.info(f"Successfully completed Reddit post cycle - posted to {posted_count} subreddits")
+                else:
+                    logger.warning("Reddit posts successful but failed to mark article as posted")
+                return True
+            else:
+                logger.error("Failed to post to any subreddits")
+                return False
+                
+        except Exception as e:
+            logger.error(f"Error in Reddit bot execution: {e}")
+            return False
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Post the latest unposted article to Reddit.")
+    parser.add_argument('--batch', type=int, default=None, metavar='N',
+                        help="Post up to N pending articles in this run")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Run on an asyncio event loop (requires aiohttp)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main entry point."""
+    args = parse_args(argv)
     try:
-        bot = RedditBot()
-        success = bot.run()
+        if args.use_async:
+            bot = AsyncRedditBot()
+            success = async_transport.run(bot.run_batch(args.batch) if args.batch else bot.run())
+        else:
+            bot = RedditBot()
+            success = bot.run_batch(args.batch) if args.batch else bot.run()
         
         if success:
             logger.info("Reddit bot completed successfully")
         else:
             logger.warning("Reddit bot completed with issues")
             
+        http_transport.log_connection_stats()
+            
     except Exception as e:
         logger.error(f"Fatal error in main: {e}")
         return 1
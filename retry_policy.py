@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Rate-limit-aware retry engine for the social media bots.
+Retries 429 and 5xx responses with jittered backoff, reading each provider's
+rate-limit headers (Retry-After, Twitter x-rate-limit-reset, Reddit
+X-Ratelimit-Reset, OpenAI x-ratelimit-reset-*, Graph API usage headers) to
+wait exactly as long as the provider asks, and gives up early when the run's
+deadline cannot absorb the wait. Outside a bot run there is no deadline; long
+running workers bound their own work with a RunDeadline (see run_budget).
+"""
+
+import re
+import json
+import time
+import random
+import requests
+import urllib3
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, Tuple
+import logging
+from run_budget import current_deadline
+
+logger = logging.getLogger(__name__)
+
+# Graph API error codes that mean "throttled" even though the status is 400/403
+GRAPH_THROTTLE_CODES = {4, 17, 32, 613, 80001, 80004}
+
+class RetryPolicy:
+    """How many times to retry and how long to back off between attempts."""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0,
+                 max_delay: float = 60.0, retry_server_errors: bool = True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # POSTs that create content must not be replayed after a 5xx or a
+        # read timeout because the platform may already have accepted them
+        self.retry_server_errors = retry_server_errors
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given zero-based attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+def run_deadline() -> Optional[float]:
+    """Return the monotonic time by which the current bot run must finish.
+
+    This is the active RunDeadline (see run_budget), or None outside a run,
+    where only the retry policy's attempt limit bounds retrying.
+    """
+    deadline = current_deadline()
+    return deadline.at() if deadline is not None else None
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse OpenAI-style durations such as '20ms', '1s' or '6m0s'."""
+    total = 0.0
+    matched = False
+    for amount, unit in re.findall(r'([\d.]+)(ms|s|m|h)', value):
+        matched = True
+        total += float(amount) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+    return total if matched else None
+
+def _is_graph_throttle(response: requests.Response) -> bool:
+    """Return True for Graph API throttling errors reported as 400/403."""
+    if response.status_code not in (400, 403):
+        return False
+    try:
+        error = response.json().get('error', {})
+        return error.get('code') in GRAPH_THROTTLE_CODES
+    except (ValueError, AttributeError):
+        return False
+
+def retry_after_wait(response: requests.Response) -> Optional[float]:
+    """Return the Retry-After wait in seconds, given as seconds or an HTTP date."""
+    retry_after = response.headers.get('Retry-After')
+    if not retry_after:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+def rate_limit_wait(response: requests.Response) -> Optional[float]:
+    """Return the wait in seconds that the provider's headers ask for, if any."""
+    headers = response.headers
+
+    retry_after = retry_after_wait(response)
+    if retry_after is not None:
+        return retry_after
+
+    # Twitter: epoch seconds at which the window resets
+    twitter_reset = headers.get('x-rate-limit-reset')
+    if twitter_reset and headers.get('x-rate-limit-remaining', '0') == '0':
+        try:
+            return max(float(twitter_reset) - time.time(), 0.0)
+        except ValueError:
+            pass
+
+    # Reddit: seconds until the window resets
+    reddit_reset = headers.get('X-Ratelimit-Reset')
+    reddit_remaining = headers.get('X-Ratelimit-Remaining')
+    if reddit_reset and reddit_remaining is not None:
+        try:
+            if float(reddit_remaining) < 1:
+                return max(float(reddit_reset), 0.0)
+        except ValueError:
+            pass
+
+    # OpenAI: durations until the request and token budgets reset
+    openai_waits = [
+        _parse_duration(headers[name])
+        for name in ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens')
+        if headers.get(name)
+    ]
+    openai_waits = [wait for wait in openai_waits if wait is not None]
+    if openai_waits:
+        return max(openai_waits)
+
+    # Graph API: minutes until access is regained, per business use case
+    usage = headers.get('X-Business-Use-Case-Usage')
+    if usage:
+        try:
+            minutes = [
+                entry.get('estimated_time_to_regain_access', 0)
+                for entries in json.loads(usage).values()
+                for entry in entries
+            ]
+            if minutes and max(minutes) > 0:
+                return max(minutes) * 60.0
+        except (ValueError, AttributeError, TypeError):
+            pass
+
+    return None
+
+def rate_limit_state(response: requests.Response) -> Optional[Tuple[float, Optional[float]]]:
+    """Return (remaining, seconds until reset) from the provider's quota headers.
+
+    Understands Twitter x-rate-limit-*, Reddit X-Ratelimit-* and OpenAI
+    x-ratelimit-*-requests headers. Returns None when none are present.
+    """
+    headers = response.headers
+
+    twitter_remaining = headers.get('x-rate-limit-remaining')
+    if twitter_remaining is not None:
+        try:
+            reset = headers.get('x-rate-limit-reset')
+            return float(twitter_remaining), (max(float(reset) - time.time(), 0.0) if reset else None)
+        except ValueError:
+            return None
+
+    reddit_remaining = headers.get('X-Ratelimit-Remaining')
+    if reddit_remaining is not None:
+        try:
+            reset = headers.get('X-Ratelimit-Reset')
+            return float(reddit_remaining), (float(reset) if reset else None)
+        except ValueError:
+            return None
+
+    openai_remaining = headers.get('x-ratelimit-remaining-requests')
+    if openai_remaining is not None:
+        try:
+            reset = headers.get('x-ratelimit-reset-requests')
+            return float(openai_remaining), (_parse_duration(reset) if reset else None)
+        except ValueError:
+            return None
+
+    return None
+
+def is_retryable(response: requests.Response, policy: RetryPolicy) -> bool:
+    """Return True if the response is a throttle or a retryable server error."""
+    if response.status_code == 429 or _is_graph_throttle(response):
+        return True
+    return policy.retry_server_errors and response.status_code >= 500
+
+def is_connect_failure(error: Exception) -> bool:
+    """Return True if a request failed before anything was sent.
+
+    Covers connect timeouts, refused connections, DNS failures and TLS
+    handshake errors; requests wraps the last three in a plain ConnectionError.
+    """
+    if isinstance(error, (requests.exceptions.ConnectTimeout, requests.exceptions.SSLError)):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError) or not error.args:
+        return False
+    # urllib3 reports the underlying cause on the MaxRetryError it raised
+    reason = getattr(error.args[0], 'reason', error.args[0])
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+def error_retry_wait(error: Exception, policy: RetryPolicy, attempt: int, deadline: Optional[float],
+                     description: str = "request") -> Optional[float]:
+    """Return how long to wait before retrying a failed connection, or None to give up.
+
+    A failed connect never reached the server and is always safe to retry;
+    other connection errors only when replays are allowed.
+    """
+    safe = is_connect_failure(error) or policy.retry_server_errors
+    if not safe or attempt + 1 >= policy.max_attempts:
+        return None
+    wait = policy.backoff(attempt)
+    if deadline is not None and time.monotonic() + wait >= deadline:
+        return None
+    logger.warning(f"🔁 {description} failed ({error}), retrying in {wait:.1f}s")
+    return wait
+
+def response_retry_wait(response: requests.Response, policy: RetryPolicy, attempt: int, deadline: Optional[float],
+                        description: str = "request") -> Optional[float]:
+    """Return how long to wait before retrying a response, or None to return it as is.
+
+    Without a run deadline a wait the provider asks for that is longer than
+    the policy's max_delay is not taken; the response is returned so the
+    caller can reschedule instead of blocking until the provider's reset.
+    """
+    if not is_retryable(response, policy) or attempt + 1 >= policy.max_attempts:
+        return None
+
+    # Rate-limit headers are sent on every response, so only trust them
+    # for throttles; a 5xx only gets an explicit Retry-After
+    if response.status_code >= 500:
+        header_wait = retry_after_wait(response)
+    else:
+        header_wait = rate_limit_wait(response)
+    if header_wait is not None:
+        # Honour the provider's wait exactly, plus a little jitter so
+        # concurrent bots do not all fire at the reset instant
+        wait = header_wait + random.uniform(0, 1)
+        if deadline is None and header_wait > policy.max_delay:
+            logger.warning(
+                f"⏳ {description} returned {response.status_code}; "
+                f"provider asks to wait {header_wait:.1f}s, over the {policy.max_delay:.0f}s limit, giving up"
+            )
+            return None
+    else:
+        wait = policy.backoff(attempt)
+
+    remaining = deadline - time.monotonic() if deadline is not None else float('inf')
+    if wait >= remaining:
+        logger.warning(
+            f"⏳ {description} returned {response.status_code}; "
+            f"wait of {wait:.1f}s exceeds remaining run budget of {max(remaining, 0):.1f}s, giving up"
+        )
+        return None
+
+    logger.warning(f"🔁 {description} returned {response.status_code}, retrying in {wait:.1f}s")
+    return wait
+
+def send_with_retry(send: Callable[[], requests.Response], policy: RetryPolicy,
+                    deadline: Optional[float] = None,
+                    description: str = "request") -> requests.Response:
+    """Call send() until it succeeds, retries are exhausted or the deadline hits.
+
+    deadline defaults to the active run's; without either, only the policy's
+    attempt limit stops retrying.
+
+    The last response is returned when retrying stops, so callers keep their
+    existing status-code handling. Connection errors are re-raised.
+    """
+    deadline = deadline if deadline is not None else run_deadline()
+
+    attempt = 0
+    while True:
+        try:
+            response = send()
+        except (requests.exceptions.ConnectTimeout, requests.exceptions.ConnectionError) as e:
+            wait = error_retry_wait(e, policy, attempt, deadline, description)
+            if wait is None:
+                raise
+            time.sleep(wait)
+            attempt += 1
+            continue
+
+        wait = response_retry_wait(response, policy, attempt, deadline, description)
+        if wait is None:
+            return response
+        response.close()
+        time.sleep(wait)
+        attempt += 1
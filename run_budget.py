@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Run-scoped time budget for the social media bots.
+Each bot run gets a RunDeadline (BOT_RUN_TIMEOUT seconds, default 300) that
+every network call, retry wait, quota wait and LLM stream draws its timeout
+from, so later stages only get what earlier ones left over. The last few
+seconds (BOT_RUN_RESERVE) are held back so a run that is out of time can
+still mark what it already posted; optional work such as extra subreddits is
+skipped once only the reserve is left.
+"""
+
+import os
+import time
+import asyncio
+import functools
+import contextvars
+from typing import Callable, Optional, Tuple, Union
+import logging
+import requests
+
+logger = logging.getLogger(__name__)
+
+class RunDeadlineExceeded(requests.exceptions.ConnectTimeout):
+    """The run had no time left to send a request; it never reached the server."""
+
+class RunDeadline:
+    """Time budget of one bot run, shared by every call the run makes."""
+
+    def __init__(self, seconds: Optional[float] = None, reserve: Optional[float] = None):
+        seconds = seconds if seconds is not None else float(os.getenv('BOT_RUN_TIMEOUT', '300'))
+        reserve = reserve if reserve is not None else float(os.getenv('BOT_RUN_RESERVE', '10'))
+        self.started = time.monotonic()
+        self.expires_at = self.started + seconds
+        # Never hold back more than a third of the run
+        self.reserve = min(reserve, seconds / 3)
+        self.finishing = False
+
+    def at(self) -> float:
+        """Return the monotonic time regular work must finish by."""
+        return self.expires_at if self.finishing else self.expires_at - self.reserve
+
+    def remaining(self) -> float:
+        """Return the seconds left for regular work."""
+        return max(0.0, self.at() - time.monotonic())
+
+    def exhausted(self) -> bool:
+        return self.remaining() <= 0
+
+    def finish(self) -> None:
+        """Let the rest of the run use the reserve to commit its results."""
+        self.finishing = True
+
+_current: contextvars.ContextVar[Optional[RunDeadline]] = contextvars.ContextVar('run_deadline', default=None)
+
+def current_deadline() -> Optional[RunDeadline]:
+    """Return the active run's deadline, or None outside a run."""
+    return _current.get()
+
+def budget_exhausted() -> bool:
+    """Return True when the active run has only its reserve left."""
+    deadline = current_deadline()
+    return deadline is not None and deadline.exhausted()
+
+def finish_run() -> None:
+    """Release the active run's reserve for committing what already succeeded."""
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.finish()
+
+def cap_timeout(timeout: Union[float, Tuple[float, float]]) -> Union[float, Tuple[float, float]]:
+    """Shorten a requests-style timeout to what the active run has left.
+
+    Raises RunDeadlineExceeded when nothing is left. Outside a run the
+    timeout is returned unchanged.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return timeout
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise RunDeadlineExceeded("bot run deadline reached before the request was sent")
+    if isinstance(timeout, tuple):
+        return tuple(min(part, remaining) for part in timeout)
+    return min(timeout, remaining)
+
+def run_scoped(method: Callable) -> Callable:
+    """Give each call of a bot's run method its own RunDeadline.
+
+    A run started inside another scope, such as a bot run by the master bot
+    in-process, keeps the outer deadline. Works on coroutine methods too.
+    """
+    if asyncio.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(*args, **kwargs):
+            if current_deadline() is not None:
+                return await method(*args, **kwargs)
+            token = _current.set(RunDeadline())
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                _current.reset(token)
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if current_deadline() is not None:
+            return method(*args, **kwargs)
+        token = _current.set(RunDeadline())
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper
+
+def use_deadline(deadline: Optional[RunDeadline]) -> None:
+    """Make deadline the active run deadline of the current thread or asyncio task."""
+    _current.set(deadline)
+
+def call_with_deadline(deadline: Optional[RunDeadline], function: Callable, *args, **kwargs):
+    """Call function with deadline as the active run deadline, e.g. on a worker thread."""
+    token = _current.set(deadline)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        _current.reset(token)
+
+def in_context(function: Callable) -> Callable:
+    """Bind function to the caller's run deadline so threads it runs on share it."""
+    deadline = current_deadline()
+    return functools.partial(call_with_deadline, deadline, function)
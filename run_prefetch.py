@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Background prefetch of the independent stages of a bot run.
+Platform auth, identity lookups and connection warm-up do not depend on the
+article, so the bots start them before querying Supabase and only wait for
+them right before posting. A run then takes as long as its slowest chain of
+dependent steps instead of the sum of every step.
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, Optional
+import logging
+from run_budget import current_deadline, in_context
+
+logger = logging.getLogger(__name__)
+
+def prefetch_enabled() -> bool:
+    """Return False when RUN_PREFETCH turns prefetching off."""
+    return os.getenv('RUN_PREFETCH', 'true').lower() not in ('0', 'false', 'no')
+
+class Prefetch:
+    """Runs named setup tasks in background threads until a run needs them."""
+
+    def __init__(self, tasks: Dict[str, Callable[[], Any]]):
+        self.started = time.monotonic()
+        self.durations: Dict[str, float] = {}
+        self.futures: Dict[str, Future] = {}
+        if not prefetch_enabled():
+            # Leave the work to the posting path, as before
+            return
+        for name, task in tasks.items():
+            self.futures[name] = self._start(name, task)
+
+    def _start(self, name: str, task: Callable[[], Any]) -> Future:
+        # Daemon threads so a run that ends early never waits on a prefetch
+        future: Future = Future()
+
+        def run():
+            try:
+                future.set_result(task())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.durations[name] = time.monotonic() - self.started
+
+        threading.Thread(target=in_context(run), name=f"prefetch-{name}", daemon=True).start()
+        return future
+
+    def wait(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Wait for the tasks and return their results; failed or unfinished tasks map to None.
+
+        Inside a bot run, waits at most for what is left of the run's budget.
+        """
+        if not self.futures:
+            return {}
+        run = current_deadline()
+        if timeout is None and run is not None:
+            timeout = run.remaining()
+        waited = time.monotonic()
+        wait(self.futures.values(), timeout=timeout)
+        blocked = time.monotonic() - waited
+
+        results = {}
+        for name, future in self.futures.items():
+            if not future.done():
+                logger.warning(f"Prefetch of {name} still running; continuing without it")
+                results[name] = None
+            elif future.exception():
+                logger.warning(f"Prefetch of {name} failed: {future.exception()}")
+                results[name] = None
+            else:
+                results[name] = future.result()
+
+        timings = ', '.join(f"{name} {duration:.2f}s" for name, duration in sorted(self.durations.items()))
+        logger.info(f"⚡ Prefetched {timings}; waited {blocked:.2f}s for them")
+        return results
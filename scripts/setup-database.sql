@@ -27,6 +27,19 @@ CREATE TABLE IF NOT EXISTS articles (
   seo_description TEXT
 );
 
+-- Social media posting tracking columns
+ALTER TABLE articles
+ADD COLUMN IF NOT EXISTS tweeted_at TIMESTAMP WITH TIME ZONE,
+ADD COLUMN IF NOT EXISTS posted_to_linkedin_at TIMESTAMP WITH TIME ZONE,
+ADD COLUMN IF NOT EXISTS posted_to_facebook_at TIMESTAMP WITH TIME ZONE,
+ADD COLUMN IF NOT EXISTS posted_to_reddit_at TIMESTAMP WITH TIME ZONE;
+
+-- Computed column so the social bots can fetch a content excerpt instead of the full body
+CREATE OR REPLACE FUNCTION content_excerpt(articles)
+RETURNS TEXT AS $$
+  SELECT left($1.content, 500);
+$$ LANGUAGE sql STABLE;
+
 -- Users Table (for future auth)
 CREATE TABLE IF NOT EXISTS users (
   id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -94,6 +107,13 @@ CREATE INDEX IF NOT EXISTS idx_articles_created_at ON articles(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_articles_likes_count ON articles(likes_count DESC);
 CREATE INDEX IF NOT EXISTS idx_articles_tags ON articles USING GIN(tags);
 CREATE INDEX IF NOT EXISTS idx_articles_url ON articles(url);
+CREATE INDEX IF NOT EXISTS idx_articles_published_at ON articles(published_at DESC);
+
+-- Partial indexes for the social bots' "next unposted article" lookups
+CREATE INDEX IF NOT EXISTS idx_articles_unposted_twitter ON articles(published_at DESC NULLS LAST, id DESC) WHERE tweeted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_articles_unposted_linkedin ON articles(published_at DESC NULLS LAST, id DESC) WHERE posted_to_linkedin_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_articles_unposted_facebook ON articles(published_at DESC NULLS LAST, id DESC) WHERE posted_to_facebook_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_articles_unposted_reddit ON articles(published_at DESC NULLS LAST, id DESC) WHERE posted_to_reddit_at IS NULL;
 
 CREATE INDEX IF NOT EXISTS idx_bookmarks_user_id ON bookmarks(user_id);
 CREATE INDEX IF NOT EXISTS idx_bookmarks_article_id ON bookmarks(article_id);
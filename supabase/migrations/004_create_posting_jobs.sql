@@ -0,0 +1,116 @@
+-- Posting job queue so several social bot workers can run at once without double-posting.
+-- Workers claim jobs with claim_posting_jobs(), which leases rows using FOR UPDATE SKIP LOCKED;
+-- a lease that expires (crashed worker) makes the job claimable again.
+-- posting_jobs has RLS with no policies: the functions below run as their owner
+-- (SECURITY DEFINER), and only the service role may call the RPCs.
+
+CREATE TABLE IF NOT EXISTS posting_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    article_id UUID NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+    platform TEXT NOT NULL CHECK (platform IN ('twitter', 'linkedin', 'facebook', 'reddit')),
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'leased', 'done', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    leased_by TEXT,
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE (article_id, platform)
+);
+
+-- Only open jobs are ever scanned by claim_posting_jobs
+CREATE INDEX IF NOT EXISTS idx_posting_jobs_open ON posting_jobs(platform, created_at)
+WHERE status IN ('queued', 'leased');
+
+-- Claim up to p_limit jobs for a platform, leasing them to p_worker for p_lease_seconds
+CREATE OR REPLACE FUNCTION claim_posting_jobs(
+    p_platform TEXT,
+    p_worker TEXT,
+    p_limit INTEGER DEFAULT 1,
+    p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS SETOF posting_jobs AS $$
+    UPDATE posting_jobs AS j
+    SET status = 'leased',
+        leased_by = p_worker,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        attempts = j.attempts + 1,
+        updated_at = NOW()
+    WHERE j.id IN (
+        SELECT id FROM posting_jobs
+        WHERE platform = p_platform
+          AND (status = 'queued' OR (status = 'leased' AND lease_expires_at < NOW()))
+        ORDER BY created_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*;
+$$ LANGUAGE sql VOLATILE SECURITY DEFINER SET search_path = public;
+
+-- Mark a leased job as done; ignored if the lease has passed to another worker
+CREATE OR REPLACE FUNCTION complete_posting_job(p_id BIGINT, p_worker TEXT)
+RETURNS BOOLEAN AS $$
+    WITH updated AS (
+        UPDATE posting_jobs
+        SET status = 'done', lease_expires_at = NULL, updated_at = NOW()
+        WHERE id = p_id AND leased_by = p_worker AND status = 'leased'
+        RETURNING id
+    )
+    SELECT EXISTS (SELECT 1 FROM updated);
+$$ LANGUAGE sql VOLATILE SECURITY DEFINER SET search_path = public;
+
+-- Release a leased job after a failure: requeue it, or give up after p_max_attempts
+CREATE OR REPLACE FUNCTION fail_posting_job(p_id BIGINT, p_worker TEXT, p_error TEXT, p_max_attempts INTEGER DEFAULT 5)
+RETURNS BOOLEAN AS $$
+    WITH updated AS (
+        UPDATE posting_jobs
+        SET status = CASE WHEN attempts >= p_max_attempts THEN 'failed' ELSE 'queued' END,
+            last_error = p_error,
+            leased_by = NULL,
+            lease_expires_at = NULL,
+            updated_at = NOW()
+        WHERE id = p_id AND leased_by = p_worker AND status = 'leased'
+        RETURNING id
+    )
+    SELECT EXISTS (SELECT 1 FROM updated);
+$$ LANGUAGE sql VOLATILE SECURITY DEFINER SET search_path = public;
+
+-- Queue jobs for every platform when an article is inserted. Ingestion inserts
+-- articles with the anon key, which cannot write posting_jobs itself.
+CREATE OR REPLACE FUNCTION enqueue_posting_jobs()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO posting_jobs (article_id, platform)
+    SELECT NEW.id, platform FROM unnest(ARRAY['twitter', 'linkedin', 'facebook', 'reddit']) AS platform
+    ON CONFLICT (article_id, platform) DO NOTHING;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS enqueue_posting_jobs_on_insert ON articles;
+CREATE TRIGGER enqueue_posting_jobs_on_insert AFTER INSERT ON articles
+FOR EACH ROW EXECUTE FUNCTION enqueue_posting_jobs();
+
+DROP TRIGGER IF EXISTS update_posting_jobs_updated_at ON posting_jobs;
+CREATE TRIGGER update_posting_jobs_updated_at BEFORE UPDATE ON posting_jobs
+FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+ALTER TABLE posting_jobs ENABLE ROW LEVEL SECURITY;
+
+-- The RPCs bypass RLS, so keep them away from the anon and authenticated roles
+REVOKE EXECUTE ON FUNCTION claim_posting_jobs(TEXT, TEXT, INTEGER, INTEGER) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION complete_posting_job(BIGINT, TEXT) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION fail_posting_job(BIGINT, TEXT, TEXT, INTEGER) FROM PUBLIC;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        REVOKE EXECUTE ON FUNCTION claim_posting_jobs(TEXT, TEXT, INTEGER, INTEGER) FROM anon, authenticated;
+        REVOKE EXECUTE ON FUNCTION complete_posting_job(BIGINT, TEXT) FROM anon, authenticated;
+        REVOKE EXECUTE ON FUNCTION fail_posting_job(BIGINT, TEXT, TEXT, INTEGER) FROM anon, authenticated;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'service_role') THEN
+        GRANT EXECUTE ON FUNCTION claim_posting_jobs(TEXT, TEXT, INTEGER, INTEGER) TO service_role;
+        GRANT EXECUTE ON FUNCTION complete_posting_job(BIGINT, TEXT) TO service_role;
+        GRANT EXECUTE ON FUNCTION fail_posting_job(BIGINT, TEXT, TEXT, INTEGER) TO service_role;
+    END IF;
+END $$;
@@ -0,0 +1,15 @@
+-- Wake listening posting workers as soon as jobs are queued, instead of waiting for their next poll.
+-- Workers LISTEN on the posting_jobs channel; the payload is the job's platform.
+
+CREATE OR REPLACE FUNCTION notify_posting_jobs()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Identical payloads are folded into one notification per transaction
+    PERFORM pg_notify('posting_jobs', NEW.platform);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_posting_jobs_on_queue ON posting_jobs;
+CREATE TRIGGER notify_posting_jobs_on_queue AFTER INSERT ON posting_jobs
+FOR EACH ROW EXECUTE FUNCTION notify_posting_jobs();
@@ -0,0 +1,37 @@
+-- Social copy generated right after ingestion, so the bots only read and post.
+-- social_copy holds {"twitter": ..., "linkedin": ..., "facebook": ..., "reddit": ...};
+-- a platform missing from it is generated by its bot at post time.
+
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS social_copy JSONB;
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS social_copy_generated_at TIMESTAMP WITH TIME ZONE;
+
+-- The enrichment worker only ever scans articles still waiting for copy
+CREATE INDEX IF NOT EXISTS idx_articles_social_copy_pending ON articles(published_at DESC)
+WHERE social_copy IS NULL;
+
+-- Store copy for many articles in one call; p_rows is [{"id": ..., "social_copy": {...}}, ...]
+CREATE OR REPLACE FUNCTION set_article_social_copy(p_rows JSONB)
+RETURNS INTEGER AS $$
+    WITH updated AS (
+        UPDATE articles AS a
+        SET social_copy = r.social_copy,
+            social_copy_generated_at = NOW()
+        FROM jsonb_to_recordset(p_rows) AS r(id UUID, social_copy JSONB)
+        WHERE a.id = r.id
+        RETURNING a.id
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$ LANGUAGE sql VOLATILE;
+
+-- Wake a listening enrichment worker once per ingestion insert, however many rows it added
+CREATE OR REPLACE FUNCTION notify_article_enrichment()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('article_enrichment', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_article_enrichment_on_insert ON articles;
+CREATE TRIGGER notify_article_enrichment_on_insert AFTER INSERT ON articles
+FOR EACH STATEMENT EXECUTE FUNCTION notify_article_enrichment();
@@ -0,0 +1,16 @@
+-- The bots page unposted articles with ORDER BY published_at DESC NULLS LAST, id DESC;
+-- the partial indexes carry the same order so the pages are read straight from them.
+
+DROP INDEX IF EXISTS idx_articles_unposted_twitter;
+DROP INDEX IF EXISTS idx_articles_unposted_linkedin;
+DROP INDEX IF EXISTS idx_articles_unposted_facebook;
+DROP INDEX IF EXISTS idx_articles_unposted_reddit;
+
+CREATE INDEX idx_articles_unposted_twitter ON articles(published_at DESC NULLS LAST, id DESC)
+WHERE tweeted_at IS NULL;
+CREATE INDEX idx_articles_unposted_linkedin ON articles(published_at DESC NULLS LAST, id DESC)
+WHERE posted_to_linkedin_at IS NULL;
+CREATE INDEX idx_articles_unposted_facebook ON articles(published_at DESC NULLS LAST, id DESC)
+WHERE posted_to_facebook_at IS NULL;
+CREATE INDEX idx_articles_unposted_reddit ON articles(published_at DESC NULLS LAST, id DESC)
+WHERE posted_to_reddit_at IS NULL;
@@ -0,0 +1,71 @@
+-- Hold posting jobs until the article's social copy is stored (needs 004, 005 and 006).
+-- Articles are inserted before the enrichment worker writes social_copy, so a job
+-- queued on insert would be posted with copy generated at post time. A job for an
+-- article without copy now waits until set_article_social_copy stores it, or at most
+-- the grace period below, after which the bot generates the copy itself.
+
+ALTER TABLE posting_jobs ADD COLUMN IF NOT EXISTS run_after TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION enqueue_posting_jobs()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO posting_jobs (article_id, platform, run_after)
+    SELECT NEW.id, platform,
+           -- Grace period for the enrichment worker to store the article's copy
+           CASE WHEN NEW.social_copy IS NULL THEN NOW() + INTERVAL '10 minutes' ELSE NOW() END
+    FROM unnest(ARRAY['twitter', 'linkedin', 'facebook', 'reddit']) AS platform
+    ON CONFLICT (article_id, platform) DO NOTHING;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Release an article's held jobs as soon as its copy is stored
+CREATE OR REPLACE FUNCTION release_posting_jobs()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE posting_jobs SET run_after = NOW()
+    WHERE article_id = NEW.id AND status = 'queued' AND run_after > NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS release_posting_jobs_on_copy ON articles;
+CREATE TRIGGER release_posting_jobs_on_copy AFTER UPDATE OF social_copy ON articles
+FOR EACH ROW WHEN (OLD.social_copy IS NULL AND NEW.social_copy IS NOT NULL)
+EXECUTE FUNCTION release_posting_jobs();
+
+-- Held jobs are not claimable until run_after
+CREATE OR REPLACE FUNCTION claim_posting_jobs(
+    p_platform TEXT,
+    p_worker TEXT,
+    p_limit INTEGER DEFAULT 1,
+    p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS SETOF posting_jobs AS $$
+    UPDATE posting_jobs AS j
+    SET status = 'leased',
+        leased_by = p_worker,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        attempts = j.attempts + 1,
+        updated_at = NOW()
+    WHERE j.id IN (
+        SELECT id FROM posting_jobs
+        WHERE platform = p_platform
+          AND ((status = 'queued' AND run_after <= NOW()) OR (status = 'leased' AND lease_expires_at < NOW()))
+        ORDER BY created_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*;
+$$ LANGUAGE sql VOLATILE SECURITY DEFINER SET search_path = public;
+
+-- Notify listening workers when a job becomes claimable: on insert without a hold, or on release
+DROP TRIGGER IF EXISTS notify_posting_jobs_on_queue ON posting_jobs;
+CREATE TRIGGER notify_posting_jobs_on_queue AFTER INSERT ON posting_jobs
+FOR EACH ROW WHEN (NEW.run_after <= NOW())
+EXECUTE FUNCTION notify_posting_jobs();
+
+DROP TRIGGER IF EXISTS notify_posting_jobs_on_release ON posting_jobs;
+CREATE TRIGGER notify_posting_jobs_on_release AFTER UPDATE OF run_after ON posting_jobs
+FOR EACH ROW WHEN (OLD.run_after > NOW() AND NEW.run_after <= NOW())
+EXECUTE FUNCTION notify_posting_jobs();
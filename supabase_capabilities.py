@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Supabase capability probe for the social media bots.
+Detects which RPCs and articles columns exist (exec_sql, tweeted_at,
+posted_to_*_at, content_excerpt, ai_summary, seo_description) and caches the
+answer on disk, so later runs go straight to a query path that works instead
+of paying for failing calls.
+"""
+
+import os
+import json
+import time
+import threading
+import requests
+import http_transport
+from typing import Dict, Iterable, Optional
+import logging
+from bot_state import state_path
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = 'supabase_capabilities.json'
+
+# RPCs and articles columns the bots can make use of when present
+PROBED_RPCS = ['exec_sql']
+PROBED_COLUMNS = [
+    'tweeted_at',
+    'posted_to_linkedin_at',
+    'posted_to_facebook_at',
+    'posted_to_reddit_at',
+    'content_excerpt',
+    'ai_summary',
+    'seo_description',
+    'social_copy'
+]
+
+_memo: Dict[str, Dict] = {}
+_lock = threading.Lock()
+
+def _ttl() -> float:
+    return float(os.getenv('SUPABASE_CAPABILITY_TTL', str(24 * 3600)))
+
+def _load_cache() -> Dict[str, Dict]:
+    try:
+        with open(state_path(CACHE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache: Dict[str, Dict]) -> None:
+    path = state_path(CACHE_FILE)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write Supabase capability cache: {e}")
+
+# PostgreSQL's undefined_column error, which PostgREST returns with a 400
+UNDEFINED_COLUMN = '42703'
+
+# Seconds before an inconclusive probe is repeated
+INCOMPLETE_PROBE_RETRY = 60
+
+def _column_exists(supabase_url: str, headers: Dict[str, str], columns: Iterable[str]) -> Optional[bool]:
+    """Return whether the columns exist, or None when the probe was inconclusive.
+
+    Only an undefined-column error means a column is missing; a 5xx, an auth
+    failure or a timeout says nothing about the schema.
+    """
+    try:
+        response = http_transport.get(
+            f"{supabase_url}/rest/v1/articles",
+            headers=headers,
+            params={'select': ','.join(columns), 'limit': '0'}
+        )
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Supabase column probe failed: {e}")
+        return None
+
+    if response.status_code == 200:
+        return True
+    if response.status_code == 400:
+        try:
+            if response.json().get('code') == UNDEFINED_COLUMN:
+                return False
+        except (ValueError, AttributeError):
+            pass
+    logger.warning(f"Supabase column probe inconclusive: {response.status_code}")
+    return None
+
+def probe(supabase_url: str, headers: Dict[str, str]) -> Dict:
+    """Probe the database for the RPCs and columns the bots can use.
+
+    Capabilities that could not be determined are left out and the result
+    is marked incomplete, so it is not cached on disk.
+    """
+    rpcs = {}
+    try:
+        # PostgREST lists every exposed RPC in its OpenAPI description
+        response = http_transport.get(f"{supabase_url}/rest/v1/", headers=headers)
+        if response.status_code == 200:
+            paths = response.json().get('paths', {})
+            rpcs = {name: f"/rpc/{name}" in paths for name in PROBED_RPCS}
+    except (requests.exceptions.RequestException, ValueError, AttributeError) as e:
+        logger.warning(f"Supabase RPC probe failed: {e}")
+
+    # One request answers the common case where everything exists
+    all_columns = _column_exists(supabase_url, headers, PROBED_COLUMNS)
+    if all_columns:
+        columns = {name: True for name in PROBED_COLUMNS}
+    elif all_columns is None:
+        # The service is not answering; probing column by column would not help
+        columns = {}
+    else:
+        columns = {name: _column_exists(supabase_url, headers, [name]) for name in PROBED_COLUMNS}
+        columns = {name: present for name, present in columns.items() if present is not None}
+
+    complete = len(rpcs) == len(PROBED_RPCS) and len(columns) == len(PROBED_COLUMNS)
+    missing = [name for name, present in {**rpcs, **columns}.items() if not present]
+    if missing:
+        logger.info(f"🔎 Supabase capabilities probed; unavailable: {', '.join(missing)}")
+    if not complete:
+        logger.warning("🔎 Supabase capability probe incomplete; assuming columns exist until it is repeated")
+
+    return {'probed_at': time.time(), 'complete': complete, 'rpcs': rpcs, 'columns': columns}
+
+def _is_fresh(capabilities: Dict) -> bool:
+    ttl = _ttl() if capabilities.get('complete', True) else INCOMPLETE_PROBE_RETRY
+    return time.time() - capabilities.get('probed_at', 0) <= ttl
+
+def get_capabilities(supabase_url: str, headers: Dict[str, str], refresh: bool = False) -> Dict:
+    """Return cached capabilities for the project, probing when stale or forced."""
+    with _lock:
+        capabilities = None if refresh else _memo.get(supabase_url)
+        if capabilities is None and not refresh:
+            capabilities = _load_cache().get(supabase_url)
+
+        if capabilities is None or not _is_fresh(capabilities):
+            capabilities = probe(supabase_url, headers)
+            if capabilities['complete']:
+                cache = _load_cache()
+                cache[supabase_url] = capabilities
+                _save_cache(cache)
+
+        _memo[supabase_url] = capabilities
+        return capabilities
+
+def has_rpc(capabilities: Dict, name: str) -> bool:
+    """Return True if the RPC was found by the probe; unprobed RPCs are not used."""
+    return capabilities.get('rpcs', {}).get(name, False)
+
+def has_column(capabilities: Dict, name: str) -> bool:
+    """Return True if the articles column was found by the probe.
+
+    Columns the probe does not know about, or could not determine, are
+    assumed to exist, so the posted filters are never dropped by mistake.
+    """
+    return capabilities.get('columns', {}).get(name, True)
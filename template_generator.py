@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Local template generator for social copy.
+Builds platform-compliant posts from an article's title, summary, tags and
+affiliate link with precompiled templates, without any network call. The bots
+fall back to it when the LLM misses its latency deadline, is out of budget or
+fails, so a slow or unavailable provider never holds up posting.
+"""
+
+import os
+import re
+from string import Template
+from typing import Dict, Iterable, List, Optional
+import logging
+from multi_platform_generator import FINISHERS
+from prompt_builder import trim_to_chars
+
+logger = logging.getLogger(__name__)
+
+# Templates per platform; the finishers append the affiliate link afterwards
+TEMPLATES = {
+    'twitter': Template('$title: $summary\n\n$hashtags'),
+    'linkedin': Template('$title\n\n$summary\n\nWhat does this mean for your business? Share your thoughts below.\n\n$hashtags'),
+    'facebook': Template('$title\n\n$summary\n\nWhat do you think? Let us know in the comments!\n\n$hashtags'),
+    'reddit': Template('$title')
+}
+
+# Longest text the finishers still append the affiliate link to
+TEXT_BUDGETS = {
+    'twitter': 199,
+    'linkedin': 1199,
+    'facebook': 1000,
+    'reddit': 300
+}
+
+# Hashtags per platform, matching what the LLM prompts ask for
+HASHTAG_COUNTS = {
+    'twitter': 2,
+    'linkedin': 4,
+    'facebook': 3,
+    'reddit': 0
+}
+
+# Tags whose hashtag is not simply the words joined in CamelCase
+TAG_HASHTAGS = {
+    'ai': '#AI',
+    'artificial intelligence': '#AI',
+    'ml': '#MachineLearning',
+    'llm': '#LLM',
+    'llms': '#LLM',
+    'saas': '#SaaS',
+    'ecommerce': '#eCommerce',
+    'e-commerce': '#eCommerce',
+    'crypto': '#Crypto',
+    'cryptocurrency': '#Crypto',
+    'vc': '#VentureCapital',
+    'iot': '#IoT',
+    'devops': '#DevOps',
+    'fintech': '#FinTech'
+}
+
+SUMMARY_FIELDS = ['ai_summary', 'seo_description', 'summary']
+
+_WORD = re.compile(r'[A-Za-z0-9]+')
+
+def hashtag_for(tag: str) -> Optional[str]:
+    """Map a tag to a hashtag, e.g. 'machine learning' to #MachineLearning."""
+    key = tag.strip().lower()
+    if key in TAG_HASHTAGS:
+        return TAG_HASHTAGS[key]
+    words = _WORD.findall(tag)
+    if not words:
+        return None
+    return '#' + ''.join(word if word.isupper() else word.capitalize() for word in words)
+
+def hashtags_for(tags: Iterable[str], count: int) -> List[str]:
+    """Return up to count distinct hashtags for the tags, in order."""
+    hashtags: List[str] = []
+    for tag in tags:
+        hashtag = hashtag_for(tag)
+        if hashtag and hashtag.lower() not in (existing.lower() for existing in hashtags):
+            hashtags.append(hashtag)
+        if len(hashtags) >= count:
+            break
+    return hashtags
+
+def _summary(article: Dict) -> str:
+    for field in SUMMARY_FIELDS:
+        text = ' '.join((article.get(field) or '').split())
+        if text:
+            return text
+    return ''
+
+def generate_template_copy(article: Dict, platform: str) -> str:
+    """Build finished copy for a platform from the article alone."""
+    title = ' '.join((article.get('title') or '').split())
+    tags = list(article.get('tags') or [])
+    if not tags and article.get('category'):
+        tags = [article['category']]
+    hashtags = ' '.join(hashtags_for(tags, HASHTAG_COUNTS[platform]))
+    budget = TEXT_BUDGETS[platform]
+
+    if platform == 'reddit':
+        return FINISHERS[platform](trim_to_chars(title, budget), article)
+
+    # Fit the summary into whatever the rest of the template leaves over
+    template = TEMPLATES[platform]
+    room = budget - len(template.substitute(title=title, summary='', hashtags=hashtags))
+    summary = trim_to_chars(_summary(article), room) if room > 20 else ''
+    if summary:
+        text = template.substitute(title=title, summary=summary, hashtags=hashtags)
+    else:
+        text = f"{trim_to_chars(title, budget - len(hashtags) - 2)}\n\n{hashtags}"
+
+    return FINISHERS[platform](text.strip(), article)
+
+def fallback_copy(article: Dict, platform: str) -> Optional[str]:
+    """Return template copy for a platform unless the fallback is disabled."""
+    if os.getenv('TEMPLATE_FALLBACK', 'true').lower() in ('0', 'false', 'no'):
+        return None
+    logger.info(f"📝 Using template {platform} copy for: {article.get('title', 'Unknown')}")
+    return generate_template_copy(article, platform)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for keyset paging over unposted articles
+A fake articles endpoint applies the PostgREST filters the bots send, ordered
+like the idx_articles_unposted_* indexes.
+"""
+
+import re
+import pytest
+import article_queries
+from article_queries import build_next_unposted_query, build_unposted_page_query, fetch_unposted_batch
+
+def _articles():
+    """Five dated articles, two sharing a timestamp, and three without published_at."""
+    dated = [('a1', '2026-10-05T00:00:00'), ('a2', '2026-10-04T00:00:00'), ('a3', '2026-10-04T00:00:00'),
+             ('a4', '2026-10-02T00:00:00'), ('a5', '2026-10-01T00:00:00')]
+    undated = [('b1', None), ('b2', None), ('b3', None)]
+    return [{'id': article_id, 'title': article_id, 'published_at': published_at, 'tweeted_at': None}
+            for article_id, published_at in dated + undated]
+
+def _compare(value, op: str, operand: str) -> bool:
+    if op == 'is':
+        return value is None
+    if value is None:
+        return False
+    operand = operand.strip('"')
+    return {'lt': value < operand, 'eq': value == operand}[op]
+
+def _matches(article: dict, expression: str) -> bool:
+    """Evaluate a PostgREST or=(...) list of column.op.value and and(...) terms."""
+    terms = re.findall(r'and\(([^)]*)\)|([a-z_]+\.[a-z]+\.(?:"[^"]*"|[^,)]+))', expression)
+    for conjunction, term in terms:
+        parts = conjunction.split(',') if conjunction else [term]
+        if all(_compare(article[column], op, operand)
+               for column, op, operand in (part.split('.', 2) for part in parts)):
+            return True
+    return False
+
+def _sort_key(article: dict):
+    """published_at DESC NULLS LAST, id DESC."""
+    published_at = article['published_at']
+    return (published_at is None, tuple(-ord(c) for c in published_at or ''), tuple(-ord(c) for c in article['id']))
+
+@pytest.fixture
+def rows(monkeypatch):
+    table = _articles()
+    queries = []
+
+    def fetch_articles(supabase_url, headers, params):
+        queries.append(params)
+        assert params['order'] == 'published_at.desc.nullslast,id.desc'
+        result = [article for article in table if article['tweeted_at'] is None]
+        for column, condition in params.items():
+            if column in ('select', 'order', 'limit', 'tweeted_at'):
+                continue
+            if column == 'or':
+                result = [article for article in result if _matches(article, condition[1:-1])]
+            else:
+                op, operand = condition.split('.', 1)
+                result = [article for article in result if _compare(article[column], op, operand)]
+        return sorted(result, key=_sort_key)[:int(params['limit'])]
+
+    monkeypatch.setattr(article_queries, 'fetch_articles', fetch_articles)
+    return queries
+
+def test_next_query_uses_the_index_order():
+    assert build_next_unposted_query('twitter')['order'] == build_unposted_page_query('twitter', 10)['order']
+
+@pytest.mark.parametrize('page_size', [1, 2, 3, 100])
+def test_paging_reaches_articles_without_published_at(rows, page_size):
+    """Every unposted article is returned once, dated newest first then undated, at any page size."""
+    articles = fetch_unposted_batch('https://db', {}, 'twitter', 50, page_size)
+    assert [article['id'] for article in articles] == ['a1', 'a3', 'a2', 'a4', 'a5', 'b3', 'b2', 'b1']
+
+def test_page_after_an_undated_article_pages_by_id(rows):
+    fetch_unposted_batch('https://db', {}, 'twitter', 8, 3)
+    last = rows[-1]
+    assert last['published_at'] == 'is.null'
+    assert last['id'] == 'lt.b3'
+    assert 'or' not in last
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for Batch API pre-generation and the generation cache hit path
+A stub stands in for the OpenAI files and batches endpoints, and the LLM router
+fails any request, so every post here must come from the cache.
+"""
+
+import pytest
+import batch_pregeneration
+import generation_cache
+from batch_pregeneration import BatchPregenerator
+from llm_router import LLMRouter
+from multi_platform_generator import MultiPlatformGenerator
+
+# What the bots' article queries return: content is already cut to the excerpt
+ARTICLE = {
+    'id': 'article-1',
+    'title': 'New chip doubles battery life',
+    'ai_summary': None,
+    'seo_description': None,
+    'summary': 'A new low-power chip doubles the battery life of laptops while keeping performance the same.',
+    'content': 'x' * 500,
+    'affiliate_url': 'https://example.com/chip',
+    'tags': ['hardware'],
+    'social_copy': None
+}
+
+class StubBatchAPI:
+    """Completes every submitted batch at once with one post per request."""
+
+    def __init__(self):
+        self.uploads = []
+
+    def upload(self, filename, lines):
+        self.uploads.append(lines)
+        return f"file-{len(self.uploads)}"
+
+    def create_batch(self, input_file_id):
+        return {'id': f"batch-{input_file_id}", 'status': 'validating'}
+
+    def get_batch(self, batch_id):
+        return {'id': batch_id, 'status': 'completed', 'output_file_id': batch_id.replace('batch-', '')}
+
+    def download(self, file_id):
+        lines = self.uploads[int(file_id.split('-')[-1]) - 1]
+        return [{
+            'custom_id': line['custom_id'],
+            'response': {'status_code': 200, 'body': {'choices': [{'message': {
+                'content': f"Pre-generated {line['custom_id']}"
+            }}]}}
+        } for line in lines]
+
+def _no_llm(*args, **kwargs):
+    raise AssertionError("the LLM was called instead of using the cache")
+
+@pytest.fixture
+def pregenerator(tmp_path, monkeypatch):
+    monkeypatch.setenv('BOT_STATE_DIR', str(tmp_path))
+    monkeypatch.setenv('CIRCUIT_BREAKER', 'false')
+    monkeypatch.setenv('NEXT_PUBLIC_SUPABASE_URL', 'http://supabase.invalid')
+    monkeypatch.setenv('NEXT_PUBLIC_SUPABASE_ANON_KEY', 'test')
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    # A fresh process-wide cache in this test's state directory
+    monkeypatch.setattr(generation_cache, '_cache', None)
+    monkeypatch.setattr(batch_pregeneration, 'fetch_unposted_batch',
+                        lambda url, headers, platform, limit: [dict(ARTICLE)])
+    monkeypatch.setattr(LLMRouter, 'chat_completion', _no_llm)
+    monkeypatch.setattr(LLMRouter, 'stream_text', _no_llm)
+    return BatchPregenerator(['twitter', 'reddit'], client=StubBatchAPI())
+
+def test_bot_generators_use_pre_generated_copy(pregenerator):
+    """Collected batch output is finished and served by each bot's own generator."""
+    assert pregenerator.submit(10)
+    assert pregenerator.collect() == 2
+    assert pregenerator.load_state() == {}
+
+    from twitter_bot import OpenAIClient as TwitterOpenAI
+    from reddit_bot import OpenAIClient as RedditOpenAI
+    tweet = TwitterOpenAI().generate_tweet(dict(ARTICLE))
+    assert tweet.startswith('Pre-generated')
+    assert tweet.endswith(ARTICLE['affiliate_url'])
+    assert RedditOpenAI().generate_reddit_title(dict(ARTICLE)).startswith('Pre-generated')
+
+def test_cache_key_ignores_columns_outside_the_prompt(pregenerator):
+    """An article fetched with other columns, or with full content, still hits the cache."""
+    pregenerator.submit(10)
+    pregenerator.collect()
+
+    from twitter_bot import OpenAIClient as TwitterOpenAI
+    wider = dict(ARTICLE, url='https://source.example.com/chip', category='tech', source='Example',
+                 tweeted_at=None, content='x' * 2000)
+    assert TwitterOpenAI().generate_tweet(wider).startswith('Pre-generated')
+
+def test_cached_pairs_are_not_submitted_again(pregenerator):
+    pregenerator.submit(10)
+    pregenerator.collect()
+    assert pregenerator.submit(10) is None
+    assert len(pregenerator.api.uploads) == 1
+
+def test_shared_copy_uses_the_cache_before_generating(pregenerator, monkeypatch):
+    """The master bot attaches cached copy without making the combined LLM call."""
+    pregenerator.submit(10)
+    pregenerator.collect()
+    combined_calls = []
+    monkeypatch.setattr(MultiPlatformGenerator, 'generate_all_posts',
+                        lambda self, article: combined_calls.append(article))
+
+    from master_social_bot import attach_shared_copy
+    article = attach_shared_copy(dict(ARTICLE), ['twitter', 'reddit'])
+    assert combined_calls == []
+    assert sorted(article['social_copy']) == ['reddit', 'twitter']
+    assert article['social_copy']['reddit'].startswith('Pre-generated')
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for the circuit breaker and how the bots treat an open circuit
+Each test keeps the circuit state file in its own temporary state directory.
+"""
+
+import time
+import pytest
+import requests
+import circuit_breaker
+import posting_scheduler
+from circuit_breaker import HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, circuit_key
+from post_outbox import FAILED, PostOutbox
+
+KEY = 'https://api.example.com/2/tweets'
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('BOT_STATE_DIR', str(tmp_path))
+    monkeypatch.setenv('CIRCUIT_BREAKER', 'true')
+    monkeypatch.setenv('CIRCUIT_FAILURE_THRESHOLD', '3')
+    monkeypatch.setenv('CIRCUIT_OPEN_SECONDS', '300')
+    monkeypatch.setenv('CIRCUIT_PROBE_SECONDS', '60')
+    monkeypatch.setattr(circuit_breaker, '_breaker', None)
+    monkeypatch.setattr(posting_scheduler, '_scheduler', None)
+    return tmp_path
+
+def _expire(breaker: CircuitBreaker, key: str) -> None:
+    """Pretend the circuit's open period is over."""
+    breaker._update(key, lambda stored: dict(stored, open_until=time.time() - 1))
+
+def test_opens_after_failures_in_a_row(state_dir):
+    breaker = CircuitBreaker()
+    for _ in range(2):
+        breaker.record_failure(KEY)
+    assert breaker.allow(KEY)
+    breaker.record_success(KEY)
+    for _ in range(2):
+        breaker.record_failure(KEY)
+    assert breaker.allow(KEY)
+
+    breaker.record_failure(KEY)
+    assert not breaker.allow(KEY)
+    assert breaker.is_open(KEY)
+
+def test_open_circuit_is_seen_by_other_processes(state_dir):
+    """A later run reads the open circuit from the state file."""
+    breaker = CircuitBreaker()
+    for _ in range(3):
+        breaker.record_failure(KEY)
+    assert CircuitBreaker().is_open(KEY)
+    assert not CircuitBreaker().is_open('https://api.example.com/2/users/me')
+
+def test_single_probe_closes_the_circuit(state_dir):
+    """Once the open period is over one request probes; its success closes the circuit."""
+    breaker = CircuitBreaker()
+    for _ in range(3):
+        breaker.record_failure(KEY)
+    _expire(breaker, KEY)
+
+    other = CircuitBreaker()
+    assert breaker.allow(KEY)
+    assert breaker.circuits[KEY]['state'] == HALF_OPEN
+    assert not other.allow(KEY)
+
+    breaker.record_success(KEY)
+    assert other.allow(KEY)
+    assert CircuitBreaker()._load() == {}
+
+def test_failed_probe_doubles_the_open_period(state_dir):
+    breaker = CircuitBreaker()
+    for _ in range(3):
+        breaker.record_failure(KEY)
+    _expire(breaker, KEY)
+    assert breaker.allow(KEY)
+    breaker.record_failure(KEY)
+    circuit = CircuitBreaker()._load()[KEY]
+    assert circuit['state'] == OPEN
+    assert circuit['open_seconds'] == 600
+
+def test_only_outages_count_as_failures():
+    throttled = requests.Response()
+    throttled.status_code = 429
+    broken = requests.Response()
+    broken.status_code = 503
+    assert not circuit_breaker.is_upstream_failure(throttled)
+    assert circuit_breaker.is_upstream_failure(broken)
+    assert circuit_breaker.is_upstream_failure(error=requests.exceptions.ConnectTimeout())
+    assert not circuit_breaker.is_upstream_failure(error=CircuitOpenError())
+
+def test_circuit_key_replaces_resource_ids():
+    assert circuit_key('https://graph.facebook.com/v18.0/1234567890/feed') == 'https://graph.facebook.com/v18.0/{id}/feed'
+    assert circuit_key('https://api.twitter.com/2/tweets') == 'https://api.twitter.com/2/tweets'
+
+def test_open_circuit_does_not_use_an_outbox_attempt(state_dir, monkeypatch):
+    """A post blocked by an open circuit was never sent, so it is released without counting an attempt."""
+    monkeypatch.setenv('OUTBOX_MAX_ATTEMPTS', '1')
+    for variable in ('TWITTER_BEARER_TOKEN', 'TWITTER_API_KEY', 'TWITTER_API_SECRET', 'TWITTER_ACCESS_TOKEN_SECRET'):
+        monkeypatch.setenv(variable, 'test')
+    monkeypatch.setenv('TWITTER_ACCESS_TOKEN', 'account-token')
+    import twitter_bot
+    client = twitter_bot.TwitterClient()
+    breaker = circuit_breaker.get_circuit_breaker()
+    for _ in range(3):
+        breaker.record_failure(circuit_key(f"{client.base_url}/tweets"))
+    assert client.is_down()
+
+    outbox = PostOutbox(str(state_dir / 'outbox.sqlite3'))
+    for _ in range(3):
+        assert outbox.publish('article-1', 'twitter', client.account, {'text': 'Hello'},
+                              lambda payload: client.post_tweet(payload['text'])) is None
+    row = outbox._get('article-1', 'twitter', client.account)
+    assert row['state'] == FAILED
+    assert row['attempts'] == 0
+    assert outbox.can_post('article-1', 'twitter', client.account)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for LLM routing, fallback and hedging
+Runs the router against OpenAI-compatible stub providers on a local HTTP server.
+"""
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from llm_router import LatencyStats, LLMRouter, LLMUnavailable, QuotaLedger
+
+BODY = {'model': 'gpt-test', 'messages': [{'role': 'user', 'content': 'Hello'}]}
+
+# Seconds the slow provider takes to answer
+SLOW_SECONDS = 1.5
+
+class StubProvider(BaseHTTPRequestHandler):
+    """Answers /<behaviour>/chat/completions: fast, slow, or fail* with a 500."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        behaviour = self.path.split('/')[1]
+        if behaviour == 'slow':
+            time.sleep(SLOW_SECONDS)
+        status = 500 if behaviour.startswith('fail') else 200
+        body = json.dumps({'choices': [{'message': {'content': f"from {behaviour}"}}]}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture(scope='module')
+def stub_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubProvider)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+@pytest.fixture
+def make_router(stub_url, tmp_path, monkeypatch):
+    """Return a factory for routers over the named stub providers with their own state."""
+    monkeypatch.setenv('BOT_STATE_DIR', str(tmp_path))
+    monkeypatch.setenv('CIRCUIT_BREAKER', 'false')
+    monkeypatch.setenv('LLM_HEDGE_DELAY', '0.2')
+    monkeypatch.setenv('LLM_MIN_HEDGE_DELAY', '0.1')
+
+    def make(*names: str) -> LLMRouter:
+        providers = [{'name': name, 'base_url': f"{stub_url}/{name}", 'api_key': 'test'} for name in names]
+        return LLMRouter(providers, stats=LatencyStats(path=str(tmp_path / 'latency.sqlite3')),
+                         ledger=QuotaLedger(0, path=str(tmp_path / 'quota.json')))
+    return make
+
+def _text(response) -> str:
+    return response.json()['choices'][0]['message']['content']
+
+def test_falls_back_when_a_provider_fails(make_router):
+    """A failing provider's request moves on to the next provider and counts as an error."""
+    router = make_router('fail', 'fast')
+    response = router.chat_completion(BODY)
+    assert response.status_code == 200
+    assert _text(response) == 'from fast'
+    assert router.stats.summary('fail:gpt-test')['error_rate'] == 1.0
+    assert router.stats.summary('fast:gpt-test')['samples'] == 1
+
+def test_returns_the_last_error_when_every_provider_fails(make_router):
+    router = make_router('fail', 'failover')
+    assert router.chat_completion(BODY).status_code == 500
+
+def test_hedges_a_provider_slower_than_its_p95(make_router):
+    """A second provider is raced once the first has not answered within the hedge delay."""
+    router = make_router('slow', 'fast')
+    started = time.monotonic()
+    response = router.chat_completion(BODY)
+    assert _text(response) == 'from fast'
+    assert time.monotonic() - started < SLOW_SECONDS
+
+def test_ranks_healthy_providers_by_latency(make_router):
+    """Faster healthy providers go first and providers failing too often go last."""
+    router = make_router('slow', 'fail', 'fast')
+    for _ in range(4):
+        router.stats.record('slow:gpt-test', 1.0, True)
+        router.stats.record('fail:gpt-test', None, False)
+        router.stats.record('fast:gpt-test', 0.1, True)
+    assert [provider['name'] for provider in router.ranked(BODY)] == ['fast', 'slow', 'fail']
+
+def test_gives_up_at_the_deadline(make_router):
+    router = make_router('slow')
+    started = time.monotonic()
+    with pytest.raises(LLMUnavailable):
+        router.chat_completion(BODY, deadline=time.monotonic() + 0.3)
+    assert time.monotonic() - started < SLOW_SECONDS
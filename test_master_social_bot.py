@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Tests for the master bot's shared copy generation and in-process bot logs
+The combined LLM call goes to a local stub provider that answers too late.
+"""
+
+import sys
+import json
+import time
+import types
+import asyncio
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import generation_cache
+import multi_platform_generator
+from llm_router import LatencyStats, LLMRouter, QuotaLedger
+from run_budget import RunDeadline, call_with_deadline, in_context
+
+# Seconds the stub provider takes to answer
+SLOW_SECONDS = 3
+
+PLATFORMS = ['twitter', 'linkedin', 'facebook', 'reddit']
+
+ARTICLE = {
+    'id': 'article-1',
+    'title': 'New chip doubles battery life',
+    'summary': 'A new low-power chip doubles the battery life of laptops while keeping performance the same.',
+    'content': 'x' * 500,
+    'affiliate_url': 'https://example.com/chip',
+    'tags': ['hardware'],
+    'social_copy': None
+}
+
+class SlowProvider(BaseHTTPRequestHandler):
+    """Answers every chat completion with copy for all platforms, after SLOW_SECONDS."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(SLOW_SECONDS)
+        content = json.dumps({platform: f"LLM {platform} copy" for platform in PLATFORMS})
+        body = json.dumps({'choices': [{'message': {'content': content}}]}).encode('utf-8')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            # The router gave up and closed the connection
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def slow_llm(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowProvider)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setenv('BOT_STATE_DIR', str(tmp_path))
+    monkeypatch.setenv('CIRCUIT_BREAKER', 'false')
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    monkeypatch.setenv('LLM_DEADLINE', '0.5')
+    monkeypatch.setattr(generation_cache, '_cache', None)
+    router = LLMRouter([{'name': 'slow', 'base_url': f"http://127.0.0.1:{server.server_address[1]}", 'api_key': 'test'}],
+                       stats=LatencyStats(path=str(tmp_path / 'latency.sqlite3')),
+                       ledger=QuotaLedger(0, path=str(tmp_path / 'quota.json')))
+    monkeypatch.setattr(multi_platform_generator, 'get_llm_router', lambda: router)
+    yield router
+    server.shutdown()
+
+def test_slow_llm_falls_back_to_templates(slow_llm):
+    """A combined call past LLM_DEADLINE gives every platform template copy instead of waiting."""
+    from master_social_bot import attach_shared_copy
+    started = time.monotonic()
+    article = attach_shared_copy(dict(ARTICLE), PLATFORMS)
+    assert time.monotonic() - started < SLOW_SECONDS
+    assert sorted(article['social_copy']) == sorted(PLATFORMS)
+    assert article['social_copy']['reddit'] == ARTICLE['title']
+    assert ARTICLE['affiliate_url'] in article['social_copy']['twitter']
+    assert not any(copy.startswith('LLM') for copy in article['social_copy'].values())
+
+def test_shared_copy_stops_at_the_run_deadline(slow_llm, monkeypatch):
+    """The run's deadline cuts the combined call short when it comes before LLM_DEADLINE."""
+    monkeypatch.setenv('LLM_DEADLINE', '30')
+    slow_llm.stream_deadline = 30
+    from master_social_bot import attach_shared_copy
+    started = time.monotonic()
+    article = call_with_deadline(RunDeadline(1.5, 0.5), attach_shared_copy, dict(ARTICLE), ['twitter'])
+    assert time.monotonic() - started < SLOW_SECONDS
+    assert not article['social_copy']['twitter'].startswith('LLM')
+
+def _fake_bot_module(monkeypatch, name: str):
+    """Register a bot module whose run logs from its own logger, a shared one and a helper thread."""
+    module = types.ModuleType(name)
+    bot_logger = logging.getLogger(name)
+
+    class Bot:
+        def __init__(self, article_source=None):
+            pass
+
+        def run(self):
+            bot_logger.info(f"{name} posting")
+            logging.getLogger('article_queries').info(f"{name} query")
+            helper = threading.Thread(target=in_context(lambda: bot_logger.info(f"{name} helper")))
+            helper.start()
+            helper.join()
+            return True
+
+    class AsyncBot:
+        def __init__(self, article_source=None):
+            pass
+
+        async def run(self):
+            bot_logger.info(f"{name} posting")
+            await asyncio.sleep(0.05)
+            logging.getLogger('article_queries').info(f"{name} query")
+            return True
+
+    module.Bot = Bot
+    module.AsyncBot = AsyncBot
+    monkeypatch.setitem(sys.modules, name, module)
+
+@pytest.fixture
+def bot_logs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(logging.getLogger(), 'level', logging.INFO)
+    for name in ('alpha_bot', 'beta_bot'):
+        _fake_bot_module(monkeypatch, name)
+    return [('Alpha', 'alpha_bot.py', 'alpha_bot', 'Bot'), ('Beta', 'beta_bot.py', 'beta_bot', 'Bot')]
+
+def _log_lines(tmp_path, name: str) -> str:
+    with open(tmp_path / f"{name}.log") as f:
+        return f.read()
+
+def test_concurrent_bots_keep_their_own_log_files(bot_logs, tmp_path):
+    """Each in-process bot's records, from any of its threads, go to its own log file only."""
+    from master_social_bot import run_bots_concurrently
+    results = run_bots_concurrently(bot_logs, 2, 10)
+    assert all(success for success, _ in results.values())
+    alpha, beta = _log_lines(tmp_path, 'alpha_bot'), _log_lines(tmp_path, 'beta_bot')
+    assert all(f"alpha_bot {what}" in alpha for what in ('posting', 'query', 'helper'))
+    assert all(f"beta_bot {what}" in beta for what in ('posting', 'query', 'helper'))
+    assert 'beta_bot' not in alpha and 'alpha_bot' not in beta
+
+def test_async_bots_keep_their_own_log_files(bot_logs, tmp_path):
+    from master_social_bot import run_bots_async
+    results = asyncio.run(run_bots_async(bot_logs, 2, 10))
+    assert all(success for success, _ in results.values())
+    alpha, beta = _log_lines(tmp_path, 'alpha_bot'), _log_lines(tmp_path, 'beta_bot')
+    assert 'alpha_bot posting' in alpha and 'alpha_bot query' in alpha
+    assert 'beta_bot' not in alpha and 'alpha_bot' not in beta
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for the posting outbox state transitions
+Each test uses its own SQLite file, so nothing touches the bot state directory.
+"""
+
+import time
+import pytest
+import requests
+from post_outbox import ACKED, FAILED, PENDING, POSTED, REVIEW, PostOutbox
+
+ARTICLE = 'article-1'
+PLATFORM = 'twitter'
+ACCOUNT = 'account'
+PAYLOAD = {'text': 'Hello'}
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    monkeypatch.setenv('OUTBOX_MAX_ATTEMPTS', '3')
+    monkeypatch.setenv('OUTBOX_RETRY_DELAY', '900')
+    monkeypatch.setenv('OUTBOX_PENDING_EXPIRY', '3600')
+    return PostOutbox(str(tmp_path / 'outbox.sqlite3'))
+
+def _row(outbox: PostOutbox) -> dict:
+    return dict(outbox._get(ARTICLE, PLATFORM, ACCOUNT))
+
+def _age(outbox: PostOutbox, seconds: float) -> None:
+    """Pretend the row was last updated and due seconds ago."""
+    outbox.conn.execute('UPDATE outbox SET updated_at = updated_at - ?, retry_at = retry_at - ?',
+                        (seconds, seconds))
+
+def _refused(payload):
+    # Nothing listens on port 1, so the connection is refused before anything is sent
+    return requests.post('http://127.0.0.1:1/', json=payload, timeout=2)
+
+def _read_timeout(payload):
+    raise requests.exceptions.ReadTimeout("the platform did not answer in time")
+
+def test_posted_then_acked(outbox):
+    """A successful post is recorded, acknowledged and never posted again."""
+    assert outbox.publish(ARTICLE, PLATFORM, ACCOUNT, PAYLOAD, lambda payload: 'post-1') == 'post-1'
+    assert _row(outbox)['state'] == POSTED
+    assert outbox.unacked(PLATFORM) == [ARTICLE]
+
+    outbox.replay_acks(PLATFORM, lambda article_ids: True)
+    assert _row(outbox)['state'] == ACKED
+    assert outbox.unacked(PLATFORM) == []
+    assert not outbox.can_post(ARTICLE, PLATFORM, ACCOUNT)
+    assert outbox.publish(ARTICLE, PLATFORM, ACCOUNT, PAYLOAD, lambda payload: 'post-2') is None
+
+def test_rejected_post_is_retried_from_its_payload(outbox):
+    """A rejected post becomes a dead letter and is re-sent once its retry time comes."""
+    assert outbox.publish(ARTICLE, PLATFORM, ACCOUNT, PAYLOAD, lambda payload: None) is None
+    row = _row(outbox)
+    assert row['state'] == FAILED
+    assert row['attempts'] == 1
+    assert row['retry_at'] > time.time()
+    assert not outbox.can_post(ARTICLE, PLATFORM, ACCOUNT)
+    assert outbox.due_retries(PLATFORM) == []
+
+    _age(outbox, 901)
+    assert outbox.can_post(ARTICLE, PLATFORM, ACCOUNT)
+    sent = []
+    assert outbox.retry_due(PLATFORM, lambda payload: sent.append(payload) or 'post-1') == 1
+    assert sent == [PAYLOAD]
+    assert _row(outbox)['state'] == POSTED
+
+def test_dead_letter_stops_after_max_attempts(outbox):
+    """Once its attempts are used up a dead letter is never retried."""
+    for _ in range(3):
+        outbox.publish(ARTICLE, PLATFORM, ACCOUNT, PAYLOAD, lambda payload: None)
+        _age(outbox, 10 ** 6)
+    row = _row(outbox)
+    assert row['state'] == FAILED
+    assert row['attempts'] == 3
+    assert row['retry_at'] is None
+    assert not outbox.can_post(ARTICLE, PLATFORM, ACCOUNT)
+    assert outbox.due_retries(PLATFORM) == []
+
+def test_refused_connection_is_a_failed_attempt(outbox):
+    """A request that never reached the platform is safe to retry later."""
+    with pytest.raises(requests.exceptions.ConnectionError):
+        outbox.publish(ARTICLE, PLATFORM, ACCOUNT, PAYLOAD, _refused)
+    row = _row(outbox)
+    assert row['state'] == FAILED
+    assert row['retry_at'] is not None
+
+def test_ambiguous_failure_is_never_posted_again(outbox):
+    """A post that may have gone through blocks re-posting, and is flagged for review once it expires."""
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        outbox.publish(ARTICLE, PLATFORM, ACCOUNT, PAYLOAD, _read_timeout)
+    assert _row(outbox)['state'] == PENDING
+    assert not outbox.can_post(ARTICLE, PLATFORM, ACCOUNT)
+    assert outbox.due_retries(PLATFORM) == []
+    assert outbox.publish(ARTICLE, PLATFORM, ACCOUNT, PAYLOAD, lambda payload: 'post-1') is None
+
+    _age(outbox, 3601)
+    assert not outbox.can_post(ARTICLE, PLATFORM, ACCOUNT)
+    assert outbox.retry_due(PLATFORM, lambda payload: 'post-1') == 0
+    assert _row(outbox)['state'] == REVIEW
+    assert [row['article_id'] for row in outbox.needs_review(PLATFORM)] == [ARTICLE]
+
+def test_crash_after_sending_never_posts_twice(outbox, tmp_path):
+    """A run that died after the platform took the post leaves it for review, not for another post."""
+    sent = []
+
+    def post_then_crash(payload):
+        sent.append(payload)
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        outbox.publish(ARTICLE, PLATFORM, ACCOUNT, PAYLOAD, post_then_crash)
+    _age(outbox, 3601)
+
+    # The next run opens the outbox afresh
+    restarted = PostOutbox(str(tmp_path / 'outbox.sqlite3'))
+    assert restarted.retry_due(PLATFORM, lambda payload: sent.append(payload) or 'post-2') == 0
+    assert restarted.publish(ARTICLE, PLATFORM, ACCOUNT, PAYLOAD, lambda payload: sent.append(payload) or 'post-2') is None
+    assert sent == [PAYLOAD]
+    assert _row(restarted)['state'] == REVIEW
+
+def test_resolved_review_is_posted_or_recorded(outbox):
+    """A reviewed post is recorded with its live id, or released for posting again."""
+    outbox.claim(ARTICLE, PLATFORM, ACCOUNT, PAYLOAD)
+    _age(outbox, 3601)
+    outbox.flag_expired(PLATFORM)
+    outbox.resolve_review(ARTICLE, PLATFORM, ACCOUNT, 'post-1')
+    assert _row(outbox)['state'] == POSTED
+    assert outbox.unacked(PLATFORM) == [ARTICLE]
+
+    outbox.claim('article-2', PLATFORM, ACCOUNT, PAYLOAD)
+    outbox.conn.execute('UPDATE outbox SET updated_at = updated_at - 3601 WHERE article_id = ?', ('article-2',))
+    outbox.flag_expired(PLATFORM)
+    outbox.resolve_review('article-2', PLATFORM, ACCOUNT)
+    assert outbox.can_post('article-2', PLATFORM, ACCOUNT)
+    assert outbox.retry_due(PLATFORM, lambda payload: 'post-2') == 1
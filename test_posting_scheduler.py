@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the token-bucket posting scheduler
+Each test keeps the bucket state file in its own temporary state directory.
+"""
+
+import json
+import time
+import multiprocessing
+import pytest
+import requests
+import posting_scheduler
+from post_outbox import FAILED, PostOutbox
+from posting_scheduler import PostingScheduler
+from run_budget import RunDeadline, call_with_deadline
+
+ACCOUNT = 'account'
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('BOT_STATE_DIR', str(tmp_path))
+    monkeypatch.setenv('POST_RATE_TWITTER', '2/86400')
+    monkeypatch.setenv('POST_RATE_REDDIT', '3/180')
+    monkeypatch.setenv('CIRCUIT_BREAKER', 'false')
+    monkeypatch.setattr(posting_scheduler, '_scheduler', None)
+    return tmp_path
+
+def _soon() -> float:
+    return time.monotonic() + 1
+
+def _response(status: int, body: dict, headers: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode('utf-8')
+    response.headers.update(headers or {})
+    return response
+
+def test_quota_carries_over_to_the_next_run(state_dir):
+    """A later run starts from the tokens earlier runs left, not from a full bucket."""
+    assert PostingScheduler().acquire('twitter', ACCOUNT, _soon())
+    assert PostingScheduler().acquire('twitter', ACCOUNT, _soon())
+    assert not PostingScheduler().acquire('twitter', ACCOUNT, _soon())
+    assert PostingScheduler().acquire('reddit', ACCOUNT, _soon())
+
+def _take_all(path: str, attempts: int, results) -> None:
+    scheduler = PostingScheduler(path)
+    results.put(sum(scheduler.acquire('twitter', ACCOUNT, time.monotonic() + 1) for _ in range(attempts)))
+
+def test_processes_share_one_bucket(state_dir):
+    """Bots running at the same time take no more tokens than the account has."""
+    path = str(state_dir / 'posting_quota.json')
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_take_all, args=(path, 2, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert sum(results.get() for _ in processes) == 2
+
+def test_headers_set_the_bucket_until_the_reset(state_dir):
+    """Reported remaining quota replaces the bucket, which is full again after the reset."""
+    scheduler = PostingScheduler()
+    scheduler.observe('twitter', ACCOUNT, _response(201, {}, {
+        'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(time.time() + 1)
+    }))
+    assert not scheduler.has_quota('twitter', ACCOUNT, time.monotonic() + 0.5)
+    assert scheduler.acquire('twitter', ACCOUNT, time.monotonic() + 5)
+    assert scheduler.bucket('twitter', ACCOUNT).tokens == pytest.approx(1, abs=0.01)
+
+def test_reddit_ratelimit_error_defers_the_post(state_dir, monkeypatch):
+    """A RATELIMIT error in a 200 body empties the bucket and releases the outbox claim."""
+    monkeypatch.setenv('REDDIT_CLIENT_ID', 'id')
+    monkeypatch.setenv('REDDIT_CLIENT_SECRET', 'secret')
+    monkeypatch.setenv('REDDIT_USERNAME', ACCOUNT)
+    monkeypatch.setenv('REDDIT_PASSWORD', 'password')
+    import reddit_bot
+    monkeypatch.setattr(reddit_bot.http_transport, 'post', lambda url, **kwargs: _response(200, {'json': {
+        'errors': [['RATELIMIT', "Looks like you've been doing that a lot. Take a break for 9 minutes "
+                                 "before trying again.", 'ratelimit']]
+    }}))
+    client = reddit_bot.RedditClient()
+    monkeypatch.setattr(client, 'authenticate', lambda: True)
+
+    outbox = PostOutbox(str(state_dir / 'outbox.sqlite3'))
+    payload = {'subreddit': 'technology', 'title': 'Title', 'url': 'https://example.com'}
+    post = lambda payload: client.post_link(payload['subreddit'], payload['title'], payload['url'])
+    assert outbox.publish('article-1', 'reddit', ACCOUNT, payload, post) is None
+
+    row = outbox._get('article-1', 'reddit', ACCOUNT)
+    assert row['state'] == FAILED
+    assert row['attempts'] == 0
+    assert outbox.can_post('article-1', 'reddit', ACCOUNT)
+    assert 530 < client.scheduler.bucket('reddit', ACCOUNT).wait_time() <= 540
+
+def test_refused_post_does_not_use_an_outbox_attempt(state_dir, monkeypatch):
+    """A post the scheduler holds back is released for a later run without counting an attempt."""
+    monkeypatch.setenv('OUTBOX_MAX_ATTEMPTS', '1')
+    for variable in ('TWITTER_BEARER_TOKEN', 'TWITTER_API_KEY', 'TWITTER_API_SECRET', 'TWITTER_ACCESS_TOKEN_SECRET'):
+        monkeypatch.setenv(variable, 'test')
+    monkeypatch.setenv('TWITTER_ACCESS_TOKEN', f"{ACCOUNT}-token")
+    import twitter_bot
+    client = twitter_bot.TwitterClient()
+    for _ in range(2):
+        client.scheduler.acquire('twitter', ACCOUNT, _soon())
+
+    outbox = PostOutbox(str(state_dir / 'outbox.sqlite3'))
+    for _ in range(3):
+        assert call_with_deadline(RunDeadline(5, 0), outbox.publish, 'article-1', 'twitter', ACCOUNT,
+                                  {'text': 'Hello'}, lambda payload: client.post_tweet(payload['text'])) is None
+    row = outbox._get('article-1', 'twitter', ACCOUNT)
+    assert row['attempts'] == 0
+    assert outbox.can_post('article-1', 'twitter', ACCOUNT)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Tests for the posting job queue (supabase/migrations/004, 005 and 008)
+The queue tests need a disposable Postgres database: TEST_DATABASE_URL if set,
+otherwise a throwaway server started with pgserver (pip install pgserver).
+Its public schema is dropped and rebuilt from scripts/setup-database.sql and
+the migrations. The worker tests use an in-memory job store and always run.
+"""
+
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional
+import pytest
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+from posting_worker import PostgresJobStore, PostingWorker
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def _read(path: str) -> str:
+    with open(os.path.join(ROOT, path)) as f:
+        return f.read()
+
+@pytest.fixture(scope='module')
+def dsn():
+    """Return the URL of a disposable Postgres database."""
+    if psycopg2 is None:
+        pytest.skip("psycopg2 is not installed")
+    if os.getenv('TEST_DATABASE_URL'):
+        yield os.getenv('TEST_DATABASE_URL')
+        return
+    pgserver = pytest.importorskip('pgserver', reason="set TEST_DATABASE_URL or install pgserver")
+    server = pgserver.get_server(tempfile.mkdtemp(), cleanup_mode='delete')
+    yield server.get_uri()
+    server.cleanup()
+
+@pytest.fixture
+def db(dsn):
+    """Return an autocommit connection to a database with the posting job migrations applied."""
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+        try:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"')
+        except psycopg2.Error:
+            # uuid-ossp is a contrib extension; gen_random_uuid() is built in since Postgres 13
+            cursor.execute("CREATE FUNCTION uuid_generate_v4() RETURNS uuid AS $$ SELECT gen_random_uuid() $$ LANGUAGE sql")
+        cursor.execute(_read('scripts/setup-database.sql').replace('CREATE EXTENSION IF NOT EXISTS "uuid-ossp";', ''))
+        cursor.execute(_read('supabase/migrations/004_create_posting_jobs.sql'))
+        cursor.execute(_read('supabase/migrations/005_notify_posting_jobs.sql'))
+    yield conn
+    conn.close()
+
+def _insert_articles(conn, count: int) -> List[str]:
+    ids = []
+    with conn.cursor() as cursor:
+        for i in range(count):
+            cursor.execute(
+                "INSERT INTO articles (title, content, url, source, category, published_at) "
+                "VALUES (%s, %s, %s, 'Test', 'tech', NOW()) RETURNING id",
+                (f"Article {i}", 'x' * 900, f"https://example.com/{i}")
+            )
+            ids.append(str(cursor.fetchone()[0]))
+    return ids
+
+def _jobs(conn, platform: str) -> List[tuple]:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT status, attempts FROM posting_jobs WHERE platform = %s ORDER BY id", (platform,))
+        return cursor.fetchall()
+
+def test_inserted_article_queues_a_job_per_platform(db):
+    """Inserting an article queues one job for every platform."""
+    _insert_articles(db, 1)
+    with db.cursor() as cursor:
+        cursor.execute("SELECT platform, status FROM posting_jobs ORDER BY platform")
+        assert cursor.fetchall() == [('facebook', 'queued'), ('linkedin', 'queued'),
+                                     ('reddit', 'queued'), ('twitter', 'queued')]
+
+def test_concurrent_claims_never_share_a_job(db, dsn):
+    """Workers claiming at the same time each get different jobs."""
+    _insert_articles(db, 6)
+    claimed = {}
+
+    def claim(worker: str):
+        store = PostgresJobStore(dsn)
+        claimed[worker] = [job['id'] for job in store.claim('twitter', worker, 2, 60)]
+
+    threads = [threading.Thread(target=claim, args=(f"w{n}",)) for n in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    job_ids = [job_id for ids in claimed.values() for job_id in ids]
+    assert len(job_ids) == 6
+    assert len(set(job_ids)) == 6
+
+def test_claim_skips_rows_locked_by_another_claimer(db, dsn):
+    """A job row locked by another transaction is skipped instead of waited on."""
+    _insert_articles(db, 3)
+    locker = psycopg2.connect(dsn)
+    try:
+        with locker.cursor() as cursor:
+            cursor.execute("SELECT id FROM posting_jobs WHERE platform = 'twitter' ORDER BY created_at, id LIMIT 1 FOR UPDATE")
+            locked_id = cursor.fetchone()[0]
+
+            store = PostgresJobStore(dsn)
+            with store.conn.cursor() as other:
+                # Fail instead of hanging if the claim waits on the lock
+                other.execute("SET statement_timeout = 5000")
+            jobs = store.claim('twitter', 'w1', 10, 60)
+    finally:
+        locker.rollback()
+        locker.close()
+
+    assert len(jobs) == 2
+    assert locked_id not in [job['id'] for job in jobs]
+
+def test_expired_lease_is_reclaimed(db, dsn):
+    """A job whose lease expired goes to the next claimer, and the old lease holder cannot settle it."""
+    _insert_articles(db, 1)
+    store = PostgresJobStore(dsn)
+    job = store.claim('twitter', 'w1', 1, 60)[0]
+    assert store.claim('twitter', 'w2', 1, 60) == []
+
+    with db.cursor() as cursor:
+        cursor.execute("UPDATE posting_jobs SET lease_expires_at = NOW() - INTERVAL '1 second' WHERE id = %s",
+                       (job['id'],))
+    reclaimed = store.claim('twitter', 'w2', 1, 60)
+    assert [j['id'] for j in reclaimed] == [job['id']]
+    assert reclaimed[0]['attempts'] == 2
+
+    assert store.complete(job['id'], 'w1') is False
+    assert store.complete(job['id'], 'w2') is True
+    assert _jobs(db, 'twitter') == [('done', 2)]
+
+def test_failed_job_is_requeued_until_max_attempts(db, dsn):
+    """fail requeues a job and gives up once it has used its attempts."""
+    _insert_articles(db, 1)
+    store = PostgresJobStore(dsn)
+
+    job = store.claim('twitter', 'w1', 1, 60)[0]
+    assert store.fail(job['id'], 'w1', "boom", 2)
+    assert _jobs(db, 'twitter') == [('queued', 1)]
+
+    job = store.claim('twitter', 'w1', 1, 60)[0]
+    assert store.fail(job['id'], 'w1', "boom", 2)
+    assert _jobs(db, 'twitter') == [('failed', 2)]
+    assert store.claim('twitter', 'w1', 1, 60) == []
+
+class FakeBot:
+    """Stands in for a platform bot; run() returns the next queued result."""
+
+    def __init__(self, results: List[bool]):
+        self.results = list(results)
+        self.articles = []
+        self.article_source = None
+
+    def run(self) -> bool:
+        self.articles.append(self.article_source())
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+class MemoryJobStore:
+    """In-memory job store with the claim, complete and fail rules of the posting_jobs RPCs."""
+
+    def __init__(self, articles: Dict[str, Dict], platforms: List[str]):
+        self.articles = articles
+        self.jobs = [{'id': n, 'article_id': article_id, 'platform': platform, 'status': 'queued',
+                      'attempts': 0, 'leased_by': None, 'last_error': None}
+                     for n, (article_id, platform) in enumerate(
+                         ((article_id, platform) for article_id in articles for platform in platforms), 1)]
+
+    def _job(self, job_id: int) -> Dict:
+        return next(job for job in self.jobs if job['id'] == job_id)
+
+    def claim(self, platform: str, worker: str, limit: int, lease_seconds: int) -> List[Dict]:
+        claimed = [job for job in self.jobs if job['platform'] == platform and job['status'] == 'queued'][:limit]
+        for job in claimed:
+            job.update(status='leased', leased_by=worker, attempts=job['attempts'] + 1)
+        return [dict(job) for job in claimed]
+
+    def complete(self, job_id: int, worker: str) -> bool:
+        job = self._job(job_id)
+        if job['status'] != 'leased' or job['leased_by'] != worker:
+            return False
+        job.update(status='done')
+        return True
+
+    def fail(self, job_id: int, worker: str, error: str, max_attempts: int) -> bool:
+        job = self._job(job_id)
+        if job['status'] != 'leased' or job['leased_by'] != worker:
+            return False
+        job.update(status='failed' if job['attempts'] >= max_attempts else 'queued',
+                   leased_by=None, last_error=error)
+        return True
+
+    def listen(self) -> bool:
+        return False
+
+    def fetch_article(self, article_id: str, platform: str) -> Optional[Dict]:
+        article = self.articles.get(article_id)
+        return dict(article) if article else None
+
+    def states(self, platform: str) -> List[tuple]:
+        return [(job['status'], job['attempts']) for job in self.jobs if job['platform'] == platform]
+
+def _memory_store(*articles: Dict, platforms: List[str] = ('twitter',)) -> MemoryJobStore:
+    return MemoryJobStore({article['id']: article for article in articles}, list(platforms))
+
+def test_worker_closes_jobs_it_has_nothing_to_post_for():
+    """A deleted or already posted article closes its job without running the bot."""
+    store = _memory_store({'id': 'posted', 'title': 'Posted', 'tweeted_at': '2026-10-01T00:00:00Z'},
+                          {'id': 'deleted', 'title': 'Deleted'})
+    del store.articles['deleted']
+    worker = PostingWorker(store, platforms=['twitter'], worker_id='worker', batch_size=10)
+    bot = FakeBot([])
+    worker.bots['twitter'] = bot
+
+    assert worker.run_once() == 2
+    assert bot.articles == []
+    assert store.states('twitter') == [('done', 1), ('done', 1)]
+
+def test_worker_requeues_a_job_whose_bot_raises(monkeypatch):
+    """A bot error requeues the job with the error, until the job runs out of attempts."""
+    monkeypatch.setenv('POSTING_JOB_MAX_ATTEMPTS', '2')
+    store = _memory_store({'id': 'article-1', 'title': 'Article'})
+    worker = PostingWorker(store, platforms=['twitter'], worker_id='worker')
+    worker.bots['twitter'] = FakeBot([RuntimeError("API down"), RuntimeError("API down")])
+
+    assert worker.run_once() == 0
+    assert store.states('twitter') == [('queued', 1)]
+    assert store.jobs[0]['last_error'] == "API down"
+    assert worker.run_once() == 0
+    assert store.states('twitter') == [('failed', 2)]
+    assert worker.run_once() == 0
+
+def test_drain_processes_every_platform_until_no_progress():
+    """drain keeps sweeping while jobs get done and leaves a failing one for a later sweep."""
+    store = _memory_store({'id': 'article-1', 'title': 'One'}, {'id': 'article-2', 'title': 'Two'},
+                          platforms=['twitter', 'reddit'])
+    worker = PostingWorker(store, platforms=['twitter', 'reddit'], worker_id='worker')
+    worker.bots['twitter'] = FakeBot([True, True])
+    worker.bots['reddit'] = FakeBot([True, False, False])
+
+    assert worker.drain() == 3
+    assert store.states('twitter') == [('done', 1), ('done', 1)]
+    assert store.states('reddit') == [('done', 1), ('queued', 2)]
+    assert [article['id'] for article in worker.bots['reddit'].articles] == ['article-1', 'article-2', 'article-2']
+
+def test_worker_settles_jobs_from_bot_results(db, dsn):
+    """The worker hands the job's article to the bot and completes or requeues the job."""
+    article_ids = _insert_articles(db, 2)
+    worker = PostingWorker(PostgresJobStore(dsn), platforms=['linkedin'], worker_id='worker', batch_size=10)
+    bot = FakeBot([True, False])
+    worker.bots['linkedin'] = bot
+
+    assert worker.run_once() == 1
+    assert sorted(article['id'] for article in bot.articles) == sorted(article_ids)
+    assert len(bot.articles[0]['content']) == 500
+    assert sorted(_jobs(db, 'linkedin')) == [('done', 1), ('queued', 1)]
+
+def test_worker_passes_social_copy_once_migrated(db, dsn):
+    """With migration 006 applied, copy stored on the article reaches the bot."""
+    with db.cursor() as cursor:
+        cursor.execute(_read('supabase/migrations/006_add_article_social_copy.sql'))
+    article_id = _insert_articles(db, 1)[0]
+    with db.cursor() as cursor:
+        cursor.execute("UPDATE articles SET social_copy = %s WHERE id = %s", ('{"twitter": "Stored tweet"}', article_id))
+    worker = PostingWorker(PostgresJobStore(dsn), platforms=['twitter'], worker_id='worker')
+    bot = FakeBot([True])
+    worker.bots['twitter'] = bot
+
+    assert worker.run_once() == 1
+    assert bot.articles[0]['social_copy'] == {'twitter': 'Stored tweet'}
+
+def test_queued_jobs_notify_listening_workers(db, dsn):
+    """A listening worker is told which platforms got jobs as soon as an article is inserted."""
+    store = PostgresJobStore(dsn)
+    assert store.listen()
+    assert store.wait_for_jobs(0) == []
+
+    _insert_articles(db, 1)
+    assert store.wait_for_jobs(5) == ['facebook', 'linkedin', 'reddit', 'twitter']
+
+def test_drain_stops_after_a_sweep_without_progress(db, dsn):
+    """A failing job is left for a later sweep instead of being retried back to back."""
+    _insert_articles(db, 1)
+    worker = PostingWorker(PostgresJobStore(dsn), platforms=['reddit'], worker_id='worker')
+    bot = FakeBot([False, False])
+    worker.bots['reddit'] = bot
+
+    assert worker.drain() == 0
+    assert len(bot.articles) == 1
+    assert _jobs(db, 'reddit') == [('queued', 1)]
+
+def _hold_jobs_for_copy(db) -> None:
+    with db.cursor() as cursor:
+        cursor.execute(_read('supabase/migrations/006_add_article_social_copy.sql'))
+        cursor.execute(_read('supabase/migrations/008_queue_posting_jobs_after_copy.sql'))
+
+def test_jobs_wait_for_social_copy(db, dsn):
+    """With migration 008, jobs are claimable and notified once set_article_social_copy stores the copy."""
+    _hold_jobs_for_copy(db)
+    store = PostgresJobStore(dsn)
+    assert store.listen()
+    article_id = _insert_articles(db, 1)[0]
+    assert store.wait_for_jobs(0.5) == []
+    assert store.claim('twitter', 'w1', 1, 60) == []
+
+    with db.cursor() as cursor:
+        cursor.execute("SELECT set_article_social_copy(%s)",
+                       (f'[{{"id": "{article_id}", "social_copy": {{"twitter": "Stored tweet"}}}}]',))
+    assert store.wait_for_jobs(5) == ['facebook', 'linkedin', 'reddit', 'twitter']
+    assert [job['article_id'] for job in store.claim('twitter', 'w1', 1, 60)] == [article_id]
+
+def test_held_job_is_claimable_after_the_grace_period(db, dsn):
+    """An article whose copy never arrives is still posted once the grace period is over."""
+    _hold_jobs_for_copy(db)
+    _insert_articles(db, 1)
+    store = PostgresJobStore(dsn)
+    assert store.claim('reddit', 'w1', 1, 60) == []
+
+    with db.cursor() as cursor:
+        cursor.execute("UPDATE posting_jobs SET run_after = NOW() - INTERVAL '1 second'")
+    assert len(store.claim('reddit', 'w1', 1, 60)) == 1
+
+def test_article_inserted_with_copy_is_queued_at_once(db, dsn):
+    _hold_jobs_for_copy(db)
+    store = PostgresJobStore(dsn)
+    assert store.listen()
+    with db.cursor() as cursor:
+        cursor.execute("INSERT INTO articles (title, content, url, source, category, published_at, social_copy) "
+                       "VALUES ('Article', 'x', 'https://example.com/copy', 'Test', 'tech', NOW(), "
+                       "'{\"twitter\": \"Stored tweet\"}')")
+    assert store.wait_for_jobs(5) == ['facebook', 'linkedin', 'reddit', 'twitter']
+    assert len(store.claim('twitter', 'w1', 1, 60)) == 1
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Tests for the token-budgeted prompt builder
+"""
+
+import logging
+import pytest
+from prompt_builder import (CHARS_PER_TOKEN, LEGACY_MAX_TOKENS, OUTPUT_CHARS, SOURCE_BUDGETS, build_prompt_source,
+                            estimate_tokens, log_token_usage, max_tokens_for)
+
+PLATFORMS = ['twitter', 'linkedin', 'facebook', 'reddit']
+
+ARTICLE = {
+    'title': 'New chip doubles battery life',
+    'ai_summary': None,
+    'seo_description': None,
+    'summary': ' '.join(['The new low-power chip doubles the battery life of laptops.'] * 30),
+    'content': 'x' * 500
+}
+
+@pytest.mark.parametrize('platform', PLATFORMS)
+def test_completion_budget_fits_the_platform_copy(platform):
+    """max_tokens covers the platform's copy length and no more than the headroom above it."""
+    plan = build_prompt_source(ARTICLE, platform)
+    assert plan['max_tokens'] == max_tokens_for(platform)
+    assert plan['max_chars'] == OUTPUT_CHARS[platform]
+    assert OUTPUT_CHARS[platform] / CHARS_PER_TOKEN <= plan['max_tokens'] <= OUTPUT_CHARS[platform] / CHARS_PER_TOKEN * 1.2
+
+@pytest.mark.parametrize('platform', PLATFORMS + ['all'])
+def test_completion_saving_is_reported_with_its_sign(platform):
+    """The saving is the old max_tokens minus the new one, negative where the budget grew."""
+    plan = build_prompt_source(ARTICLE, platform)
+    assert plan['completion_tokens_saved'] == LEGACY_MAX_TOKENS[platform] - plan['max_tokens']
+    if platform == 'linkedin':
+        assert plan['completion_tokens_saved'] < 0
+    else:
+        assert plan['completion_tokens_saved'] > 0
+
+@pytest.mark.parametrize('platform', PLATFORMS + ['all'])
+def test_prompt_stays_within_the_source_budget(platform):
+    """A long summary is trimmed to the platform's source budget, saving prompt tokens."""
+    _, budget = SOURCE_BUDGETS[platform]
+    plan = build_prompt_source(ARTICLE, platform)
+    assert plan['prompt_tokens'] == estimate_tokens(plan['text'])
+    assert plan['prompt_tokens'] <= estimate_tokens(ARTICLE['title']) + budget + 1
+    assert plan['prompt_tokens_saved'] > 0
+
+def test_reddit_baseline_ignores_content():
+    """The old Reddit prompt sent the title alone when there was no summary."""
+    article = dict(ARTICLE, summary=None)
+    assert build_prompt_source(article, 'reddit')['prompt_tokens_saved'] < 0
+    assert build_prompt_source(article, 'twitter')['prompt_tokens_saved'] >= 0
+
+def test_log_reports_a_larger_budget_as_extra_tokens(caplog):
+    with caplog.at_level(logging.INFO, logger='prompt_builder'):
+        log_token_usage('linkedin', build_prompt_source(ARTICLE, 'linkedin'), {})
+        log_token_usage('twitter', build_prompt_source(ARTICLE, 'twitter'), {})
+    linkedin, twitter = caplog.messages
+    assert f"{max_tokens_for('linkedin') - LEGACY_MAX_TOKENS['linkedin']} max completion tokens more" in linkedin
+    assert f"{LEGACY_MAX_TOKENS['twitter'] - max_tokens_for('twitter')} max completion tokens saved" in twitter
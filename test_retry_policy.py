@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for rate-limit-aware retry waits
+Sleeps are recorded instead of taken, so the tests run instantly.
+"""
+
+import time
+import pytest
+import requests
+import retry_policy
+from retry_policy import RetryPolicy, rate_limit_wait, send_with_retry
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the waits send_with_retry takes."""
+    taken = []
+    monkeypatch.setattr(retry_policy.time, 'sleep', taken.append)
+    return taken
+
+def _response(status: int, headers: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = b'{}'
+    response._content_consumed = True
+    response.headers.update(headers or {})
+    return response
+
+def _sender(*responses):
+    """Return a send() that answers with the given responses in turn, and the list of calls."""
+    calls = []
+
+    def send():
+        calls.append(len(calls))
+        return responses[len(calls) - 1]
+    return send, calls
+
+def test_throttle_waits_as_long_as_the_provider_asks(sleeps):
+    send, calls = _sender(_response(429, {'Retry-After': '3'}), _response(200))
+    assert send_with_retry(send, RetryPolicy()).status_code == 200
+    assert len(calls) == 2
+    assert 3 <= sleeps[0] <= 4
+
+def test_long_reset_outside_a_run_gives_up_at_once(sleeps):
+    """A reset hours away is not waited for when there is no run deadline."""
+    reset = str(time.time() + 4 * 3600)
+    send, calls = _sender(_response(429, {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': reset}),
+                          _response(200))
+    assert send_with_retry(send, RetryPolicy(max_delay=60)).status_code == 429
+    assert len(calls) == 1
+    assert sleeps == []
+
+def test_header_wait_within_max_delay_is_taken_outside_a_run(sleeps):
+    send, calls = _sender(_response(429, {'Retry-After': '30'}), _response(200))
+    assert send_with_retry(send, RetryPolicy(max_delay=60)).status_code == 200
+    assert 30 <= sleeps[0] <= 31
+
+def test_run_deadline_bounds_header_waits(sleeps):
+    """Inside a run the deadline, not max_delay, decides whether a header wait is taken."""
+    send, calls = _sender(_response(429, {'Retry-After': '90'}), _response(200))
+    assert send_with_retry(send, RetryPolicy(max_delay=60), deadline=time.monotonic() + 300).status_code == 200
+    assert 90 <= sleeps[0] <= 91
+
+    send, calls = _sender(_response(429, {'Retry-After': '90'}), _response(200))
+    assert send_with_retry(send, RetryPolicy(max_delay=60), deadline=time.monotonic() + 30).status_code == 429
+    assert len(calls) == 1
+
+def test_backoff_never_exceeds_max_delay(sleeps):
+    send, calls = _sender(*[_response(503)] * 5)
+    assert send_with_retry(send, RetryPolicy(max_attempts=5, base_delay=10, max_delay=15)).status_code == 503
+    assert len(sleeps) == 4
+    assert all(0 <= wait <= 15 for wait in sleeps)
+
+def test_server_error_is_not_replayed_when_unsafe(sleeps):
+    """A POST that may have created content is not sent again after a 5xx."""
+    send, calls = _sender(_response(500), _response(200))
+    assert send_with_retry(send, RetryPolicy(retry_server_errors=False)).status_code == 500
+    assert len(calls) == 1
+
+def test_refused_connection_is_retried(sleeps):
+    attempts = []
+
+    def send():
+        attempts.append(1)
+        if len(attempts) == 1:
+            # Nothing listens on port 1, so nothing is sent
+            return requests.get('http://127.0.0.1:1/', timeout=2)
+        return _response(200)
+
+    assert send_with_retry(send, RetryPolicy(retry_server_errors=False)).status_code == 200
+    assert len(attempts) == 2
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'Retry-After': '12'}, 12),
+    ({'X-Ratelimit-Remaining': '0', 'X-Ratelimit-Reset': '40'}, 40),
+    ({'X-Ratelimit-Remaining': '5', 'X-Ratelimit-Reset': '40'}, None),
+    ({'x-ratelimit-reset-requests': '1m30s', 'x-ratelimit-reset-tokens': '20ms'}, 90),
+    ({'X-Business-Use-Case-Usage': '{"1": [{"estimated_time_to_regain_access": 2}]}'}, 120)
+])
+def test_rate_limit_headers(headers, expected):
+    assert rate_limit_wait(_response(429, headers)) == expected
@@ -6,10 +6,28 @@ Retrieves latest article from Supabase, summarizes it, and posts to Twitter.
 
 import os
 import json
-import requests
+import asyncio
+import argparse
+import http_transport
+import async_transport
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List
+from typing import Awaitable, Callable, Dict, Optional, List, Tuple
 import logging
+from article_queries import (fetch_next_unposted, fetch_next_unposted_async, mark_articles_posted,
+                            mark_articles_posted_async)
+from batch_posting import run_batch, run_batch_async
+from post_outbox import DEFERRED_ERRORS, PostDeferred, PostOutbox
+from supabase_capabilities import get_capabilities, has_rpc
+from posting_scheduler import get_scheduler
+from multi_platform_generator import finish_tweet, get_precomputed_copy
+from generation_cache import cached_generation
+from llm_router import generate_async, get_llm_router
+from prompt_builder import build_prompt_source, log_token_usage, trim_to_chars
+from template_generator import fallback_copy
+from run_prefetch import Prefetch
+from run_budget import finish_run, run_scoped
+from circuit_breaker import get_circuit_breaker
+from identity_cache import IDENTITY_TTL, credential_key, get_identity_cache
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -26,6 +44,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Most recent article that hasn't been tweeted, for databases with the exec_sql RPC
+LATEST_ARTICLE_QUERY = """
+SELECT id, title, ai_summary, seo_description, summary, left(content, 500) AS content, affiliate_url,
+       tags, social_copy
+FROM articles
+WHERE tweeted_at IS NULL
+ORDER BY published_at DESC NULLS LAST, id DESC
+LIMIT 1
+"""
+
 class SupabaseClient:
     """Client for interacting with Supabase database."""
     
@@ -42,45 +70,31 @@ class SupabaseClient:
             'Content-Type': 'application/json'
         }
     
-    def get_latest_article(self) -> Optional[Dict]:
+    def get_latest_article(self, accept: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
         """Retrieve the latest article from the database."""
         try:
-            # Query for the most recent article that hasn't been tweeted
-            query = """
-            SELECT * FROM articles 
-            WHERE tweeted_at IS NULL 
-            ORDER BY published_at DESC 
-            LIMIT 1
-            """
-            
-            response = requests.post(
-                f"{self.url}/rest/v1/rpc/exec_sql",
-                headers=self.headers,
-                json={'query': query}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data and len(data) > 0:
-                    return data[0]
-            
-            # Fallback: use direct table query
-            response = requests.get(
-                f"{self.url}/rest/v1/articles",
-                headers=self.headers,
-                params={
-                    'select': '*',
-                    'order': 'published_at.desc',
-                    'limit': '1'
-                }
-            )
+            # Only try the exec_sql RPC when the cached capability probe found it
+            capabilities = get_capabilities(self.url, self.headers)
+            if has_rpc(capabilities, 'exec_sql'):
+                # Query for the most recent article that hasn't been tweeted
+                response = http_transport.post(
+                    f"{self.url}/rest/v1/rpc/exec_sql",
+                    headers=self.headers,
+                    idempotent=True,
+                    json={'query': LATEST_ARTICLE_QUERY}
+                )
+                
+                if response.status_code == 200:
+                    data = response.json()
+                    if data and (accept is None or accept(data[0])):
+                        return data[0]
             
-            if response.status_code == 200:
-                data = response.json()
-                if data and len(data) > 0:
-                    return data[0]
+            # Filter on tweeted_at server-side and fetch only the columns we use
+            article = fetch_next_unposted(self.url, self.headers, 'twitter', accept)
+            if article:
+                return article
             
-            logger.warning("No articles found in database")
+            logger.warning("No untweeted articles found in database")
             return None
             
         except Exception as e:
@@ -90,7 +104,7 @@ class SupabaseClient:
     def mark_article_as_tweeted(self, article_id: str) -> bool:
         """Mark an article as tweeted by updating the tweeted_at field."""
         try:
-            response = requests.patch(
+            response = http_transport.patch(
                 f"{self.url}/rest/v1/articles",
                 headers=self.headers,
                 json={
@@ -99,7 +113,7 @@ class SupabaseClient:
                 params={'id': f'eq.{article_id}'}
             )
             
-            if response.status_code == 200:
+            if response.status_code in (200, 204):
                 logger.info(f"Marked article {article_id} as tweeted")
                 return True
             else:
@@ -114,31 +128,18 @@ class OpenAIClient:
     """Client for OpenAI API to generate tweet summaries."""
     
     def __init__(self):
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
-            raise ValueError("OpenAI API key must be set in environment variables")
-        
-        self.base_url = "https://api.openai.com/v1"
-        self.headers = {
-            'Authorization': f'Bearer {self.api_key}',
-            'Content-Type': 'application/json'
-        }
+        # Sends each completion to the fastest healthy configured provider
+        self.router = get_llm_router()
+        self.model = 'gpt-3.5-turbo'
+        self.temperature = 0.7
     
+    @cached_generation('twitter', prompt_version=3)
     def generate_tweet(self, article: Dict) -> Optional[str]:
         """Generate a tweet summary from article content."""
         try:
-            # Prepare the content for summarization
-            title = article.get('title', '')
-            summary = article.get('summary', '')
-            content = article.get('content', '')
-            
-            # Use the most available content
-            text_to_summarize = title
-            if summary:
-                text_to_summarize += f"\n\n{summary}"
-            elif content:
-                # Truncate content if too long
-                text_to_summarize += f"\n\n{content[:500]}..."
+            # Budget the article text by tokens for this platform
+            plan = build_prompt_source(article, 'twitter')
+            text_to_summarize = plan['text']
             
             prompt = f"""
             Create an engaging tweet about this article. The tweet should:
@@ -152,42 +153,31 @@ class OpenAIClient:
             Format: Tweet text with hashtags at the end
             """
             
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json={
-                    'model': 'gpt-3.5-turbo',
-                    'messages': [
-                        {
-                            'role': 'system',
-                            'content': 'You are a social media expert who creates engaging tweets about tech and business articles.'
-                        },
-                        {
-                            'role': 'user',
-                            'content': prompt
-                        }
-                    ],
-                    'max_tokens': 150,
-                    'temperature': 0.7
-                }
-            )
+            result = self.router.stream_text({
+                'model': self.model,
+                'messages': [
+                    {
+                        'role': 'system',
+                        'content': 'You are a social media expert who creates engaging tweets about tech and business articles.'
+                    },
+                    {
+                        'role': 'user',
+                        'content': prompt
+                    }
+                ],
+                'max_tokens': plan['max_tokens'],
+                'temperature': self.temperature
+            }, plan['max_chars'])
             
-            if response.status_code == 200:
-                result = response.json()
-                tweet_text = result['choices'][0]['message']['content'].strip()
-                
-                # Add affiliate link if available
-                affiliate_url = article.get('affiliate_url')
-                if affiliate_url and len(tweet_text) < 200:  # Leave room for URL
-                    tweet_text += f"\n\n{affiliate_url}"
+            if result:
+                log_token_usage('twitter', plan, result)
+                # Reading stopped at the length budget; end on a clean boundary
+                tweet_text = trim_to_chars(result['text'].strip(), plan['max_chars'])
                 
-                # Ensure tweet is under 280 characters
-                if len(tweet_text) > 280:
-                    tweet_text = tweet_text[:277] + "..."
-                
-                return tweet_text
+                # Add affiliate link and enforce the 280 character limit
+                return finish_tweet(tweet_text, article)
             else:
-                logger.error(f"OpenAI API error: {response.status_code} - {response.text}")
+                logger.error("Failed to get a completion from any LLM provider")
                 return None
                 
         except Exception as e:
@@ -208,20 +198,32 @@ class TwitterClient:
                    self.access_token, self.access_token_secret]):
             raise ValueError("All Twitter API credentials must be set in environment variables")
         
+        # Access tokens are prefixed with the numeric user id
+        self.account = self.access_token.split('-')[0]
+        self.scheduler = get_scheduler()
+        self.identity = get_identity_cache()
         self.base_url = "https://api.twitter.com/2"
         self.headers = {
             'Authorization': f'Bearer {self.bearer_token}',
             'Content-Type': 'application/json'
         }
     
+    def is_down(self) -> bool:
+        """Return True while the circuit of the posting endpoint is open."""
+        return get_circuit_breaker().is_open(f"{self.base_url}/tweets")
+    
     def post_tweet(self, text: str) -> Optional[str]:
         """Post a tweet using Twitter API v2."""
         try:
-            response = requests.post(
+            if not self.scheduler.acquire('twitter', self.account):
+                raise PostDeferred("Twitter posting quota exhausted for this run")
+            
+            response = http_transport.post(
                 f"{self.base_url}/tweets",
                 headers=self.headers,
                 json={'text': text}
             )
+            self.scheduler.observe('twitter', self.account, response)
             
             if response.status_code == 201:
                 result = response.json()
@@ -232,20 +234,29 @@ class TwitterClient:
                 logger.error(f"Twitter API error: {response.status_code} - {response.text}")
                 return None
                 
+        except DEFERRED_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Error posting tweet: {e}")
+            # The platform may have accepted the post; let the outbox decide
+            if http_transport.is_ambiguous_failure(e):
+                raise
             return None
     
     def get_user_info(self) -> Optional[Dict]:
-        """Get current user information."""
+        """Get current user information, cached across runs."""
+        return self.identity.get_or_fetch(f"twitter:user:{credential_key(self.bearer_token)}", self.fetch_user_info)
+    
+    def fetch_user_info(self) -> Optional[Tuple[Dict, float]]:
+        """Request the authenticated user from the API."""
         try:
-            response = requests.get(
+            response = http_transport.get(
                 f"{self.base_url}/users/me",
                 headers=self.headers
             )
             
             if response.status_code == 200:
-                return response.json()
+                return response.json(), IDENTITY_TTL
             else:
                 logger.error(f"Error getting user info: {response.status_code}")
                 return None
@@ -257,40 +268,101 @@ class TwitterClient:
 class TwitterBot:
     """Main bot class that orchestrates the entire process."""
     
-    def __init__(self):
+    def __init__(self, article_source: Optional[Callable[[], Optional[Dict]]] = None):
         self.supabase = SupabaseClient()
+        # Callers such as master_social_bot can inject an already-fetched article
+        self.article_source = article_source or self.next_article
         self.openai = OpenAIClient()
         self.twitter = TwitterClient()
+        self.outbox = PostOutbox()
+    
+    def post_payload(self, payload: Dict) -> Optional[str]:
+        """Post a payload stored in the outbox."""
+        return self.twitter.post_tweet(payload['text'])
+    
+    def settle_outbox(self) -> None:
+        """Retry due dead letters and acknowledge tweets left unmarked by earlier runs."""
+        self.outbox.retry_due('twitter', self.post_payload)
+        self.outbox.replay_acks(
+            'twitter',
+            lambda article_ids: mark_articles_posted(self.supabase.url, self.supabase.headers, 'twitter', article_ids)
+        )
+    
+    def has_pending_post(self, article: Dict) -> bool:
+        """Return True if the outbox allows tweeting the article."""
+        return self.outbox.can_post(article['id'], 'twitter', self.twitter.account)
     
+    def next_article(self) -> Optional[Dict]:
+        """Return the newest unposted article the outbox allows tweeting now."""
+        return self.supabase.get_latest_article(accept=self.has_pending_post)
+    
+    def generate_copy(self, article: Dict) -> Optional[str]:
+        """Return the tweet text, preferring copy the master bot generated.
+        
+        Falls back to template copy when the LLM is slow, over budget or failing.
+        """
+        return (get_precomputed_copy(article, 'twitter') or self.openai.generate_tweet(article)
+                or fallback_copy(article, 'twitter'))
+    
+    def publish_copy(self, article: Dict, tweet_text: str) -> bool:
+        """Post the tweet at most once per article."""
+        return bool(self.outbox.publish(article['id'], 'twitter', self.twitter.account,
+                                        {'text': tweet_text}, self.post_payload))
+    
+    def prefetch(self) -> Prefetch:
+        """Start the steps that do not need the article: connection warm-up."""
+        return Prefetch({
+            'platform': lambda: http_transport.preconnect(self.twitter.base_url),
+            'llm': lambda: self.openai.router.preconnect(self.openai.model)
+        })
+    
+    @run_scoped
+    def run_batch(self, count: int) -> bool:
+        """Tweet up to count pending articles in one run."""
+        return run_batch(self, 'twitter', count)
+    
+    @run_scoped
     def run(self) -> bool:
         """Main execution method."""
         try:
             logger.info("Starting Twitter bot execution...")
+            if self.twitter.is_down():
+                logger.warning("⛔ Twitter circuit is open; skipping this run")
+                return False
+            # Connection warm-up overlaps the article query and generation
+            prefetch = self.prefetch()
+            self.settle_outbox()
             
             # Get latest article
-            article = self.supabase.get_latest_article()
+            article = self.article_source()
             if not article:
                 logger.info("No new articles to tweet")
                 return False
             
             logger.info(f"Found article: {article.get('title', 'Unknown')}")
             
+            if not self.has_pending_post(article):
+                logger.info("Article already tweeted or awaiting retry according to the outbox")
+                return False
+            
             # Generate tweet
-            tweet_text = self.openai.generate_tweet(article)
+            tweet_text = self.generate_copy(article)
             if not tweet_text:
                 logger.error("Failed to generate tweet")
                 return False
             
             logger.info(f"Generated tweet: {tweet_text}")
             
-            # Post tweet
-            tweet_id = self.twitter.post_tweet(tweet_text)
-            if not tweet_id:
+            prefetch.wait()
+            # Post tweet at most once per article
+            if not self.publish_copy(article, tweet_text):
                 logger.error("Failed to post tweet")
                 return False
             
-            # Mark article as tweeted
+            # Mark article as tweeted, using the reserve held back for it
+            finish_run()
             if self.supabase.mark_article_as_tweeted(article['id']):
+                self.outbox.record_acked([article['id']], 'twitter')
                 logger.info("Successfully completed tweet cycle")
                 return True
             else:
@@ -301,17 +373,226 @@ class TwitterBot:
             logger.error(f"Error in bot execution: {e}")
             return False
 
-def main():
+class AsyncSupabaseClient(SupabaseClient):
+    """SupabaseClient with coroutine methods for the asyncio bots."""
+    
+    async def get_latest_article(self, accept: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        """Retrieve the latest article from the database."""
+        try:
+            capabilities = await asyncio.to_thread(get_capabilities, self.url, self.headers)
+            if has_rpc(capabilities, 'exec_sql'):
+                response = await async_transport.post(
+                    f"{self.url}/rest/v1/rpc/exec_sql",
+                    headers=self.headers,
+                    idempotent=True,
+                    json={'query': LATEST_ARTICLE_QUERY}
+                )
+                
+                if response.status_code == 200:
+                    data = response.json()
+                    if data and (accept is None or accept(data[0])):
+                        return data[0]
+                        
+            article = await fetch_next_unposted_async(self.url, self.headers, 'twitter', accept)
+            if article:
+                return article
+                
+            logger.warning("No untweeted articles found in database")
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error retrieving latest article: {e}")
+            return None
+    
+    async def mark_article_as_tweeted(self, article_id: str) -> bool:
+        """Mark an article as tweeted by updating the tweeted_at field."""
+        try:
+            return await mark_articles_posted_async(self.url, self.headers, 'twitter', [article_id])
+        except Exception as e:
+            logger.error(f"Error marking article as tweeted: {e}")
+            return False
+
+class AsyncOpenAIClient(OpenAIClient):
+    """OpenAIClient whose generation runs off the event loop."""
+    
+    async def generate_tweet(self, article: Dict) -> Optional[str]:
+        """Generate a tweet summary from article content."""
+        return await generate_async(super().generate_tweet, article)
+
+class AsyncTwitterClient(TwitterClient):
+    """TwitterClient with coroutine methods for the asyncio bots."""
+    
+    async def post_tweet(self, text: str) -> Optional[str]:
+        """Post a tweet using Twitter API v2."""
+        try:
+            if not await self.scheduler.acquire_async('twitter', self.account):
+                raise PostDeferred("Twitter posting quota exhausted for this run")
+                
+            response = await async_transport.post(
+                f"{self.base_url}/tweets",
+                headers=self.headers,
+                json={'text': text}
+            )
+            self.scheduler.observe('twitter', self.account, response)
+            
+            if response.status_code == 201:
+                tweet_id = response.json()['data']['id']
+                logger.info(f"Successfully posted tweet: {tweet_id}")
+                return tweet_id
+            else:
+                logger.error(f"Twitter API error: {response.status_code} - {response.text}")
+                return None
+                
+        except DEFERRED_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Error posting tweet: {e}")
+            if http_transport.is_ambiguous_failure(e):
+                raise
+            return None
+    
+    async def get_user_info(self) -> Optional[Dict]:
+        """Get current user information, cached across runs."""
+        return await self.identity.get_or_fetch_async(f"twitter:user:{credential_key(self.bearer_token)}",
+                                                      self.fetch_user_info)
+    
+    async def fetch_user_info(self) -> Optional[Tuple[Dict, float]]:
+        """Request the authenticated user from the API."""
+        try:
+            response = await async_transport.get(f"{self.base_url}/users/me", headers=self.headers)
+            
+            if response.status_code == 200:
+                return response.json(), IDENTITY_TTL
+            else:
+                logger.error(f"Error getting user info: {response.status_code}")
+                return None
+                
+        except Exception as e:
+            logger.error(f"Error getting user info: {e}")
+            return None
+
+class AsyncTwitterBot(TwitterBot):
+    """TwitterBot driven by an event loop; run() and run_batch() are coroutines."""
+    
+    def __init__(self, article_source: Optional[Callable[[], Awaitable[Optional[Dict]]]] = None):
+        self.supabase = AsyncSupabaseClient()
+        self.article_source = article_source or self.next_article
+        self.openai = AsyncOpenAIClient()
+        self.twitter = AsyncTwitterClient()
+        self.outbox = PostOutbox()
+    
+    async def post_payload(self, payload: Dict) -> Optional[str]:
+        """Post a payload stored in the outbox."""
+        return await self.twitter.post_tweet(payload['text'])
+    
+    async def settle_outbox(self) -> None:
+        """Retry due dead letters and acknowledge tweets left unmarked by earlier runs."""
+        await self.outbox.retry_due_async('twitter', self.post_payload)
+        await self.outbox.replay_acks_async(
+            'twitter',
+            lambda article_ids: mark_articles_posted_async(self.supabase.url, self.supabase.headers, 'twitter',
+                                                           article_ids)
+        )
+    
+    async def next_article(self) -> Optional[Dict]:
+        """Return the newest unposted article the outbox allows tweeting now."""
+        return await self.supabase.get_latest_article(accept=self.has_pending_post)
+    
+    async def generate_copy(self, article: Dict) -> Optional[str]:
+        """Return the tweet text, preferring precomputed copy and falling back to a template."""
+        return (get_precomputed_copy(article, 'twitter') or await self.openai.generate_tweet(article)
+                or fallback_copy(article, 'twitter'))
+    
+    async def publish_copy(self, article: Dict, tweet_text: str) -> bool:
+        """Post the tweet at most once per article."""
+        return bool(await self.outbox.publish_async(article['id'], 'twitter', self.twitter.account,
+                                                    {'text': tweet_text}, self.post_payload))
+    
+    def prefetch(self) -> asyncio.Future:
+        """Start the LLM connection warm-up while the article is fetched."""
+        return asyncio.gather(
+            asyncio.to_thread(self.openai.router.preconnect, self.openai.model),
+            return_exceptions=True
+        )
+    
+    @run_scoped
+    async def run_batch(self, count: int) -> bool:
+        """Tweet up to count pending articles in one run."""
+        return await run_batch_async(self, 'twitter', count)
+    
+    @run_scoped
+    async def run(self) -> bool:
+        """Main execution method."""
+        try:
+            logger.info("Starting async Twitter bot execution...")
+            if self.twitter.is_down():
+                logger.warning("⛔ Twitter circuit is open; skipping this run")
+                return False
+            prefetch = self.prefetch()
+            await self.settle_outbox()
+            
+            article = await self.article_source()
+            if not article:
+                logger.info("No new articles to tweet")
+                return False
+                
+            logger.info(f"Found article: {article.get('title', 'Unknown')}")
+            
+            if not self.has_pending_post(article):
+                logger.info("Article already tweeted or awaiting retry according to the outbox")
+                return False
+                
+            tweet_text = await self.generate_copy(article)
+            if not tweet_text:
+                logger.error("Failed to generate tweet")
+                return False
+                
+            logger.info(f"Generated tweet: {tweet_text}")
+            
+            await prefetch
+            if not await self.publish_copy(article, tweet_text):
+                logger.error("Failed to post tweet")
+                return False
+                
+            finish_run()
+            if await self.supabase.mark_article_as_tweeted(article['id']):
+                self.outbox.record_acked([article['id']], 'twitter')
+                logger.info("Successfully completed tweet cycle")
+            else:
+                logger.warning("Tweet posted but failed to mark article as tweeted")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error in bot execution: {e}")
+            return False
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Tweet the latest unposted article.")
+    parser.add_argument('--batch', type=int, default=None, metavar='N',
+                        help="Tweet up to N pending articles in this run")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Run on an asyncio event loop (requires aiohttp)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main entry point."""
+    args = parse_args(argv)
     try:
-        bot = TwitterBot()
-        success = bot.run()
+        if args.use_async:
+            bot = AsyncTwitterBot()
+            success = async_transport.run(bot.run_batch(args.batch) if args.batch else bot.run())
+        else:
+            bot = TwitterBot()
+            success = bot.run_batch(args.batch) if args.batch else bot.run()
         
         if success:
             logger.info("Twitter bot completed successfully")
         else:
             logger.warning("Twitter bot completed with issues")
             
+        http_transport.log_connection_stats()
+            
     except Exception as e:
         logger.error(f"Fatal error in main: {e}")
         return 1